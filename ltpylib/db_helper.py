@@ -1,17 +1,47 @@
 #!/usr/bin/env python
+import contextlib
+import dataclasses
+import functools
 import re
 import sqlite3
+import threading
+import weakref
 from pathlib import Path
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, IO, Iterable, Iterator, List, Optional, Tuple, Union
 
 import sqlalchemy
 import sqlalchemy.engine.url
 
-from ltpylib import configs, files, patterns, procs
+from ltpylib import configs, files, strings
 from ltpylib.common_types import DataWithUnknownPropertiesAsAttributes
 
+DEFAULT_PG_COPY_BATCH_SIZE = 50_000
+DEFAULT_PG_FETCH_SIZE = 10_000
+DEFAULT_PG_QUERY_CACHE_FILE = Path.home().joinpath(".cache", "ltpylib", "pg_query_cache.db")
+DEFAULT_PG_QUERY_CACHE_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_PG_QUERY_CACHE_TTL_SECONDS = 3600
 DEFAULT_PG_SERVICE_CONFIG_SECTION = "dwh"
 PG_ENGINES: Dict[str, sqlalchemy.engine.Engine] = {}
+PG_ENGINES_LOCK = threading.Lock()
+PG_COPY_TEXT_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+PG_QUERY_CACHES: Dict[str, "PgQueryCache"] = {}
+PG_QUERY_CACHES_LOCK = threading.Lock()
+PG_QUERY_CACHE_SQL_NORMALIZE_REGEX = re.compile(r"('(?:[^']|'')*')|\s+")
+PG_QUERY_CACHE_TYPE_KEY = "__pg_query_cache_type__"
+PG_TYPES_BY_SQLITE_TYPE: Dict[str, str] = {
+  "INTEGER": "BIGINT",
+  "REAL": "DOUBLE PRECISION",
+  "TEXT": "TEXT",
+}
+PG_SERVICE_CONFIG_KEY_SKIP_FIELDS = frozenset(["dbname", "host", "password", "port", "user"])
+
+SQLITE_POOL_DEFAULT_CACHE_SIZE = -64_000
+SQLITE_POOL_DEFAULT_JOURNAL_MODE = "WAL"
+SQLITE_POOL_DEFAULT_MMAP_SIZE = 256 * 1024 * 1024
+SQLITE_POOLS: Dict[Tuple[str, tuple], "SQLiteConnectionPool"] = {}
+SQLITE_POOLS_LOCK = threading.Lock()
+
+_SQLITE_ROW_FACTORY_COLUMNS: "weakref.WeakKeyDictionary[sqlite3.Cursor, Tuple[Any, Tuple[str, ...]]]" = weakref.WeakKeyDictionary()
 
 SQL_CMD_REGEX_MAIN = r"((SELECT|WITH|EXPLAIN)[^;]*?^;)"
 SQL_CMD_REGEX_PRIMARY = r"(?s)^-- ?use\n" + SQL_CMD_REGEX_MAIN
@@ -21,6 +51,8 @@ SQL_CMD_REGEX_QUERY_ID = r"(?s)^-- ?" + SQL_CMD_REGEX_QUERY_ID_REPL_STR + r"\n([
 SQL_CMD_REGEX_QUERY_ID_ALL = r"(?s)^-- ?([a-zA-Z0-9_-]+)\n([^;]+^;)"
 SQL_CMD_REGEX_FLAGS = re.MULTILINE
 SQL_CMD_REGEX_GROUP = 1
+SQL_FILE_INDEXES: Dict[str, "SqlFileIndex"] = {}
+SQL_FILE_INDEXES_LOCK = threading.Lock()
 
 
 class PgServiceConfig(DataWithUnknownPropertiesAsAttributes):
@@ -36,28 +68,434 @@ class PgServiceConfig(DataWithUnknownPropertiesAsAttributes):
 
     DataWithUnknownPropertiesAsAttributes.__init__(self, values)
 
+  def connection_key(self) -> str:
+    import hashlib
+
+    key_parts = [f"{self.user}@{self.host}:{self.port}/{self.dbname}"]
+    for field, value in sorted(self.__dict__.items()):
+      if field in PG_SERVICE_CONFIG_KEY_SKIP_FIELDS or field.startswith("_"):
+        continue
+
+      key_parts.append(f"{field}={value}")
+
+    if self.password:
+      key_parts.append("password_sha256=" + hashlib.sha256(self.password.encode("utf-8")).hexdigest())
+
+    return ";".join(key_parts)
+
+
+@dataclasses.dataclass(frozen=True)
+class PgEngineOptions:
+  pool_size: int = 5
+  max_overflow: int = 10
+  pool_pre_ping: bool = True
+  pool_recycle: int = 1800
+
+  def to_engine_kwargs(self) -> Dict[str, Any]:
+    return dataclasses.asdict(self)
+
+
+DEFAULT_PG_ENGINE_OPTIONS = PgEngineOptions()
+
+
+class SqlFileIndex(object):
+
+  def __init__(self, sql_file: Path):
+    self.sql_file: Path = sql_file
+    self.contents: str = ""
+    self.query_ids: List[str] = []
+    self.queries: Dict[str, str] = {}
+    self._default_query: Optional[str] = None
+    self._file_stat: Optional[Tuple[int, int]] = None
+    self._lock = threading.RLock()
+
+  @staticmethod
+  def get(sql_file: Path) -> "SqlFileIndex":
+    index_key = sql_file.resolve().as_posix()
+    index = SQL_FILE_INDEXES.get(index_key)
+    if index is None:
+      with SQL_FILE_INDEXES_LOCK:
+        index = SQL_FILE_INDEXES.setdefault(index_key, SqlFileIndex(sql_file))
+
+    index.refresh()
+    return index
+
+  def refresh(self) -> bool:
+    stat = self.sql_file.stat()
+    file_stat = (stat.st_mtime_ns, stat.st_size)
+    if file_stat == self._file_stat:
+      return False
+
+    with self._lock:
+      if file_stat == self._file_stat:
+        return False
+
+      contents = files.read_file(self.sql_file)
+      query_ids: List[str] = []
+      queries: Dict[str, str] = {}
+      for match in _compile_sql_cmd_regex(SQL_CMD_REGEX_QUERY_ID_ALL).finditer(contents):
+        query_id = match.group(1)
+        query_ids.append(query_id)
+        queries.setdefault(query_id, match.group(2))
+
+      self.contents = contents
+      self.query_ids = query_ids
+      self.queries = queries
+      self._default_query = None
+      self._file_stat = file_stat
+
+    return True
+
+  def get_query(self, query_id: str) -> str:
+    query = self.queries.get(query_id)
+    if query is None:
+      # query id comments nested inside another query's body are not picked up by the single pass above
+      match = _compile_sql_cmd_regex(SQL_CMD_REGEX_QUERY_ID.replace(SQL_CMD_REGEX_QUERY_ID_REPL_STR, query_id)).search(self.contents)
+      if not match:
+        raise Exception("Could not find a sql query match in file: " + self.sql_file.as_posix())
+
+      query = match.group(SQL_CMD_REGEX_GROUP)
+      self.queries[query_id] = query
+
+    return query
+
+  def get_default_query(self) -> str:
+    if self._default_query is None:
+      for regex in [SQL_CMD_REGEX_PRIMARY, SQL_CMD_REGEX_SECONDARY]:
+        match = _compile_sql_cmd_regex(regex).search(self.contents)
+        if match:
+          self._default_query = match.group(SQL_CMD_REGEX_GROUP)
+          break
+      else:
+        raise Exception("Could not find a sql query match in file: " + self.sql_file.as_posix())
+
+    return self._default_query
+
+  def get_sql(self, query_ids: Union[List[str], str] = None, inject_env: bool = True, env: Dict[str, str] = None) -> str:
+    if isinstance(query_ids, str):
+      query_ids = [query_ids]
+
+    if query_ids:
+      query = "\n".join([self.get_query(qid) for qid in query_ids])
+    else:
+      query = self.get_default_query()
+
+    if inject_env:
+      query = strings.expand_env_vars(query, env=env)
+
+    return query
+
+
+@dataclasses.dataclass
+class PgQueryResult:
+  query_id: str
+  sql: str
+  rows: Optional[List[Dict[str, Any]]] = None
+  elapsed: float = 0.0
+  error: Optional[Exception] = None
+
+  @property
+  def succeeded(self) -> bool:
+    return self.error is None
+
+
+class PgQueryCache(object):
+
+  def __init__(
+    self,
+    db_file: Union[Path, str] = DEFAULT_PG_QUERY_CACHE_FILE,
+    ttl_seconds: float = DEFAULT_PG_QUERY_CACHE_TTL_SECONDS,
+    max_bytes: int = DEFAULT_PG_QUERY_CACHE_MAX_BYTES,
+  ):
+    self.db_file = db_file
+    self.ttl_seconds = ttl_seconds
+    self.max_bytes = max_bytes
+    self._initialized = False
+    self._lock = threading.Lock()
+
+  @staticmethod
+  def normalize_sql(sql: str) -> str:
+
+    def replace_whitespace(match: re.Match) -> str:
+      return match.group(1) or " "
+
+    return PG_QUERY_CACHE_SQL_NORMALIZE_REGEX.sub(replace_whitespace, sql).strip().rstrip(";").strip()
+
+  @staticmethod
+  def create_key(sql: str, multi_params: tuple, params: dict, config: PgServiceConfig) -> str:
+    import hashlib
+    import json
+
+    from ltpylib.output import json_dump_default
+
+    key_data = json.dumps([PgQueryCache.normalize_sql(sql), multi_params, params, config.connection_key()], default=json_dump_default, sort_keys=True)
+    return hashlib.sha256(key_data.encode("utf-8")).hexdigest()
+
+  def get_connection(self) -> sqlite3.Connection:
+    if not self._initialized:
+      with self._lock:
+        if not self._initialized:
+          if isinstance(self.db_file, Path):
+            self.db_file.parent.mkdir(parents=True, exist_ok=True)
+
+          with get_pooled_sqlite_connection(self.db_file) as db_conn:
+            db_conn.execute(
+              "CREATE TABLE IF NOT EXISTS pg_query_cache (cache_key TEXT PRIMARY KEY, created_at REAL NOT NULL, accessed_at REAL NOT NULL, size INTEGER NOT NULL, rows BLOB NOT NULL)"
+            )
+            db_conn.execute("CREATE INDEX IF NOT EXISTS pg_query_cache_accessed_at ON pg_query_cache (accessed_at)")
+
+          self._initialized = True
+
+    return get_pooled_sqlite_connection(self.db_file)
+
+  @staticmethod
+  def dumps_rows(rows: List[Dict[str, Any]]) -> bytes:
+    import json
+
+    return json.dumps(rows, default=_pg_query_cache_json_default, separators=(",", ":")).encode("utf-8")
+
+  @staticmethod
+  def loads_rows(data: bytes) -> List[Dict[str, Any]]:
+    import json
+
+    return json.loads(data.decode("utf-8"), object_hook=_pg_query_cache_object_hook)
+
+  def get(self, cache_key: str) -> Optional[List[Dict[str, Any]]]:
+    import time
+
+    now = time.time()
+    db_conn = self.get_connection()
+    cached = db_conn.execute("SELECT rows FROM pg_query_cache WHERE cache_key = ? AND created_at >= ?", (cache_key, now - self.ttl_seconds)).fetchone()
+    if cached is None:
+      return None
+
+    with db_conn:
+      db_conn.execute("UPDATE pg_query_cache SET accessed_at = ? WHERE cache_key = ?", (now, cache_key))
+
+    try:
+      return PgQueryCache.loads_rows(cached["rows"])
+    except ValueError:
+      # unreadable entries, e.g. written by an older version, are treated as a miss and replaced on the next put
+      return None
+
+  def put(self, cache_key: str, rows: List[Dict[str, Any]]):
+    import time
+
+    now = time.time()
+    data = PgQueryCache.dumps_rows(rows)
+    if len(data) > self.max_bytes:
+      return
+
+    with self.get_connection() as db_conn:
+      db_conn.execute("INSERT OR REPLACE INTO pg_query_cache VALUES (?, ?, ?, ?, ?)", (cache_key, now, now, len(data), data))
+
+    self.evict()
+
+  def evict(self) -> int:
+    import time
+
+    db_conn = self.get_connection()
+    with db_conn:
+      evicted = db_conn.execute("DELETE FROM pg_query_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,)).rowcount
+
+      total_size = db_conn.execute("SELECT COALESCE(SUM(size), 0) AS total_size FROM pg_query_cache").fetchone()["total_size"]
+      if total_size > self.max_bytes:
+        evict_keys = []
+        for row in db_conn.execute("SELECT cache_key, size FROM pg_query_cache ORDER BY accessed_at"):
+          if total_size <= self.max_bytes:
+            break
+
+          evict_keys.append((row["cache_key"],))
+          total_size -= row["size"]
+
+        db_conn.executemany("DELETE FROM pg_query_cache WHERE cache_key = ?", evict_keys)
+        evicted += len(evict_keys)
+
+    return evicted
+
+  def clear(self):
+    with self.get_connection() as db_conn:
+      db_conn.execute("DELETE FROM pg_query_cache")
+
+
+def _pg_query_cache_json_default(val: Any) -> Any:
+  # tag the types psycopg2 returns that json cannot represent, so they are restored on load instead of coming back as strings
+  import base64
+  import datetime
+  import decimal
+  import uuid
+
+  from ltpylib.output import json_dump_default
+
+  if isinstance(val, decimal.Decimal):
+    return {PG_QUERY_CACHE_TYPE_KEY: "decimal", "value": str(val)}
+  elif isinstance(val, datetime.datetime):
+    return {PG_QUERY_CACHE_TYPE_KEY: "datetime", "value": val.isoformat()}
+  elif isinstance(val, datetime.date):
+    return {PG_QUERY_CACHE_TYPE_KEY: "date", "value": val.isoformat()}
+  elif isinstance(val, datetime.time):
+    return {PG_QUERY_CACHE_TYPE_KEY: "time", "value": val.isoformat()}
+  elif isinstance(val, datetime.timedelta):
+    return {PG_QUERY_CACHE_TYPE_KEY: "timedelta", "value": val.total_seconds()}
+  elif isinstance(val, uuid.UUID):
+    return {PG_QUERY_CACHE_TYPE_KEY: "uuid", "value": str(val)}
+  elif isinstance(val, (bytes, bytearray, memoryview)):
+    return {PG_QUERY_CACHE_TYPE_KEY: "bytes", "value": base64.b64encode(bytes(val)).decode("ascii")}
+
+  return json_dump_default(val)
+
+
+def _pg_query_cache_object_hook(obj: Dict[str, Any]) -> Any:
+  val_type = obj.get(PG_QUERY_CACHE_TYPE_KEY)
+  if val_type is None:
+    return obj
+
+  import base64
+  import datetime
+  import decimal
+  import uuid
+
+  val = obj["value"]
+  if val_type == "decimal":
+    return decimal.Decimal(val)
+  elif val_type == "datetime":
+    return datetime.datetime.fromisoformat(val)
+  elif val_type == "date":
+    return datetime.date.fromisoformat(val)
+  elif val_type == "time":
+    return datetime.time.fromisoformat(val)
+  elif val_type == "timedelta":
+    return datetime.timedelta(seconds=val)
+  elif val_type == "uuid":
+    return uuid.UUID(val)
+  elif val_type == "bytes":
+    return base64.b64decode(val)
+
+  raise ValueError("Unknown cached value type: %s" % val_type)
+
+
+class SQLiteConnectionPool(object):
+
+  def __init__(
+    self,
+    db_file: Union[Path, str],
+    detect_types: int = sqlite3.PARSE_DECLTYPES,
+    use_row_factory_as_dict: bool = True,
+    use_sqlite_row: bool = False,
+    journal_mode: str = SQLITE_POOL_DEFAULT_JOURNAL_MODE,
+    mmap_size: int = SQLITE_POOL_DEFAULT_MMAP_SIZE,
+    cache_size: int = SQLITE_POOL_DEFAULT_CACHE_SIZE,
+  ):
+    self.db_file = db_file
+    self.detect_types = detect_types
+    self.use_row_factory_as_dict = use_row_factory_as_dict
+    self.use_sqlite_row = use_sqlite_row
+    self.journal_mode = journal_mode
+    self.mmap_size = mmap_size
+    self.cache_size = cache_size
+    self._local = threading.local()
+    self._lock = threading.Lock()
+    self._connections: List[Tuple[weakref.ref, sqlite3.Connection]] = []
+
+  def options_key(self) -> tuple:
+    return (self.detect_types, self.use_row_factory_as_dict, self.use_sqlite_row, self.journal_mode, self.mmap_size, self.cache_size)
+
+  def get_connection(self) -> sqlite3.Connection:
+    db_conn: Optional[sqlite3.Connection] = getattr(self._local, "db_conn", None)
+    if db_conn is None:
+      db_conn = create_sqlite_connection(
+        self.db_file,
+        detect_types=self.detect_types,
+        use_row_factory_as_dict=self.use_row_factory_as_dict,
+        use_sqlite_row=self.use_sqlite_row,
+        journal_mode=self.journal_mode,
+        mmap_size=self.mmap_size,
+        cache_size=self.cache_size,
+        check_same_thread=False,
+      )
+      self._local.db_conn = db_conn
+      with self._lock:
+        self._close_dead_thread_connections()
+        self._connections.append((weakref.ref(threading.current_thread()), db_conn))
+
+    return db_conn
+
+  def _close_dead_thread_connections(self):
+    alive_connections = []
+    for thread_ref, db_conn in self._connections:
+      thread = thread_ref()
+      if thread is not None and thread.is_alive():
+        alive_connections.append((thread_ref, db_conn))
+      else:
+        db_conn.close()
+
+    self._connections = alive_connections
+
+  def close_all(self):
+    with self._lock:
+      connections = self._connections
+      self._connections = []
+      self._local = threading.local()
+
+    for _, db_conn in connections:
+      db_conn.close()
+
 
 def create_sqlite_connection(
   db_file: Union[Path, str],
   detect_types: int = sqlite3.PARSE_DECLTYPES,
   use_row_factory_as_dict: bool = True,
+  use_sqlite_row: bool = False,
+  journal_mode: str = None,
+  mmap_size: int = None,
+  cache_size: int = None,
+  check_same_thread: bool = True,
 ) -> sqlite3.Connection:
   db_conn = sqlite3.connect(
     db_file,
     detect_types=detect_types,
+    check_same_thread=check_same_thread,
   )
 
-  if use_row_factory_as_dict:
+  if use_sqlite_row:
+    db_conn.row_factory = sqlite3.Row
+  elif use_row_factory_as_dict:
     db_conn.row_factory = sqlite_row_factory_as_dict
 
+  if journal_mode:
+    db_conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+  if mmap_size is not None:
+    db_conn.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+  if cache_size is not None:
+    db_conn.execute(f"PRAGMA cache_size = {int(cache_size)}")
+
   return db_conn
 
 
+def get_or_create_sqlite_pool(db_file: Union[Path, str], **kwargs) -> SQLiteConnectionPool:
+  # creating the pool does not open a connection, so it is cheap to build one just to get the normalized options
+  pool = SQLiteConnectionPool(db_file, **kwargs)
+  pool_key = (Path(db_file).resolve().as_posix() if db_file != ":memory:" else db_file, pool.options_key())
+  with SQLITE_POOLS_LOCK:
+    if pool_key not in SQLITE_POOLS:
+      SQLITE_POOLS[pool_key] = pool
+
+    return SQLITE_POOLS[pool_key]
+
+
+def get_pooled_sqlite_connection(db_file: Union[Path, str], **kwargs) -> sqlite3.Connection:
+  return get_or_create_sqlite_pool(db_file, **kwargs).get_connection()
+
+
 def sqlite_row_factory_as_dict(cursor: sqlite3.Cursor, row) -> Dict[str, Any]:
-  row_as_dict = {}
-  for idx, col in enumerate(cursor.description):
-    row_as_dict[col[0]] = row[idx]
-  return row_as_dict
+  # cached per cursor so that interleaved cursors and pooled connections on other threads do not evict each other
+  description, col_names = _SQLITE_ROW_FACTORY_COLUMNS.get(cursor, (None, ()))
+  if description is not cursor.description:
+    description = cursor.description
+    col_names = tuple([col[0] for col in description])
+    _SQLITE_ROW_FACTORY_COLUMNS[cursor] = (description, col_names)
+
+  return dict(zip(col_names, row))
 
 
 def parse_pg_service_config_file(section: str = None) -> PgServiceConfig:
@@ -93,9 +531,313 @@ def pg_query_to_dicts(
   sql: str,
   *multi_params,
   config: PgServiceConfig = None,
+  query_cache: Union["PgQueryCache", bool] = None,
   **params,
 ) -> List[Dict[str, Any]]:
-  return query_result_to_dicts(pg_query(sql, *multi_params, config=config, **params))
+  if not query_cache:
+    return query_result_to_dicts(pg_query(sql, *multi_params, config=config, **params))
+
+  cache = get_or_create_pg_query_cache() if query_cache is True else query_cache
+
+  if config is None:
+    config = parse_pg_service_config_file(DEFAULT_PG_SERVICE_CONFIG_SECTION)
+
+  cache_key = PgQueryCache.create_key(sql, multi_params, params, config)
+  rows = cache.get(cache_key)
+  if rows is None:
+    rows = query_result_to_dicts(pg_query(sql, *multi_params, config=config, **params))
+    cache.put(cache_key, rows)
+
+  return rows
+
+
+def get_or_create_pg_query_cache(db_file: Union[Path, str] = DEFAULT_PG_QUERY_CACHE_FILE, **kwargs) -> PgQueryCache:
+  cache_key = Path(db_file).resolve().as_posix()
+  with PG_QUERY_CACHES_LOCK:
+    if cache_key not in PG_QUERY_CACHES:
+      PG_QUERY_CACHES[cache_key] = PgQueryCache(db_file, **kwargs)
+
+    return PG_QUERY_CACHES[cache_key]
+
+
+@contextlib.contextmanager
+def pg_query_stream(
+  sql: str,
+  *multi_params,
+  config: PgServiceConfig = None,
+  fetch_size: int = DEFAULT_PG_FETCH_SIZE,
+  **params,
+) -> Iterator[sqlalchemy.engine.ResultProxy]:
+  if params is not None:
+    params = convert_pg_params_to_correct_types(params)
+
+  engine = get_or_create_pg_engine(config if config else parse_pg_service_config_file(DEFAULT_PG_SERVICE_CONFIG_SECTION))
+  with engine.connect() as conn:
+    result = conn.execution_options(stream_results=True, max_row_buffer=fetch_size).execute(sqlalchemy.sql.text(sql), *multi_params, **params)
+    try:
+      yield result
+    finally:
+      result.close()
+
+
+def pg_query_iter(
+  sql: str,
+  *multi_params,
+  config: PgServiceConfig = None,
+  fetch_size: int = DEFAULT_PG_FETCH_SIZE,
+  batches: bool = False,
+  **params,
+) -> Iterator[Union[Dict[str, Any], List[Dict[str, Any]]]]:
+  with pg_query_stream(sql, *multi_params, config=config, fetch_size=fetch_size, **params) as result:
+    keys = tuple(result.keys())
+    while True:
+      rows = result.fetchmany(fetch_size)
+      if not rows:
+        break
+
+      dict_rows = [dict(zip(keys, row)) for row in rows]
+      if batches:
+        yield dict_rows
+      else:
+        yield from dict_rows
+
+
+def pg_query_to_csv(
+  sql: str,
+  output: Union[Path, IO[str]],
+  *multi_params,
+  config: PgServiceConfig = None,
+  fetch_size: int = DEFAULT_PG_FETCH_SIZE,
+  sep: str = ",",
+  header: bool = True,
+  **params,
+) -> int:
+  import csv
+
+  if isinstance(output, Path):
+    with open(output, "w", newline="") as output_file:
+      return pg_query_to_csv(sql, output_file, *multi_params, config=config, fetch_size=fetch_size, sep=sep, header=header, **params)
+
+  row_count = 0
+  writer = csv.writer(output, delimiter=sep)
+  with pg_query_stream(sql, *multi_params, config=config, fetch_size=fetch_size, **params) as result:
+    if header:
+      writer.writerow(result.keys())
+
+    while True:
+      rows = result.fetchmany(fetch_size)
+      if not rows:
+        break
+
+      writer.writerows(rows)
+      row_count += len(rows)
+
+  return row_count
+
+
+def pg_query_to_sqlite(
+  sql: str,
+  db: Union[sqlite3.Connection, Path, str],
+  table_name: str,
+  *multi_params,
+  config: PgServiceConfig = None,
+  fetch_size: int = DEFAULT_PG_FETCH_SIZE,
+  sqlite_cols: list = None,
+  primary_key: Any = None,
+  incremental: bool = False,
+  **params,
+) -> int:
+  """
+  :type sqlite_cols: List[ltpylib.sqlite_helper.SQLiteColumn]
+  :type primary_key: ltpylib.sqlite_helper.SQLiteColumn
+  """
+  import dataclasses
+  import itertools
+
+  from ltpylib import sqlite_helper
+
+  rows = pg_query_iter(sql, *multi_params, config=config, fetch_size=fetch_size, **params)
+
+  if sqlite_cols is None:
+    sample = list(itertools.islice(rows, fetch_size))
+    # the schema is inferred from the first batch only, so every column has to allow nulls
+    sqlite_cols = [dataclasses.replace(col, has_nulls=True) for col in sqlite_helper.add_sqlite_columns_from_dicts(sample, [])]
+    if sample:
+      inferred_names = set([col.name for col in sqlite_cols])
+      sqlite_cols.extend([sqlite_helper.SQLiteColumn(key, "TEXT", has_nulls=True) for key in sample[0] if key not in inferred_names])
+
+    rows = itertools.chain(sample, rows)
+
+  if incremental:
+    return sqlite_helper.sqlite_upsert_table_from_dicts(db, table_name, rows, primary_key, sqlite_cols=sqlite_cols).rows_loaded
+
+  return sqlite_helper.sqlite_load_table_from_dicts(db, table_name, rows, sqlite_cols, primary_key=primary_key)
+
+
+def pg_run_queries(
+  queries: Dict[str, str],
+  *multi_params,
+  config: PgServiceConfig = None,
+  engine_options: PgEngineOptions = None,
+  max_workers: int = None,
+  raise_on_error: bool = False,
+  **params,
+) -> Dict[str, PgQueryResult]:
+  import time
+  from concurrent import futures
+
+  from ltpylib import concurrency_helper
+
+  if not queries:
+    return {}
+
+  if config is None:
+    config = parse_pg_service_config_file(DEFAULT_PG_SERVICE_CONFIG_SECTION)
+
+  if engine_options is None:
+    engine_options = DEFAULT_PG_ENGINE_OPTIONS
+
+  if max_workers is None:
+    max_workers = min(len(queries), engine_options.pool_size + engine_options.max_overflow)
+
+  engine = get_or_create_pg_engine(config, engine_options=engine_options)
+  if params is not None:
+    params = convert_pg_params_to_correct_types(params)
+
+  def run_query(query: Tuple[str, str]) -> PgQueryResult:
+    query_id, sql = query
+    result = PgQueryResult(query_id, sql)
+    start_time = time.perf_counter()
+    try:
+      result.rows = query_result_to_dicts(engine.execute(sqlalchemy.sql.text(sql), *multi_params, **params))
+    except Exception as e:
+      result.error = e
+    finally:
+      result.elapsed = time.perf_counter() - start_time
+
+    return result
+
+  with futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pg_query") as pool:
+    results = concurrency_helper.run_parallel(run_query, queries.items(), pool=pool)
+
+  if raise_on_error:
+    for result in results:
+      if result.error is not None:
+        raise result.error
+
+  return {result.query_id: result for result in results}
+
+
+def pg_run_queries_from_file(
+  sql_file: Path,
+  *multi_params,
+  query_ids: List[str] = None,
+  inject_env: bool = True,
+  config: PgServiceConfig = None,
+  engine_options: PgEngineOptions = None,
+  max_workers: int = None,
+  raise_on_error: bool = False,
+  **params,
+) -> Dict[str, PgQueryResult]:
+  index = SqlFileIndex.get(sql_file)
+  if query_ids is None:
+    query_ids = index.query_ids
+
+  queries = {query_id: index.get_sql(query_id, inject_env=inject_env) for query_id in query_ids}
+  return pg_run_queries(
+    queries,
+    *multi_params,
+    config=config,
+    engine_options=engine_options,
+    max_workers=max_workers,
+    raise_on_error=raise_on_error,
+    **params,
+  )
+
+
+def pg_copy_from_dicts(
+  table_name: str,
+  rows: Iterable[Dict[str, Any]],
+  columns: List[str] = None,
+  config: PgServiceConfig = None,
+  engine_options: PgEngineOptions = None,
+  batch_size: int = DEFAULT_PG_COPY_BATCH_SIZE,
+  create_table: bool = False,
+) -> int:
+  import io
+  import itertools
+
+  from ltpylib import sqlite_helper
+
+  rows = iter(rows)
+  batch = list(itertools.islice(rows, batch_size))
+  if not batch:
+    return 0
+
+  pg_cols: Dict[str, str] = {}
+  if columns is None or create_table:
+    # the schema is inferred from the first batch only, same as pg_query_to_sqlite
+    for col in sqlite_helper.add_sqlite_columns_from_dicts(batch, [], only_cols=columns):
+      pg_cols[col.name] = PG_TYPES_BY_SQLITE_TYPE.get(col.value_type, "TEXT")
+
+    if columns is None:
+      columns = list(pg_cols.keys()) + [key for key in batch[0] if key not in pg_cols]
+
+  col_names = ", ".join([quote_pg_identifier(col) for col in columns])
+  copy_sql = f"COPY {table_name} ({col_names}) FROM STDIN"
+
+  engine = get_or_create_pg_engine(config if config else parse_pg_service_config_file(DEFAULT_PG_SERVICE_CONFIG_SECTION), engine_options=engine_options)
+  raw_conn = engine.raw_connection()
+  row_count = 0
+  try:
+    cursor = raw_conn.cursor()
+    if create_table:
+      cursor.execute(create_pg_table_sql(table_name, [(col, pg_cols.get(col, "TEXT")) for col in columns]))
+
+    while batch:
+      buffer = io.StringIO()
+      buffer.writelines(iter_pg_copy_lines(batch, columns))
+      buffer.seek(0)
+      cursor.copy_expert(copy_sql, buffer)
+      row_count += len(batch)
+      batch = list(itertools.islice(rows, batch_size))
+
+    raw_conn.commit()
+  except Exception:
+    raw_conn.rollback()
+    raise
+  finally:
+    raw_conn.close()
+
+  return row_count
+
+
+def create_pg_table_sql(table_name: str, columns: List[Tuple[str, str]]) -> str:
+  col_defs = ",\n  ".join([f"{quote_pg_identifier(col)} {col_type}" for col, col_type in columns])
+  return f"CREATE TABLE IF NOT EXISTS {table_name} (\n  {col_defs}\n)"
+
+
+def iter_pg_copy_lines(rows: Iterable[Dict[str, Any]], columns: List[str]) -> Iterator[str]:
+  from ltpylib import sqlite_helper
+
+  escapes = PG_COPY_TEXT_ESCAPES
+  for values in sqlite_helper.iter_sqlite_row_values(rows, columns, convert_booleans=False):
+    fields = []
+    for value in values:
+      if value is None:
+        fields.append("\\N")
+      elif value.__class__ is str:
+        fields.append(value.translate(escapes))
+      elif value.__class__ is bytes:
+        fields.append("\\\\x" + value.hex())
+      else:
+        fields.append(str(value))
+
+    yield "\t".join(fields) + "\n"
+
+
+def quote_pg_identifier(name: str) -> str:
+  return '"' + name.replace('"', '""') + '"'
 
 
 def query_result_to_dicts(result: sqlalchemy.engine.ResultProxy) -> List[Dict[str, Any]]:
@@ -110,7 +852,10 @@ def convert_pg_params_to_correct_types(params: dict) -> dict:
   return params
 
 
-def create_pg_engine(config: PgServiceConfig) -> sqlalchemy.engine.Engine:
+def create_pg_engine(config: PgServiceConfig, engine_options: PgEngineOptions = None) -> sqlalchemy.engine.Engine:
+  if engine_options is None:
+    engine_options = DEFAULT_PG_ENGINE_OPTIONS
+
   db_connect_url = sqlalchemy.engine.url.URL(
     drivername="postgresql+psycopg2",  # pg+psycopg2
     username=config.user,
@@ -119,51 +864,40 @@ def create_pg_engine(config: PgServiceConfig) -> sqlalchemy.engine.Engine:
     port=config.port,
     database=config.dbname,
   )
-  return sqlalchemy.create_engine(db_connect_url)
+  return sqlalchemy.create_engine(db_connect_url, **engine_options.to_engine_kwargs())
 
 
-def get_or_create_pg_engine(config: PgServiceConfig) -> sqlalchemy.engine.Engine:
-  if str(config) not in PG_ENGINES:
-    PG_ENGINES[str(config)] = create_pg_engine(config)
+def get_or_create_pg_engine(config: PgServiceConfig, engine_options: PgEngineOptions = None) -> sqlalchemy.engine.Engine:
+  if engine_options is None:
+    engine_options = DEFAULT_PG_ENGINE_OPTIONS
 
-  return PG_ENGINES[str(config)]
+  engine_key = config.connection_key() + ";" + repr(engine_options)
+  engine = PG_ENGINES.get(engine_key)
+  if engine is not None:
+    return engine
 
+  with PG_ENGINES_LOCK:
+    if engine_key not in PG_ENGINES:
+      PG_ENGINES[engine_key] = create_pg_engine(config, engine_options=engine_options)
 
-def pull_sql_from_file(query_ids: Union[List[str], str], resolved_sql_file: Path, inject_env: bool = True) -> str:
-  if isinstance(query_ids, str):
-    query_ids = [query_ids]
+    return PG_ENGINES[engine_key]
 
-  if query_ids:
-    queries: List[str] = []
-    for qid in query_ids:
-      queries.append(match_query_regex_in_file(
-        resolved_sql_file,
-        [
-          SQL_CMD_REGEX_QUERY_ID.replace(SQL_CMD_REGEX_QUERY_ID_REPL_STR, qid),
-        ],
-      ))
 
-    query = "\n".join(queries)
+def dispose_pg_engines():
+  with PG_ENGINES_LOCK:
+    engines = list(PG_ENGINES.values())
+    PG_ENGINES.clear()
 
-  else:
-    query = match_query_regex_in_file(
-      resolved_sql_file,
-      [
-        SQL_CMD_REGEX_PRIMARY,
-        SQL_CMD_REGEX_SECONDARY,
-      ],
-    )
+  for engine in engines:
+    engine.dispose()
 
-  if inject_env:
-    exit_code, updated_query = procs.run_and_parse_output(["envsubst"], input=query)
-    if exit_code == 0:
-      query = updated_query
 
-  return query
+def pull_sql_from_file(query_ids: Union[List[str], str], resolved_sql_file: Path, inject_env: bool = True) -> str:
+  return SqlFileIndex.get(resolved_sql_file).get_sql(query_ids, inject_env=inject_env)
 
 
 def pull_query_ids_from_file(sql_file: Path) -> List[str]:
-  return patterns.pull_matches_from_file(sql_file, SQL_CMD_REGEX_QUERY_ID_ALL, group=1, flags=SQL_CMD_REGEX_FLAGS)
+  return list(SqlFileIndex.get(sql_file).query_ids)
 
 
 def locate_sql_file(
@@ -192,10 +926,16 @@ def locate_sql_file(
 
 
 def match_query_regex_in_file(resolved_sql_file: Path, regexes_to_check: List[str]) -> str:
-  file_contents = files.read_file(resolved_sql_file)
+  file_contents = SqlFileIndex.get(resolved_sql_file).contents
 
   for regex_to_check in regexes_to_check:
-    for match in re.finditer(regex_to_check, file_contents, flags=SQL_CMD_REGEX_FLAGS):
+    match = _compile_sql_cmd_regex(regex_to_check).search(file_contents)
+    if match:
       return match.group(SQL_CMD_REGEX_GROUP)
 
   raise Exception("Could not find a sql query match in file: " + resolved_sql_file.as_posix())
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_sql_cmd_regex(regex: str) -> re.Pattern:
+  return re.compile(regex, flags=SQL_CMD_REGEX_FLAGS)
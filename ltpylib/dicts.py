@@ -1,42 +1,71 @@
 #!/usr/bin/env python
 # pylint: disable=C0111
-from typing import Any, Callable, Dict, List, Optional, Sequence, TypeVar, Union
+import functools
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, TypeVar, Union
 
 from ltpylib import checks, strings
 from ltpylib.collect import modify_list_of_dicts
 
 T = TypeVar('T')
 
+COLUMN_TYPE_SAMPLE_SIZE = 100
+
+DictTransform = Callable[[dict], Optional[Iterable[Any]]]
+
+
+def transform_nested_dicts(
+  obj: Union[dict, list],
+  transform: DictTransform,
+  recursive: bool = True,
+) -> Union[dict, list]:
+  if not recursive:
+    # only the dict itself, or the dicts directly inside the top level list
+    for val in ([obj] if isinstance(obj, dict) else obj):
+      if isinstance(val, dict):
+        transform(val)
+
+    return obj
+
+  stack: List[Any] = [obj]
+  push = stack.append
+  pop = stack.pop
+
+  while stack:
+    val = pop()
+    if isinstance(val, dict):
+      children = transform(val)
+      for child in (val.values() if children is None else children):
+        if isinstance(child, (dict, list)):
+          push(child)
+    elif isinstance(val, list):
+      for child in val:
+        if isinstance(child, (dict, list)):
+          push(child)
+
+  return obj
+
 
 def convert_keys_to_snake_case(
   obj: Union[dict, list],
   recursive: bool = False,
 ) -> Union[dict, list]:
-  if isinstance(obj, list):
-    objs = obj
-  else:
-    objs = [obj]
+  to_snake_case = strings.to_snake_case_cached
 
-  for obj_dict in objs:
-    dict_items = list(obj_dict.items())
-    for key, val in dict_items:
-      key_snake_case = strings.to_snake_case(key)
+  def transform(obj_dict: dict) -> None:
+    renames = None
+    for key in obj_dict:
+      key_snake_case = to_snake_case(key)
       if key != key_snake_case:
-        obj_dict[key_snake_case] = obj_dict.pop(key)
+        if renames is None:
+          renames = []
+        renames.append((key, key_snake_case))
 
-      if recursive and isinstance(val, dict):
-        convert_keys_to_snake_case(
-          val,
-          recursive=recursive,
-        )
-      elif recursive and isinstance(val, list) and len(val) > 0 and isinstance(val[0], dict):
-        for inner_val in val:
-          convert_keys_to_snake_case(
-            inner_val,
-            recursive=recursive,
-          )
+    if renames:
+      for key, key_snake_case in renames:
+        obj_dict[key_snake_case] = obj_dict.pop(key)
 
-  return obj
+  return transform_nested_dicts(obj, transform, recursive=recursive)
 
 
 def convert_boolean_values_to_string(
@@ -45,39 +74,28 @@ def convert_boolean_values_to_string(
   ignore_fields: List[str] = None,
   only_fields: List[str] = None,
 ) -> Union[dict, list]:
-  if isinstance(value_to_convert, list):
-    if isinstance(value_to_convert[0], str):
-      return value_to_convert
+  ignore_fields_set = frozenset(ignore_fields) if ignore_fields else None
 
-    objs = value_to_convert
-  else:
-    objs = [value_to_convert]
+  def transform(obj_dict: dict) -> Optional[Iterable[Any]]:
+    if only_fields:
+      keys = [f for f in only_fields if f in obj_dict]
+    else:
+      keys = obj_dict
 
-  for obj_dict in objs:
-    items = obj_dict.items() if not only_fields else [(f, obj_dict[f]) for f in only_fields if f in obj_dict]
-    for key, val in items:
-      if isinstance(val, bool):
-        if ignore_fields and key in ignore_fields:
+    for key in keys:
+      val = obj_dict[key]
+      if val is True or val is False:
+        if ignore_fields_set is not None and key in ignore_fields_set:
           continue
 
-        obj_dict[key] = str(val).lower()
-      elif recursive and isinstance(val, dict):
-        convert_boolean_values_to_string(
-          val,
-          recursive=recursive,
-          ignore_fields=ignore_fields,
-          only_fields=only_fields,
-        )
-      elif recursive and isinstance(val, list) and len(val) > 0 and isinstance(val[0], dict):
-        for inner_val in val:
-          convert_boolean_values_to_string(
-            inner_val,
-            recursive=recursive,
-            ignore_fields=ignore_fields,
-            only_fields=only_fields,
-          )
-
-  return value_to_convert
+        obj_dict[key] = "true" if val else "false"
+
+    if only_fields:
+      return [obj_dict[key] for key in keys]
+
+    return None
+
+  return transform_nested_dicts(value_to_convert, transform, recursive=recursive)
 
 
 def convert_string_values_to_correct_type(
@@ -88,42 +106,23 @@ def convert_string_values_to_correct_type(
   recursive: bool = False,
   ignore_fields: List[str] = None,
 ) -> Union[dict, list]:
-  if isinstance(value_to_convert, list):
-    if isinstance(value_to_convert[0], str):
-      return [convert_string_to_correct_type(val, convert_numbers=convert_numbers, convert_booleans=convert_booleans, use_decimal=use_decimal) for val in value_to_convert]
+  ignore_fields_set = frozenset(ignore_fields) if ignore_fields else None
 
-    objs = value_to_convert
-  else:
-    objs = [value_to_convert]
+  def convert(val: str):
+    return convert_string_to_correct_type(val, convert_numbers=convert_numbers, convert_booleans=convert_booleans, use_decimal=use_decimal)
 
-  for obj_dict in objs:
+  def transform(obj_dict: dict) -> None:
     for key, val in obj_dict.items():
       if isinstance(val, str):
-        if ignore_fields and key in ignore_fields:
+        if ignore_fields_set is not None and key in ignore_fields_set:
           continue
 
-        obj_dict[key] = convert_string_to_correct_type(val, convert_numbers=convert_numbers, convert_booleans=convert_booleans, use_decimal=use_decimal)
-      elif recursive and isinstance(val, dict):
-        convert_string_values_to_correct_type(
-          val,
-          convert_numbers=convert_numbers,
-          convert_booleans=convert_booleans,
-          use_decimal=use_decimal,
-          recursive=recursive,
-          ignore_fields=ignore_fields,
-        )
-      elif recursive and isinstance(val, list) and len(val) > 0 and isinstance(val[0], dict):
-        for inner_val in val:
-          convert_string_values_to_correct_type(
-            inner_val,
-            convert_numbers=convert_numbers,
-            convert_booleans=convert_booleans,
-            use_decimal=use_decimal,
-            recursive=recursive,
-            ignore_fields=ignore_fields,
-          )
-
-  return value_to_convert
+        obj_dict[key] = convert(val)
+
+  if isinstance(value_to_convert, list):
+    value_to_convert = [convert(val) if isinstance(val, str) else val for val in value_to_convert]
+
+  return transform_nested_dicts(value_to_convert, transform, recursive=recursive)
 
 
 def convert_string_to_correct_type(
@@ -132,14 +131,132 @@ def convert_string_to_correct_type(
   convert_booleans: bool = True,
   use_decimal: bool = False,
 ):
-  if convert_numbers and strings.is_number(val, allow_comma=True):
-    return strings.convert_to_number(val, use_decimal=use_decimal, remove_commas=True)
-  elif convert_booleans and strings.is_boolean(val):
-    return strings.convert_to_bool(val)
+  if convert_numbers:
+    number = strings.parse_number(val, use_decimal=use_decimal, allow_comma=True)
+    if number is not None:
+      return number
+
+  if convert_booleans:
+    boolean = strings.parse_boolean(val)
+    if boolean is not None:
+      return boolean
 
   return val
 
 
+def infer_string_column_converter(
+  values: Iterable[Any],
+  convert_numbers: bool = True,
+  convert_booleans: bool = True,
+  use_decimal: bool = False,
+  sample_size: int = COLUMN_TYPE_SAMPLE_SIZE,
+) -> Optional[Callable[[str], Any]]:
+  seen_types = set()
+  sampled = 0
+  for val in values:
+    if not isinstance(val, str) or not val:
+      continue
+
+    seen_types.add(type(convert_string_to_correct_type(val, convert_numbers=convert_numbers, convert_booleans=convert_booleans, use_decimal=use_decimal)))
+    sampled += 1
+    if sampled >= sample_size:
+      break
+
+  if not seen_types or seen_types == {str}:
+    return None
+
+  if seen_types == {bool}:
+    return _convert_bool_cell
+  elif seen_types == {int}:
+    return _convert_int_cell
+  elif seen_types.issubset({int, float}):
+    return _convert_float_cell
+  elif seen_types.issubset({int, Decimal}):
+    return _convert_decimal_cell
+
+  return functools.partial(convert_string_to_correct_type, convert_numbers=convert_numbers, convert_booleans=convert_booleans, use_decimal=use_decimal)
+
+
+def convert_string_column_to_correct_type(
+  values: List[Any],
+  convert_numbers: bool = True,
+  convert_booleans: bool = True,
+  use_decimal: bool = False,
+  sample_size: int = COLUMN_TYPE_SAMPLE_SIZE,
+) -> List[Any]:
+  converter = infer_string_column_converter(values, convert_numbers=convert_numbers, convert_booleans=convert_booleans, use_decimal=use_decimal, sample_size=sample_size)
+  if converter is None:
+    return list(values)
+
+  try:
+    return [converter(val) if val.__class__ is str else val for val in values]
+  except (KeyError, ValueError, InvalidOperation):
+    return [
+      convert_string_to_correct_type(val, convert_numbers=convert_numbers, convert_booleans=convert_booleans, use_decimal=use_decimal) if isinstance(val, str) else val
+      for val in values
+    ]
+
+
+def convert_string_values_to_correct_type_by_column(
+  rows: List[dict],
+  fields: Sequence[str] = None,
+  convert_numbers: bool = True,
+  convert_booleans: bool = True,
+  use_decimal: bool = False,
+  sample_size: int = COLUMN_TYPE_SAMPLE_SIZE,
+) -> List[dict]:
+  if not rows:
+    return rows
+
+  if fields is None:
+    fields = list(dict.fromkeys(key for row in rows for key in row))
+
+  for field in fields:
+    converted = convert_string_column_to_correct_type(
+      [row.get(field) for row in rows],
+      convert_numbers=convert_numbers,
+      convert_booleans=convert_booleans,
+      use_decimal=use_decimal,
+      sample_size=sample_size,
+    )
+    for row, val in zip(rows, converted):
+      if field in row:
+        row[field] = val
+
+  return rows
+
+
+def _convert_bool_cell(val: str) -> Union[bool, str]:
+  return strings.BOOLEAN_STRINGS_LOOKUP[val.lower()] if val else val
+
+
+def _check_plain_number_cell(val: str) -> str:
+  # Mirror the strings.parse_number prefilter so the bulk converters reject the same values (" 5", "1_000", "nan", "1e3") as the per-cell path.
+  if val[0] not in strings.NUMBER_FIRST_CHARS:
+    raise ValueError(val)
+
+  digits = val.replace(".", "", 1)
+  if digits[:1] == "-":
+    digits = digits[1:]
+
+  if not digits.isdigit():
+    raise ValueError(val)
+
+  return val
+
+
+def _convert_decimal_cell(val: str) -> Union[Decimal, str]:
+  return Decimal(_check_plain_number_cell(val)) if val else val
+
+
+def _convert_float_cell(val: str) -> Union[float, str]:
+  return float(_check_plain_number_cell(val)) if val else val
+
+
+def _convert_int_cell(val: str) -> Union[int, str]:
+  return int(_check_plain_number_cell(val)) if val else val
+
+
 def copy_fields(
   from_val: dict,
   to_val: dict,
@@ -466,7 +466,7 @@ class JiraApi(object):
 
         orig_key: str = key
         if key.startswith("customfield_") and key in names:
-          key = strconverters.to_camel_case(names.get(key))
+          key = strconverters.to_camel_case_cached(names.get(key))
 
         if key in skip_fields or orig_key in skip_fields:
           continue
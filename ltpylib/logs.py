@@ -1,13 +1,17 @@
 #!/usr/bin/env python
 import argparse
+import json
 import logging
+import logging.handlers
 import os
+import re
 import shutil
 import subprocess
 import sys
 import threading
+import time
 from pathlib import Path
-from typing import Union
+from typing import Any, Dict, Iterator, List, Optional, Pattern, Sequence, Tuple, Union
 
 from ltpylib import opts
 
@@ -22,18 +26,182 @@ LOG_SEP = "---------------------------------------------------------------------
 
 LOG_FORMAT_WITH_LEVEL = f"{LOG_FORMAT_PART_LEVEL} {LOG_FORMAT_PART_MESSAGE}"
 LOG_FORMAT_WITH_TIMESTAMP = f"[{LOG_FORMAT_PART_TIMESTAMP}] {LOG_FORMAT_PART_MESSAGE}"
+LOG_FORMAT_JSON = "json"
 
+LOG_RECORD_STANDARD_ATTRS = frozenset(list(vars(logging.LogRecord("", logging.INFO, "", 0, "", None, None)).keys()) + ["asctime", "message", "taskName"])
 
-# see https://stackoverflow.com/questions/21953835/run-subprocess-and-print-output-to-logging
-class LogPipe(threading.Thread):
+LOG_QUEUE_BATCH_SIZE = 512
+LOG_QUEUE_LISTENER: Optional["BatchingQueueListener"] = None
+LOG_QUEUE_LAZY_ARG_TYPES = frozenset([str, int, float, bool, type(None)])
 
-  def __init__(self, level: int = logging.INFO):
-    threading.Thread.__init__(self)
-    self.daemon = False
+LOG_TAIL_BLOCK_SIZE = 64 * 1024
+LOG_TAIL_DEFAULT_LINES = 1500
+LOG_TAIL_INOTIFY_MASK = 0x2 | 0x4 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200  # MODIFY | ATTRIB | CLOSE_WRITE | MOVED_FROM | MOVED_TO | CREATE | DELETE
+LOG_TAIL_POLL_INTERVAL = 0.25
+
+LOG_PIPE_CLOSE_TIMEOUT = 5.0
+LOG_PIPE_READ_SIZE = 64 * 1024
+
+LOG_MULTIPLEXER: Optional["LogMultiplexer"] = None
+LOG_MULTIPLEXER_LOCK = threading.Lock()
+
+
+class LogMultiplexerSource(object):
+
+  def __init__(
+    self,
+    fd: int,
+    level: int = logging.INFO,
+    prefix: str = None,
+    name: str = None,
+    logger: logging.Logger = None,
+    batch_lines: bool = True,
+  ):
+    import codecs
+
+    self.fd = fd
     self.level = level
-    self.fd_read, self.fd_write = os.pipe()
-    self.pipe_reader = os.fdopen(self.fd_read)
-    self.start()
+    self.prefix = prefix
+    self.name = name
+    self.logger = logger if logger is not None else logging.getLogger()
+    self.batch_lines = batch_lines
+    self.done = threading.Event()
+    self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    self._partial_line = ""
+
+  def feed(self, data: bytes):
+    lines = (self._partial_line + self._decoder.decode(data)).split("\n")
+    self._partial_line = lines.pop()
+    self._log_lines(lines)
+
+  def finish(self):
+    remaining = self._partial_line + self._decoder.decode(b"", final=True)
+    self._partial_line = ""
+    if remaining:
+      self._log_lines([remaining])
+
+    self.done.set()
+
+  def wait(self, timeout: float = None) -> bool:
+    return self.done.wait(timeout)
+
+  def _log_lines(self, lines: List[str]):
+    if not lines or not self.logger.isEnabledFor(self.level):
+      return
+
+    if self.prefix:
+      lines = [self.prefix + line for line in lines]
+
+    extra = {"log_source": self.name}
+    if self.batch_lines:
+      self.logger.log(self.level, "\n".join(lines), extra=extra)
+    else:
+      for line in lines:
+        self.logger.log(self.level, line, extra=extra)
+
+
+class LogMultiplexer(object):
+
+  def __init__(self):
+    import selectors
+
+    self.pid = os.getpid()
+    self._selector = selectors.DefaultSelector()
+    self._wakeup_read, self._wakeup_write = os.pipe()
+    self._selector.register(self._wakeup_read, selectors.EVENT_READ, None)
+    self._lock = threading.Lock()
+    self._pending: List[LogMultiplexerSource] = []
+    self._thread: Optional[threading.Thread] = None
+
+  def open_pipe(
+    self,
+    level: int = logging.INFO,
+    prefix: str = None,
+    name: str = None,
+    logger: logging.Logger = None,
+    batch_lines: bool = True,
+  ) -> Tuple[int, LogMultiplexerSource]:
+    fd_read, fd_write = os.pipe()
+    return fd_write, self.add_fd(fd_read, level=level, prefix=prefix, name=name, logger=logger, batch_lines=batch_lines)
+
+  def add_fd(
+    self,
+    fd: int,
+    level: int = logging.INFO,
+    prefix: str = None,
+    name: str = None,
+    logger: logging.Logger = None,
+    batch_lines: bool = True,
+  ) -> LogMultiplexerSource:
+    source = LogMultiplexerSource(fd, level=level, prefix=prefix, name=name, logger=logger, batch_lines=batch_lines)
+    with self._lock:
+      self._pending.append(source)
+      if self._thread is None:
+        self._thread = threading.Thread(target=self._run, name="LogMultiplexer", daemon=True)
+        self._thread.start()
+
+    os.write(self._wakeup_write, b"\0")
+    return source
+
+  def _run(self):
+    import selectors
+
+    while True:
+      for key, _ in self._selector.select():
+        source: Optional[LogMultiplexerSource] = key.data
+        if source is None:
+          os.read(self._wakeup_read, LOG_PIPE_READ_SIZE)
+          with self._lock:
+            pending = self._pending
+            self._pending = []
+
+          for pending_source in pending:
+            self._selector.register(pending_source.fd, selectors.EVENT_READ, pending_source)
+
+          continue
+
+        try:
+          data = os.read(source.fd, LOG_PIPE_READ_SIZE)
+        except OSError:
+          data = b""
+
+        if data:
+          source.feed(data)
+        else:
+          self._selector.unregister(source.fd)
+          os.close(source.fd)
+          source.finish()
+
+
+def get_log_multiplexer() -> LogMultiplexer:
+  global LOG_MULTIPLEXER
+
+  with LOG_MULTIPLEXER_LOCK:
+    # A forked child inherits the parent's multiplexer without its reader thread, so each process needs its own.
+    if LOG_MULTIPLEXER is None or LOG_MULTIPLEXER.pid != os.getpid():
+      LOG_MULTIPLEXER = LogMultiplexer()
+
+    return LOG_MULTIPLEXER
+
+
+def _reset_log_multiplexer_lock_after_fork():
+  global LOG_MULTIPLEXER_LOCK
+
+  LOG_MULTIPLEXER_LOCK = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+  os.register_at_fork(after_in_child=_reset_log_multiplexer_lock_after_fork)
+
+
+class LogPipe(object):
+
+  def __init__(self, level: int = logging.INFO, prefix: str = None, name: str = None, multiplexer: LogMultiplexer = None):
+    self.level = level
+    self.prefix = prefix
+    self.multiplexer = multiplexer if multiplexer is not None else get_log_multiplexer()
+    self.fd_write, self.source = self.multiplexer.open_pipe(level=level, prefix=prefix, name=name)
+    self.closed = False
 
   def __enter__(self):
     return self
@@ -44,17 +212,16 @@ class LogPipe(threading.Thread):
   def fileno(self):
     return self.fd_write
 
-  def run(self):
-    for line in iter(self.pipe_reader.readline, ''):
-      logging.log(self.level, line.strip('\n'))
-
-    self.pipe_reader.close()
+  def close(self, timeout: float = LOG_PIPE_CLOSE_TIMEOUT):
+    if self.closed:
+      return
 
-  def close(self):
+    self.closed = True
     os.close(self.fd_write)
+    self.source.wait(timeout)
 
   def write(self, message):
-    logging.log(self.level, message)
+    logging.log(self.level, (self.prefix or "") + message)
 
   def flush(self):
     pass
@@ -86,6 +253,150 @@ class StdoutStreamHandler(logging.StreamHandler):
     super().handleError(record)
 
 
+class JsonLinesFormatter(logging.Formatter):
+
+  def __init__(self, include_extra: bool = True, static_fields: Dict[str, Any] = None):
+    super().__init__()
+    self.include_extra = include_extra
+    self.static_fields = static_fields
+    self._encoder = json.JSONEncoder(ensure_ascii=False, check_circular=False, separators=(",", ":"), default=str)
+    self._timestamp_cache: Tuple[int, str] = (-1, "")
+
+  def format_timestamp(self, record: logging.LogRecord) -> str:
+    second = int(record.created)
+    cached_second, prefix = self._timestamp_cache
+    if second != cached_second:
+      prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+      self._timestamp_cache = (second, prefix)
+
+    return "%s.%03dZ" % (prefix, record.msecs)
+
+  def format(self, record: logging.LogRecord) -> str:
+    data = {
+      "timestamp": self.format_timestamp(record),
+      "level": record.levelname,
+      "logger": record.name,
+      "message": record.getMessage(),
+    }
+
+    if self.static_fields:
+      data.update(self.static_fields)
+
+    if self.include_extra:
+      standard_attrs = LOG_RECORD_STANDARD_ATTRS
+      for key, value in record.__dict__.items():
+        if key not in standard_attrs:
+          data[key] = value
+
+    if record.exc_info:
+      if not record.exc_text:
+        record.exc_text = self.formatException(record.exc_info)
+
+    if record.exc_text:
+      data["exception"] = record.exc_text
+
+    if record.stack_info:
+      data["stack"] = self.formatStack(record.stack_info)
+
+    return self._encoder.encode(data)
+
+
+def create_log_formatter(log_format: str = None, json_lines: bool = False) -> logging.Formatter:
+  if json_lines or log_format == LOG_FORMAT_JSON:
+    return JsonLinesFormatter()
+
+  return logging.Formatter(log_format if log_format else DEFAULT_LOG_FORMAT, style=DEFAULT_LOG_STYLE)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+
+  def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+    import copy
+
+    record = copy.copy(record)
+    # args that cannot change after the call are left for the listener thread to format
+    if record.args and not (isinstance(record.args, tuple) and all([arg.__class__ in LOG_QUEUE_LAZY_ARG_TYPES for arg in record.args])):
+      record.msg = record.getMessage()
+      record.args = None
+
+    return record
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+
+  def __init__(self, queue, *handlers, respect_handler_level: bool = True, batch_size: int = LOG_QUEUE_BATCH_SIZE):
+    super().__init__(queue, *handlers, respect_handler_level=respect_handler_level)
+    self.batch_size = batch_size
+
+  def add_handler(self, handler: logging.Handler):
+    self.handlers = self.handlers + (handler,)
+
+  def handle_batch(self, records: List[logging.LogRecord]):
+    for handler in self.handlers:
+      if not isinstance(handler, logging.StreamHandler) or handler.stream is None:
+        for record in records:
+          if not self.respect_handler_level or record.levelno >= handler.level:
+            handler.handle(record)
+
+        continue
+
+      # write the whole batch under one lock acquisition and flush once
+      handler.acquire()
+      try:
+        for record in records:
+          if self.respect_handler_level and record.levelno < handler.level:
+            continue
+
+          if not handler.filter(record):
+            continue
+
+          try:
+            handler.stream.write(handler.format(record) + handler.terminator)
+          except Exception:
+            handler.handleError(record)
+
+        handler.flush()
+      finally:
+        handler.release()
+
+  def _monitor(self):
+    import queue
+
+    log_queue = self.queue
+    has_task_done = hasattr(log_queue, "task_done")
+    stop = False
+    while not stop:
+      records = []
+      record = self.dequeue(True)
+      while True:
+        if record is self._sentinel:
+          stop = True
+        else:
+          records.append(record)
+
+        if has_task_done:
+          log_queue.task_done()
+
+        if stop or len(records) >= self.batch_size:
+          break
+
+        try:
+          record = self.dequeue(False)
+        except queue.Empty:
+          break
+
+      if records:
+        self.handle_batch(records)
+
+
+def stop_async_logging():
+  global LOG_QUEUE_LISTENER
+
+  if LOG_QUEUE_LISTENER is not None:
+    LOG_QUEUE_LISTENER.stop()
+    LOG_QUEUE_LISTENER = None
+
+
 def init_logging(
   verbose: bool = None,
   quiet: bool = None,
@@ -93,7 +404,11 @@ def init_logging(
   log_format: str = None,
   args: Union[argparse.Namespace, opts.BaseArgs] = None,
   use_stderr: bool = False,
+  async_handlers: bool = False,
+  json_lines: bool = None,
 ):
+  global LOG_QUEUE_LISTENER
+
   if args:
     if verbose is None and hasattr(args, "verbose"):
       verbose = args.verbose
@@ -103,6 +418,8 @@ def init_logging(
       log_format = args.log_format
     if quiet is None and hasattr(args, "quiet"):
       quiet = args.quiet
+    if json_lines is None and hasattr(args, "log_json"):
+      json_lines = args.log_json
 
   if verbose:
     log_level = logging.DEBUG
@@ -115,25 +432,46 @@ def init_logging(
   else:
     log_level = DEFAULT_LOG_LEVEL
 
+  log_format = log_format if log_format else DEFAULT_LOG_FORMAT
+  handler = StderrStreamHandler() if use_stderr else StdoutStreamHandler()
+  handler.setFormatter(create_log_formatter(log_format, json_lines=json_lines))
+  if async_handlers and not logging.root.handlers:
+    import atexit
+    import queue
+
+    stop_async_logging()
+
+    log_queue = queue.SimpleQueue()
+    LOG_QUEUE_LISTENER = BatchingQueueListener(log_queue, handler)
+    LOG_QUEUE_LISTENER.start()
+    atexit.register(stop_async_logging)
+
+    handler = LazyQueueHandler(log_queue)
+
   log_config_kwargs = {
     "style": DEFAULT_LOG_STYLE,
-    "handlers": [StderrStreamHandler() if use_stderr else StdoutStreamHandler()],
+    "handlers": [handler],
   }
   logging.basicConfig(
     level=log_level,
-    format=log_format if log_format else DEFAULT_LOG_FORMAT,
+    format=log_format if log_format != LOG_FORMAT_JSON else DEFAULT_LOG_FORMAT,
     **log_config_kwargs,
   )
 
 
-def add_file_logging(log_file: Path):
+def add_file_logging(log_file: Path, json_lines: bool = False):
   if not log_file.parent.exists():
     log_file.parent.mkdir(parents=True)
 
   root_logger = logging.getLogger()
 
   file_handler = logging.FileHandler(log_file.as_posix())
-  file_handler.setFormatter(root_logger.handlers[0].formatter)
+  if LOG_QUEUE_LISTENER is not None:
+    file_handler.setFormatter(JsonLinesFormatter() if json_lines else LOG_QUEUE_LISTENER.handlers[0].formatter)
+    LOG_QUEUE_LISTENER.add_handler(file_handler)
+    return
+
+  file_handler.setFormatter(JsonLinesFormatter() if json_lines else root_logger.handlers[0].formatter)
 
   root_logger.addHandler(file_handler)
 
@@ -181,10 +519,226 @@ def ltlogs_dir() -> Path:
   return Path(os.getenv("LTLOGS_DIR", os.path.expanduser("~/Library/Logs/lt_logs")))
 
 
-def tail_log_file(file: str, *func_args):
-  if shutil.which('multitail'):
+class TailedFile(object):
+
+  def __init__(self, path: Path):
+    self.path = path
+    self.fh = None
+    self.inode: Optional[int] = None
+    self._partial_line = b""
+
+  def open(self, n_lines: int = 0, from_start: bool = False, include_partial_line: bool = False) -> List[str]:
+    try:
+      self.fh = open(self.path, "rb")
+    except FileNotFoundError:
+      return []
+
+    self.inode = os.fstat(self.fh.fileno()).st_ino
+    self._partial_line = b""
+    if from_start:
+      lines = self._read_available()
+      if include_partial_line:
+        lines.extend(self.read_partial_line())
+
+      return lines
+    elif n_lines > 0:
+      return read_last_lines(self.fh, n_lines, include_partial_line=include_partial_line)
+
+    self.fh.seek(0, os.SEEK_END)
+    return []
+
+  def close(self):
+    if self.fh is not None:
+      self.fh.close()
+      self.fh = None
+
+  def read_new_lines(self) -> List[str]:
+    if self.fh is None:
+      return self.open(from_start=True)
+
+    lines = self._read_available()
+    try:
+      stat = os.stat(self.path)
+    except FileNotFoundError:
+      return lines
+
+    if stat.st_ino != self.inode:
+      # rotated: the old handle was drained above, continue from the start of the new file
+      self.close()
+      lines.extend(self.open(from_start=True))
+    elif stat.st_size < self.fh.tell():
+      # truncated in place
+      self.fh.seek(0)
+      self._partial_line = b""
+      lines.extend(self._read_available())
+
+    return lines
+
+  def read_partial_line(self) -> List[str]:
+    partial_line = self._partial_line
+    self._partial_line = b""
+    return [partial_line.decode("utf-8", errors="replace")] if partial_line else []
+
+  def _read_available(self) -> List[str]:
+    data = self.fh.read()
+    if not data:
+      return []
+
+    lines = (self._partial_line + data).split(b"\n")
+    self._partial_line = lines.pop()
+    return [line.decode("utf-8", errors="replace") for line in lines]
+
+
+class _PollingChangeWaiter(object):
+
+  def wait(self, timeout: float):
+    time.sleep(timeout)
+
+  def close(self):
+    pass
+
+
+class _InotifyChangeWaiter(object):
+
+  def __init__(self, dirs: Sequence[Path]):
+    import ctypes
+    import ctypes.util
+    import select
+
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    if self.fd < 0:
+      raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    for watch_dir in dirs:
+      if libc.inotify_add_watch(self.fd, os.fsencode(watch_dir), LOG_TAIL_INOTIFY_MASK) < 0:
+        errno = ctypes.get_errno()
+        os.close(self.fd)
+        raise OSError(errno, "inotify_add_watch failed", watch_dir.as_posix())
+
+    # poll instead of select.select, which cannot handle fds >= FD_SETSIZE in processes with many open files
+    self._poller = select.poll()
+    self._poller.register(self.fd, select.POLLIN)
+
+  def wait(self, timeout: float):
+    if not self._poller.poll(timeout * 1000 if timeout is not None else None):
+      return
+
+    try:
+      while os.read(self.fd, LOG_TAIL_BLOCK_SIZE):
+        pass
+    except BlockingIOError:
+      pass
+
+  def close(self):
+    os.close(self.fd)
+
+
+def create_change_waiter(paths: Sequence[Path]):
+  if sys.platform.startswith("linux"):
+    dirs = sorted(set([path.absolute().parent for path in paths]))
+    try:
+      return _InotifyChangeWaiter(dirs)
+    except (AttributeError, OSError, TypeError):
+      logging.debug("inotify unavailable, falling back to polling for: %s", dirs)
+
+  return _PollingChangeWaiter()
+
+
+def read_last_lines(fh, n_lines: int, block_size: int = LOG_TAIL_BLOCK_SIZE, include_partial_line: bool = False) -> List[str]:
+  end = fh.seek(0, os.SEEK_END)
+  position = end
+  blocks: List[bytes] = []
+  newline_count = 0
+  while position > 0 and newline_count <= n_lines:
+    read_size = min(block_size, position)
+    position -= read_size
+    fh.seek(position)
+    block = fh.read(read_size)
+    blocks.append(block)
+    newline_count += block.count(b"\n")
+
+  data = b"".join(reversed(blocks))
+  fh.seek(end)
+  if data.endswith(b"\n"):
+    data = data[:-1]
+  elif data and not include_partial_line:
+    # the unterminated last line is returned when following picks up the rest of it
+    data, _, partial_line = data.rpartition(b"\n")
+    fh.seek(end - len(partial_line))
+
+  if not data:
+    return []
+
+  return [line.decode("utf-8", errors="replace") for line in data.split(b"\n")[-n_lines:]]
+
+
+def tail_files(
+  files: Sequence[Union[Path, str]],
+  n_lines: int = LOG_TAIL_DEFAULT_LINES,
+  follow: bool = True,
+  regexes: Sequence[Union[str, Pattern]] = None,
+  poll_interval: float = LOG_TAIL_POLL_INTERVAL,
+  stop_event: threading.Event = None,
+) -> Iterator[Tuple[Path, str]]:
+  from ltpylib import patterns
+
+  line_matcher = None
+  if regexes:
+    combined = patterns.combine_regexes(regexes)
+    if combined is not None:
+      line_matcher = combined.search
+    else:
+      compiled = [re.compile(regex) for regex in regexes]
+
+      def line_matcher(line: str) -> bool:
+        return any([regex.search(line) for regex in compiled])
+
+  tailed_files = [TailedFile(Path(file)) for file in files]
+  waiter = None
+  try:
+    for tailed_file in tailed_files:
+      for line in tailed_file.open(n_lines=n_lines, include_partial_line=not follow):
+        if line_matcher is None or line_matcher(line):
+          yield tailed_file.path, line
+
+    if not follow:
+      return
+
+    waiter = create_change_waiter([tailed_file.path for tailed_file in tailed_files])
+    while stop_event is None or not stop_event.is_set():
+      for tailed_file in tailed_files:
+        for line in tailed_file.read_new_lines():
+          if line_matcher is None or line_matcher(line):
+            yield tailed_file.path, line
+
+      waiter.wait(poll_interval)
+
+    # stopped while following, so emit any unterminated last lines that were still waiting for a newline
+    for tailed_file in tailed_files:
+      for line in tailed_file.read_new_lines() + tailed_file.read_partial_line():
+        if line_matcher is None or line_matcher(line):
+          yield tailed_file.path, line
+  finally:
+    if waiter is not None:
+      waiter.close()
+
+    for tailed_file in tailed_files:
+      tailed_file.close()
+
+
+def tail_file(file: Union[Path, str], **kwargs) -> Iterator[str]:
+  for _, line in tail_files([file], **kwargs):
+    yield line
+
+
+def tail_log_file(file: Union[Path, str, Sequence[Union[Path, str]]], *func_args):
+  log_files = [file] if isinstance(file, (str, Path)) else list(file)
+  if func_args and not shutil.which('multitail'):
+    logging.warning("multitail not found, ignoring multitail args: %s", " ".join(func_args))
+  elif func_args:
     log_cmd = ['multitail']
-    mt_conf = Path(os.getenv('DOTFILES') + '/multitail.conf')
+    mt_conf = Path(os.getenv('DOTFILES', '') + '/multitail.conf')
     if '-F' not in func_args and mt_conf.is_file():
       log_cmd.extend(['-F', mt_conf.as_posix()])
 
@@ -192,17 +746,19 @@ def tail_log_file(file: str, *func_args):
       log_cmd.extend(['-CS', 'l4j'])
 
     if '-n' not in func_args:
-      log_cmd.extend(['-n', '1500'])
-
-  else:
-    log_cmd = ['tail', '-1500f']
+      log_cmd.extend(['-n', str(LOG_TAIL_DEFAULT_LINES)])
 
-  if func_args:
     log_cmd.extend(func_args)
-
-  log_cmd.append(file)
-
-  subprocess.check_call(log_cmd, universal_newlines=True)
+    log_cmd.extend([Path(log_file).as_posix() for log_file in log_files])
+    subprocess.check_call(log_cmd, universal_newlines=True)
+    return
+
+  show_file_names = len(log_files) > 1
+  for path, line in tail_files(log_files):
+    if show_file_names:
+      print(f"[{path.name}] {line}", flush=True)
+    else:
+      print(line, flush=True)
 
 
 def _main():
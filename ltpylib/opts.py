@@ -135,12 +135,14 @@ class LoggingArgs(object):
 
   def __init__(self, args: argparse.Namespace):
     self.log_format: str = args.log_format
+    self.log_json: bool = args.log_json
     self.log_level: str = args.log_level
     self.quiet: bool = args.quiet
 
   @staticmethod
   def add_arguments_to_parser(arg_parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
     arg_parser.add_argument("--log-format")
+    arg_parser.add_argument("--log-json", action=STORE_TRUE)
     arg_parser.add_argument("--log-level")
     arg_parser.add_argument("--quiet", action=STORE_TRUE)
     return arg_parser
@@ -1,9 +1,10 @@
 #!/usr/bin/env python
+import contextlib
 import json
 import os
 import tempfile
 from pathlib import Path
-from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+from typing import Any, Callable, Dict, IO, Iterator, List, Optional, Sequence, Tuple, Union
 
 from ltpylib.collect import modify_list_of_dicts
 from ltpylib.common_types import TypeWithDictRepr
@@ -11,10 +12,18 @@ from ltpylib.dicts import convert_boolean_values_to_string, modify_dict_fields
 
 CUSTOM_JSON_DUMPERS: Dict[str, Tuple[Callable[[Any], Any], Optional[Callable[[Any], bool]]]] = {}
 
+DEFAULT_WRITE_CHUNK_SIZE = 64 * 1024
+DEFAULT_WRITE_MAX_LINE_CHUNKS = 4
+
 HAS_JQ: Optional[bool] = None
 
+JQ_COLORS_DEFAULT: Tuple[str, ...] = ("1;30", "0;39", "0;39", "0;39", "0;32", "1;39", "1;39", "34;1")
+JQ_COLORS: Optional[Tuple[str, ...]] = None
+
 PYGMENTS_DEFAULT_STYLE_ORDER = ["jq", "smyck", "vim", "solarized-light"]
 PYGMENTS_DEFAULT_STYLE: Optional[str] = None
+PYGMENTS_FORMATTERS: Dict[Tuple[str, bool], Any] = {}
+PYGMENTS_LEXERS: Dict[Tuple[str, bool], Any] = {}
 
 
 def default_pygments_style() -> str:
@@ -43,7 +52,16 @@ def find_pygments_style() -> str:
 
 
 def create_terminal_formatter(pygments_style: str):
-  if "256" in os.getenv("TERM", ""):
+  use_256 = "256" in os.getenv("TERM", "")
+  cache_key = (pygments_style, use_256)
+  if cache_key not in PYGMENTS_FORMATTERS:
+    PYGMENTS_FORMATTERS[cache_key] = _create_terminal_formatter(pygments_style, use_256)
+
+  return PYGMENTS_FORMATTERS[cache_key]
+
+
+def _create_terminal_formatter(pygments_style: str, use_256: bool):
+  if use_256:
     from pygments.formatters.terminal256 import Terminal256Formatter
 
     return Terminal256Formatter(style=pygments_style)
@@ -53,6 +71,19 @@ def create_terminal_formatter(pygments_style: str):
   return TerminalFormatter(style=pygments_style)
 
 
+def get_pygments_lexer(format_lang: str, preserve_newlines: bool = False):
+  cache_key = (format_lang, preserve_newlines)
+  if cache_key not in PYGMENTS_LEXERS:
+    from pygments.lexers import get_lexer_by_name
+
+    if preserve_newlines:
+      PYGMENTS_LEXERS[cache_key] = get_lexer_by_name(format_lang, stripnl=False, ensurenl=False)
+    else:
+      PYGMENTS_LEXERS[cache_key] = get_lexer_by_name(format_lang)
+
+  return PYGMENTS_LEXERS[cache_key]
+
+
 def has_jq() -> bool:
   global HAS_JQ
   if HAS_JQ is not None:
@@ -75,9 +106,24 @@ def colorize_json_jq(data: Union[str, dict, Sequence]) -> Optional[str]:
   return run_and_parse_output(["jq", "--sort-keys", "--color-output"], input=json_data, check=True)[1]
 
 
+def create_pygments_colorizer(format_lang: str, pygments_style: str = None) -> Callable[[str], str]:
+  from pygments import highlight
+
+  if not pygments_style:
+    pygments_style = find_pygments_style()
+
+  # chunks may start or end mid-line, so the lexer must neither strip nor append newlines
+  lexer = get_pygments_lexer(format_lang, preserve_newlines=True)
+  formatter = create_terminal_formatter(pygments_style)
+
+  def colorizer(string_data: str) -> str:
+    return highlight(string_data, lexer, formatter)
+
+  return colorizer
+
+
 def colorize_with_pygments(format_lang: str, prettifier: Callable, data: Union[str, dict, Sequence], pygments_style: str = None) -> Union[bytes, str]:
   from pygments import highlight
-  from pygments.lexers import get_lexer_by_name
 
   if not pygments_style:
     pygments_style = find_pygments_style()
@@ -91,24 +137,226 @@ def colorize_with_pygments(format_lang: str, prettifier: Callable, data: Union[s
 
   return highlight(
     string_data,
-    get_lexer_by_name(format_lang),
+    get_pygments_lexer(format_lang),
     create_terminal_formatter(pygments_style),
   )
 
 
-def colorize_json(data: Union[str, dict, Sequence], pygments_style: str = None, force_pygments: bool = False) -> Union[bytes, str]:
-  global HAS_JQ
-  if not force_pygments and pygments_style is None and HAS_JQ is not False:
-    if HAS_JQ is None:
-      try:
-        result = colorize_json_jq(data)
-        HAS_JQ = True
-        return result
-      except FileNotFoundError:
-        HAS_JQ = False
-
+def jq_colors() -> Tuple[str, ...]:
+  global JQ_COLORS
+
+  if JQ_COLORS is not None:
+    return JQ_COLORS
+
+  colors = list(JQ_COLORS_DEFAULT)
+  env_colors = os.getenv("JQ_COLORS")
+  if env_colors:
+    for idx, color in enumerate(env_colors.split(":")[:len(colors)]):
+      if color:
+        colors[idx] = color
+
+  JQ_COLORS = tuple(colors)
+  return JQ_COLORS
+
+
+class JsonColorizer(object):
+
+  def __init__(
+    self,
+    write: Callable[[str], Any],
+    indent: Union[int, str, None] = 2,
+    sort_keys: bool = True,
+    default: Callable[[Any], Any] = None,
+    colors: Sequence[str] = None,
+  ):
+    from json.encoder import encode_basestring_ascii
+
+    if colors is None:
+      colors = jq_colors()
+
+    if isinstance(indent, int):
+      indent = " " * indent
+
+    self.write = write
+    self.indent: Optional[str] = indent
+    self.sort_keys = sort_keys
+    self.default = default if default is not None else json_dump_default
+    self.encode_str = encode_basestring_ascii
+
+    reset = "\x1b[0m"
+    self.color_null = "\x1b[" + colors[0] + "m"
+    self.color_false = "\x1b[" + colors[1] + "m"
+    self.color_true = "\x1b[" + colors[2] + "m"
+    self.color_number = "\x1b[" + colors[3] + "m"
+    self.color_string = "\x1b[" + colors[4] + "m"
+    self.color_key = "\x1b[" + colors[7] + "m"
+    self.reset = reset
+
+    self.null_str = self.color_null + "null" + reset
+    self.false_str = self.color_false + "false" + reset
+    self.true_str = self.color_true + "true" + reset
+
+    array_color = "\x1b[" + colors[5] + "m"
+    object_color = "\x1b[" + colors[6] + "m"
+    self.array_empty = array_color + "[]" + reset
+    self.array_open = array_color + "[" + reset
+    self.array_close = array_color + "]" + reset
+    self.array_sep = array_color + "," + reset
+    self.object_empty = object_color + "{}" + reset
+    self.object_open = object_color + "{" + reset
+    self.object_close = object_color + "}" + reset
+    self.object_sep = object_color + "," + reset
+    self.key_sep = object_color + ":" + reset + ("" if indent is None else " ")
+
+  def colorize(self, obj: Any):
+    self._write_value(obj, 0)
+
+  def _newline(self, level: int) -> str:
+    if self.indent is None:
+      return ""
+
+    return "\n" + self.indent * level
+
+  def _key_to_str(self, key: Any) -> str:
+    if isinstance(key, str):
+      return key
+    elif key is True:
+      return "true"
+    elif key is False:
+      return "false"
+    elif key is None:
+      return "null"
+    elif isinstance(key, int):
+      return int.__repr__(key)
+    elif isinstance(key, float):
+      return self._float_to_str(key)
+
+    raise TypeError(f"keys must be str, int, float, bool or None, not {key.__class__.__name__}")
+
+  @staticmethod
+  def _float_to_str(val: float) -> str:
+    if val != val:
+      return "NaN"
+    elif val == float("inf"):
+      return "Infinity"
+    elif val == float("-inf"):
+      return "-Infinity"
+
+    return float.__repr__(val)
+
+  def _write_value(self, val: Any, level: int):
+    write = self.write
+
+    if isinstance(val, str):
+      write(self.color_string + self.encode_str(val) + self.reset)
+    elif val is None:
+      write(self.null_str)
+    elif val is True:
+      write(self.true_str)
+    elif val is False:
+      write(self.false_str)
+    elif isinstance(val, int):
+      write(self.color_number + int.__repr__(val) + self.reset)
+    elif isinstance(val, float):
+      write(self.color_number + self._float_to_str(val) + self.reset)
+    elif isinstance(val, dict):
+      self._write_dict(val, level)
+    elif isinstance(val, (list, tuple)):
+      self._write_list(val, level)
     else:
-      return colorize_json_jq(data)
+      self._write_value(self.default(val), level)
+
+  def _write_dict(self, val: dict, level: int):
+    write = self.write
+
+    if not val:
+      write(self.object_empty)
+      return
+
+    inner_newline = self._newline(level + 1)
+    items = sorted(val.items()) if self.sort_keys else val.items()
+
+    write(self.object_open)
+    first = True
+    for key, inner_val in items:
+      if first:
+        first = False
+      else:
+        write(self.object_sep)
+
+      write(inner_newline + self.color_key + self.encode_str(self._key_to_str(key)) + self.reset + self.key_sep)
+      self._write_value(inner_val, level + 1)
+
+    write(self._newline(level) + self.object_close)
+
+  def _write_list(self, val: Union[list, tuple], level: int):
+    write = self.write
+
+    if not val:
+      write(self.array_empty)
+      return
+
+    inner_newline = self._newline(level + 1)
+
+    write(self.array_open)
+    first = True
+    for inner_val in val:
+      if first:
+        first = False
+      else:
+        write(self.array_sep)
+
+      write(inner_newline)
+      self._write_value(inner_val, level + 1)
+
+    write(self._newline(level) + self.array_close)
+
+
+def colorize_json_native(
+  data: Any,
+  indent: Union[int, str, None] = 2,
+  sort_keys: bool = True,
+  parse_str: bool = True,
+) -> str:
+  if parse_str and isinstance(data, str):
+    # like jq, accept JSON lines and other whitespace separated documents
+    documents = list(iter_json_documents(data))
+    if len(documents) != 1:
+      return "\n".join([colorize_json_native(document, indent=indent, sort_keys=sort_keys, parse_str=False) for document in documents])
+
+    data = documents[0]
+
+  parts: List[str] = []
+  JsonColorizer(parts.append, indent=indent, sort_keys=sort_keys).colorize(data)
+  return "".join(parts)
+
+
+def iter_json_documents(data: str) -> Iterator[Any]:
+  decoder = json.JSONDecoder()
+  idx = 0
+  data_len = len(data)
+  while True:
+    while idx < data_len and data[idx].isspace():
+      idx += 1
+
+    if idx >= data_len:
+      return
+
+    document, idx = decoder.raw_decode(data, idx)
+    yield document
+
+
+def colorize_json(
+  data: Union[str, dict, Sequence],
+  pygments_style: str = None,
+  force_pygments: bool = False,
+  force_jq: bool = False,
+) -> Union[bytes, str]:
+  if force_jq:
+    return colorize_json_jq(data)
+
+  if not force_pygments and pygments_style is None:
+    return colorize_json_native(data)
 
   return colorize_with_pygments("json", prettify_json, data, pygments_style=pygments_style)
 
@@ -195,7 +443,10 @@ def prettify_json(
   if remove_nulls:
     obj = load_json_remove_nulls(json.dumps(obj, default=json_dump_default))
 
-  output = json.dumps(
+  if should_color(colorize=colorize, auto_color=auto_color):
+    return colorize_json_native(obj, indent=None if compact else '  ', parse_str=False)
+
+  return json.dumps(
     obj,
     sort_keys=True,
     indent=None if compact else '  ',
@@ -203,11 +454,6 @@ def prettify_json(
     default=json_dump_default,
   )
 
-  if should_color(colorize=colorize, auto_color=auto_color):
-    output = colorize_json(output)
-
-  return output
-
 
 def prettify_json_remove_nulls(obj) -> str:
   return prettify_json(obj, remove_nulls=True)
@@ -246,6 +492,203 @@ def prettify_yaml(obj, remove_nulls: bool = False, colorize: bool = False, auto_
   return output
 
 
+class ChunkedStreamWriter(object):
+
+  def __init__(
+    self,
+    stream: IO[str],
+    chunk_size: int = DEFAULT_WRITE_CHUNK_SIZE,
+    transform: Callable[[str], str] = None,
+    max_line_size: int = None,
+  ):
+    self.stream = stream
+    self.chunk_size = chunk_size
+    self.transform = transform
+    self.max_line_size = max_line_size if max_line_size is not None else chunk_size * DEFAULT_WRITE_MAX_LINE_CHUNKS
+    self._parts: List[str] = []
+    self._size: int = 0
+    self._partial_line_parts: List[str] = []
+    self._partial_line_size: int = 0
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, exc_tb):
+    if exc_type is None:
+      self.flush()
+
+  def write(self, data: str):
+    if self.transform is None:
+      self._parts.append(data)
+      self._size += len(data)
+    else:
+      # only transform complete lines so that tokens are never split between chunks, so keep the trailing partial line separate
+      last_newline = data.rfind("\n")
+      if last_newline < 0:
+        self._partial_line_parts.append(data)
+        self._partial_line_size += len(data)
+        if self._partial_line_size >= self.max_line_size:
+          # no line break in sight, so give up on token boundaries rather than buffering the whole payload
+          self._move_partial_line()
+      else:
+        self._move_partial_line()
+        self._parts.append(data[:last_newline + 1])
+        self._size += last_newline + 1
+        remainder = data[last_newline + 1:]
+        if remainder:
+          self._partial_line_parts.append(remainder)
+          self._partial_line_size = len(remainder)
+
+    if self._size >= self.chunk_size:
+      self._write_chunk()
+
+  def flush(self):
+    self._move_partial_line()
+    self._write_chunk()
+
+  def _move_partial_line(self):
+    if self._partial_line_parts:
+      self._parts.extend(self._partial_line_parts)
+      self._size += self._partial_line_size
+      self._partial_line_parts = []
+      self._partial_line_size = 0
+
+  def _write_chunk(self):
+    if not self._parts:
+      return
+
+    chunk = "".join(self._parts)
+    self._parts = []
+    self._size = 0
+
+    if self.transform is not None:
+      chunk = self.transform(chunk)
+
+    self.stream.write(chunk)
+    self.stream.flush()
+
+
+@contextlib.contextmanager
+def open_pager(pager: str = None) -> Iterator[IO[str]]:
+  import shlex
+  import subprocess
+
+  if not pager:
+    pager = os.getenv("PAGER", "less")
+
+  env = os.environ.copy()
+  env.setdefault("LESS", "FRX")
+
+  proc = subprocess.Popen(shlex.split(pager), stdin=subprocess.PIPE, universal_newlines=True, env=env)
+  try:
+    yield proc.stdin
+  except BrokenPipeError:
+    pass
+  finally:
+    try:
+      proc.stdin.close()
+    except BrokenPipeError:
+      pass
+
+    proc.wait()
+
+
+def write_pretty_json(
+  obj,
+  stream: IO[str] = None,
+  remove_nulls: bool = False,
+  colorize: bool = False,
+  auto_color: bool = False,
+  compact: bool = False,
+  pygments_style: str = None,
+  chunk_size: int = DEFAULT_WRITE_CHUNK_SIZE,
+):
+  import sys
+
+  if stream is None:
+    stream = sys.stdout
+
+  if remove_nulls:
+    obj = load_json_remove_nulls(json.dumps(obj, default=json_dump_default))
+
+  indent = None if compact else '  '
+  use_color = should_color(colorize=colorize, auto_color=auto_color)
+
+  if use_color and pygments_style is None:
+    with ChunkedStreamWriter(stream, chunk_size=chunk_size) as writer:
+      JsonColorizer(writer.write, indent=indent).colorize(obj)
+      writer.write("\n")
+
+    return
+
+  encoder = json.JSONEncoder(
+    sort_keys=True,
+    indent=indent,
+    separators=(",", ":") if compact else None,
+    default=json_dump_default,
+  )
+  transform = create_pygments_colorizer("json", pygments_style=pygments_style) if use_color else None
+  with ChunkedStreamWriter(stream, chunk_size=chunk_size, transform=transform) as writer:
+    for chunk in encoder.iterencode(obj):
+      writer.write(chunk)
+
+    writer.write("\n")
+
+
+def write_pretty_xml(
+  obj,
+  stream: IO[str] = None,
+  remove_nulls: bool = False,
+  colorize: bool = False,
+  auto_color: bool = False,
+  pygments_style: str = None,
+  chunk_size: int = DEFAULT_WRITE_CHUNK_SIZE,
+):
+  import sys
+  from xml.dom.minidom import parseString
+  from dicttoxml import dicttoxml
+
+  if stream is None:
+    stream = sys.stdout
+
+  if remove_nulls:
+    obj = load_json_remove_nulls(json.dumps(obj, default=json_dump_default))
+
+  transform = create_pygments_colorizer("xml", pygments_style=pygments_style) if should_color(colorize=colorize, auto_color=auto_color) else None
+  # dicttoxml and minidom build the whole document in memory first, so only the pretty printing and colorizing are chunked here
+  with ChunkedStreamWriter(stream, chunk_size=chunk_size, transform=transform) as writer:
+    parseString(dicttoxml(obj)).writexml(writer, "", "\t", "\n")
+
+
+def write_pretty_yaml(
+  obj,
+  stream: IO[str] = None,
+  remove_nulls: bool = False,
+  colorize: bool = False,
+  auto_color: bool = False,
+  sort_keys: bool = True,
+  pygments_style: str = None,
+  chunk_size: int = DEFAULT_WRITE_CHUNK_SIZE,
+):
+  import sys
+  import yaml
+
+  if stream is None:
+    stream = sys.stdout
+
+  if remove_nulls:
+    obj = load_json_remove_nulls(json.dumps(obj, default=json_dump_default))
+
+  transform = create_pygments_colorizer("yaml", pygments_style=pygments_style) if should_color(colorize=colorize, auto_color=auto_color) else None
+  with ChunkedStreamWriter(stream, chunk_size=chunk_size, transform=transform) as writer:
+    yaml.dump(
+      obj,
+      writer,
+      default_flow_style=False,
+      sort_keys=sort_keys,
+    )
+
+
 def prettify_sql(sql: str) -> str:
   from ltpylib.files import read_file, write_file
   from ltpylib.files_prettifier import prettify_sql_file
@@ -2,7 +2,9 @@
 # pylint: disable=C0111
 import re
 from pathlib import Path
-from typing import Callable, List, Match, Sequence, Union
+from typing import Callable, List, Match, Optional, Sequence, Union
+
+REGEX_BACKREFERENCE_REGEX = re.compile(r"\\[1-9]|\(\?P=")
 
 
 def join_by_regex_or(parts: Sequence[str]) -> str:
@@ -33,6 +35,22 @@ def replace_matches(
   return re.sub(search_string, replacement, content, flags=flags)
 
 
+def combine_regexes(regexes: Sequence[Union[str, re.Pattern]]) -> Optional[re.Pattern]:
+  compiled = [re.compile(regex) for regex in regexes]
+  if not compiled:
+    return None
+
+  flags = compiled[0].flags
+  if any([regex.flags != flags or REGEX_BACKREFERENCE_REGEX.search(regex.pattern) for regex in compiled]):
+    return None
+
+  try:
+    return re.compile("|".join(["(?:" + regex.pattern + ")" for regex in compiled]), flags=flags)
+  except re.error:
+    # e.g. inline global flags that are no longer leading, or a named group used in more than one pattern
+    return None
+
+
 def pull_matches_from_file(
   file: Union[str, Path],
   search_string: Union[str, re.Pattern],
@@ -1,13 +1,23 @@
 #!/usr/bin/env python
 import logging
+import os
 import re
 import subprocess
 import sys
+import threading
+import time
 from pathlib import Path
 from types import TracebackType
-from typing import Any, Callable, IO, Iterable, List, Optional, Tuple, Type, Union
+from typing import Any, Callable, Dict, IO, Iterable, Iterator, List, Optional, Pattern, Sequence, Tuple, Type, Union
 
 CMD_NO_QUOTES_NEEDED_REGEX = re.compile(r"^[a-zA-Z0-9_-]+$")
+PROC_OUTPUT_READ_SIZE = 64 * 1024
+PROC_STDERR_MAX_LINES = 200
+PROC_SNAPSHOT_CACHE: Tuple[float, List[Tuple[int, str]]] = (0.0, [])
+PROC_SNAPSHOT_CACHE_LOCK = threading.Lock()
+PROC_WAIT_POLL_INTERVAL = 0.01
+
+OutputLineCallback = Callable[[int, str, str], None]
 
 
 class CalledProcessErrorWithOutput(subprocess.CalledProcessError):
@@ -35,6 +45,26 @@ class CalledProcessErrorWithOutput(subprocess.CalledProcessError):
       return "Command '%s' returned non-zero exit status %d.%s" % (self.cmd, self.returncode, stdout_and_stderr)
 
 
+class CompletedProcessWithStats(subprocess.CompletedProcess):
+
+  def __init__(
+    self,
+    args,
+    returncode: Optional[int],
+    stdout: Optional[str] = None,
+    stderr: Optional[str] = None,
+    wall_time: float = None,
+    cpu_time: float = None,
+    max_rss: int = None,
+    timed_out: bool = False,
+  ):
+    super(CompletedProcessWithStats, self).__init__(args, returncode, stdout, stderr)
+    self.wall_time: Optional[float] = wall_time
+    self.cpu_time: Optional[float] = cpu_time
+    self.max_rss: Optional[int] = max_rss
+    self.timed_out: bool = timed_out
+
+
 def run_popen(
   *popenargs,
   cwd: Union[str, bytes, Path] = None,
@@ -106,11 +136,18 @@ def run_with_logging_output(
   level: int = logging.INFO,
   log_cmd: bool = False,
   log_cmd_level: int = logging.INFO,
+  log_prefix: str = None,
   **kwargs,
 ) -> subprocess.CompletedProcess:
   from ltpylib import logs
 
-  with logs.LogPipe(level=level) as log_pipe:
+  cmd = popenargs[0] if popenargs else kwargs.get("args")
+  try:
+    log_name = os.fsdecode(cmd) if isinstance(cmd, (str, bytes, os.PathLike)) else create_cmd_debug_string([os.fsdecode(part) for part in cmd])
+  except TypeError:
+    log_name = repr(cmd)
+
+  with logs.LogPipe(level=level, prefix=log_prefix, name=log_name) as log_pipe:
     return run(
       *popenargs,
       input=input,
@@ -213,15 +250,269 @@ def check_returncode_with_output(result: subprocess.CompletedProcess):
     raise CalledProcessErrorWithOutput(result.returncode, result.args, result.stdout, result.stderr)
 
 
-def get_procs_from_name(name_matcher: str) -> List[Tuple[int, str]]:
-  matched_procs = []
-  exit_code, output = run_and_parse_output(['pgrep', '-fl', name_matcher])
-  if exit_code > 0:
+def run_many(
+  commands: Sequence[Union[List[str], str]],
+  max_workers: int = None,
+  timeout: Optional[float] = None,
+  total_timeout: Optional[float] = None,
+  check: bool = False,
+  capture_output: bool = True,
+  on_line: OutputLineCallback = None,
+  log_output: bool = False,
+  log_level: int = logging.INFO,
+  cwd: Union[str, bytes, Path] = None,
+  shell: bool = False,
+  env: Dict[str, str] = None,
+) -> List[CompletedProcessWithStats]:
+  from concurrent import futures
+
+  if not commands:
+    return []
+
+  if max_workers is None:
+    max_workers = min(len(commands), (os.cpu_count() or 1) * 2)
+
+  total_deadline = time.monotonic() + total_timeout if total_timeout is not None else None
+
+  if log_output:
+    prefixes = [create_cmd_debug_string(cmd) if not isinstance(cmd, str) else cmd for cmd in commands]
+    user_on_line = on_line
+
+    def on_line(cmd_idx: int, stream_name: str, line: str):
+      logging.log(log_level, "[%s] %s", prefixes[cmd_idx], line.rstrip("\n"))
+      if user_on_line is not None:
+        user_on_line(cmd_idx, stream_name, line)
+
+  def run_command(cmd_idx: int) -> CompletedProcessWithStats:
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    if total_deadline is not None:
+      if time.monotonic() >= total_deadline:
+        return CompletedProcessWithStats(commands[cmd_idx], None, timed_out=True)
+
+      deadline = total_deadline if deadline is None else min(deadline, total_deadline)
+
+    return _run_streaming(cmd_idx, commands[cmd_idx], deadline, capture_output, on_line, cwd=cwd, shell=shell, env=env)
+
+  with futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="run_many") as pool:
+    results = list(pool.map(run_command, range(len(commands))))
+
+  if check:
+    for result in results:
+      if result.timed_out:
+        raise subprocess.TimeoutExpired(result.args, timeout if timeout is not None else total_timeout, output=result.stdout, stderr=result.stderr)
+
+      check_returncode_with_output(result)
+
+  return results
+
+
+def iter_output_lines(
+  cmd: Union[List[str], str],
+  timeout: Optional[float] = None,
+  check: bool = True,
+  stderr_max_lines: int = PROC_STDERR_MAX_LINES,
+  keep_newlines: bool = False,
+  cwd: Union[str, bytes, Path] = None,
+  shell: bool = False,
+  env: Dict[str, str] = None,
+  encoding: str = "utf-8",
+  errors: str = "replace",
+) -> Iterator[str]:
+  import collections
+
+  deadline = time.monotonic() + timeout if timeout is not None else None
+  stderr_lines = collections.deque(maxlen=stderr_max_lines)
+  proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd, shell=shell, env=env)
+  finished = False
+
+  with proc:
+    try:
+      for stream_name, line in _iter_proc_output_lines(proc, deadline=deadline, encoding=encoding, errors=errors):
+        if stream_name == "stderr":
+          stderr_lines.append(line)
+        elif keep_newlines:
+          yield line
+        else:
+          yield line[:-1] if line.endswith("\n") else line
+
+      _wait_with_rusage(proc, deadline=deadline)
+      finished = True
+    except subprocess.TimeoutExpired:
+      proc.kill()
+      proc.wait()
+      raise subprocess.TimeoutExpired(cmd, timeout, stderr="".join(stderr_lines))
+    finally:
+      if not finished and proc.poll() is None:
+        proc.kill()
+        proc.wait()
+
+  if check and proc.returncode:
+    raise CalledProcessErrorWithOutput(proc.returncode, cmd, stderr="".join(stderr_lines))
+
+
+def run_streaming(
+  cmd: Union[List[str], str],
+  timeout: Optional[float] = None,
+  capture_output: bool = True,
+  on_line: Callable[[str, str], None] = None,
+  **popen_kwargs,
+) -> CompletedProcessWithStats:
+  deadline = time.monotonic() + timeout if timeout is not None else None
+
+  def cmd_on_line(cmd_idx: int, stream_name: str, line: str):
+    on_line(stream_name, line)
+
+  result = _run_streaming(0, cmd, deadline, capture_output, cmd_on_line if on_line is not None else None, **popen_kwargs)
+  if result.timed_out:
+    raise subprocess.TimeoutExpired(cmd, timeout, output=result.stdout, stderr=result.stderr)
+
+  return result
+
+
+def _run_streaming(
+  cmd_idx: int,
+  cmd: Union[List[str], str],
+  deadline: Optional[float],
+  capture_output: bool,
+  on_line: Optional[OutputLineCallback],
+  **popen_kwargs,
+) -> CompletedProcessWithStats:
+  start_time = time.monotonic()
+  proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **popen_kwargs)
+  output: Dict[str, List[str]] = {"stdout": [], "stderr": []}
+  timed_out = False
+  rusage = None
+
+  with proc:
+    try:
+      for stream_name, line in _iter_proc_output_lines(proc, deadline=deadline):
+        if capture_output:
+          output[stream_name].append(line)
+
+        if on_line is not None:
+          on_line(cmd_idx, stream_name, line)
+
+      rusage = _wait_with_rusage(proc, deadline=deadline)
+    except subprocess.TimeoutExpired:
+      timed_out = True
+      proc.kill()
+      rusage = _wait_with_rusage(proc)
+
+  return CompletedProcessWithStats(
+    cmd,
+    proc.returncode,
+    stdout="".join(output["stdout"]) if capture_output else None,
+    stderr="".join(output["stderr"]) if capture_output else None,
+    wall_time=time.monotonic() - start_time,
+    cpu_time=(rusage.ru_utime + rusage.ru_stime) if rusage is not None else None,
+    max_rss=(rusage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)) if rusage is not None else None,
+    timed_out=timed_out,
+  )
+
+
+def _iter_proc_output_lines(
+  proc: subprocess.Popen,
+  deadline: float = None,
+  encoding: str = "utf-8",
+  errors: str = "replace",
+) -> Iterator[Tuple[str, str]]:
+  import codecs
+  import selectors
+
+  selector = selectors.DefaultSelector()
+  partial_lines: Dict[str, str] = {}
+  for stream_name, pipe in [("stdout", proc.stdout), ("stderr", proc.stderr)]:
+    if pipe is not None:
+      selector.register(pipe, selectors.EVENT_READ, (stream_name, codecs.getincrementaldecoder(encoding)(errors=errors)))
+      partial_lines[stream_name] = ""
+
+  try:
+    while selector.get_map():
+      select_timeout = None
+      if deadline is not None:
+        select_timeout = deadline - time.monotonic()
+        if select_timeout <= 0:
+          raise subprocess.TimeoutExpired(proc.args, select_timeout)
+
+      for key, _ in selector.select(select_timeout):
+        stream_name, decoder = key.data
+        data = os.read(key.fd, PROC_OUTPUT_READ_SIZE)
+        if not data:
+          selector.unregister(key.fileobj)
+          remaining = partial_lines[stream_name] + decoder.decode(b"", final=True)
+          if remaining:
+            yield stream_name, remaining
+          continue
+
+        lines = (partial_lines[stream_name] + decoder.decode(data)).split("\n")
+        partial_lines[stream_name] = lines.pop()
+        for line in lines:
+          yield stream_name, line + "\n"
+  finally:
+    selector.close()
+
+
+def _wait_with_rusage(proc: subprocess.Popen, deadline: float = None):
+  """
+  :rtype: Optional[resource.struct_rusage]
+  """
+  if not hasattr(os, "wait4"):
+    proc.wait(timeout=max(deadline - time.monotonic(), 0) if deadline is not None else None)
+    return None
+
+  while True:
+    pid, status, rusage = os.wait4(proc.pid, os.WNOHANG if deadline is not None else 0)
+    if pid:
+      proc.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+      return rusage
+
+    if time.monotonic() >= deadline:
+      raise subprocess.TimeoutExpired(proc.args, 0)
+
+    time.sleep(PROC_WAIT_POLL_INTERVAL)
+
+
+def get_proc_snapshot(max_age: float = 0) -> List[Tuple[int, str]]:
+  import psutil
+
+  global PROC_SNAPSHOT_CACHE
+
+  if max_age > 0:
+    created, snapshot = PROC_SNAPSHOT_CACHE
+    if time.monotonic() - created <= max_age:
+      return snapshot
+
+  snapshot = []
+  for proc in psutil.process_iter(attrs=["pid", "name", "cmdline"], ad_value=None):
+    info = proc.info
+    cmdline = info["cmdline"]
+    # same as pgrep -f, which falls back to the process name when there is no command line
+    snapshot.append((info["pid"], " ".join(cmdline) if cmdline else (info["name"] or "")))
+
+  with PROC_SNAPSHOT_CACHE_LOCK:
+    PROC_SNAPSHOT_CACHE = (time.monotonic(), snapshot)
+
+  return snapshot
+
+
+def get_procs_from_name(name_matcher: Union[str, Pattern], max_age: float = 0) -> List[Tuple[int, str]]:
+  return get_procs_from_names([name_matcher], max_age=max_age)[name_matcher]
+
+
+def get_procs_from_names(name_matchers: Sequence[Union[str, Pattern]], max_age: float = 0) -> Dict[Union[str, Pattern], List[Tuple[int, str]]]:
+  matched_procs: Dict[Union[str, Pattern], List[Tuple[int, str]]] = {name_matcher: [] for name_matcher in name_matchers}
+  if not matched_procs:
     return matched_procs
 
-  for line in output.splitlines():
-    parts = line.partition(' ')
-    matched_procs.append((int(parts[0]), parts[2]))
+  regexes = [(name_matcher, re.compile(name_matcher)) for name_matcher in matched_procs]
+  current_pid = os.getpid()
+  for pid, cmdline in get_proc_snapshot(max_age=max_age):
+    if pid == current_pid:
+      continue
+
+    for name_matcher, regex in regexes:
+      if regex.search(cmdline):
+        matched_procs[name_matcher].append((pid, cmdline))
 
   return matched_procs
 
@@ -293,36 +584,106 @@ def stop_proc_by_pid(pid: Any) -> bool:
   return True
 
 
-def await_termination(pid: int, timeout: int = 30, sleep_time: int = 1, log_level: int = 20):
+def wait_for_pids(pids: Sequence[int], timeout: Optional[float] = None) -> Tuple[List[int], List[int]]:
+  """
+  :return: (gone, alive)
+  """
+  import psutil
+
+  if hasattr(os, "pidfd_open"):
+    try:
+      return _wait_for_pidfds(pids, timeout=timeout)
+    except OSError:
+      pass
+
+  gone: List[int] = []
+  proc_list = []
+  for pid in pids:
+    try:
+      proc_list.append(psutil.Process(pid))
+    except psutil.NoSuchProcess:
+      gone.append(pid)
+
+  # psutil waits on non-child processes with an exponential backoff
+  gone_procs, alive_procs = psutil.wait_procs(proc_list, timeout=timeout)
+  gone.extend([proc.pid for proc in gone_procs])
+  return gone, [proc.pid for proc in alive_procs]
+
+
+def _wait_for_pidfds(pids: Sequence[int], timeout: Optional[float] = None) -> Tuple[List[int], List[int]]:
+  import selectors
+
+  deadline = time.monotonic() + timeout if timeout is not None else None
+  gone: List[int] = []
+  pids_by_fd: Dict[int, int] = {}
+  # a selector instead of select.select, which cannot handle fds >= FD_SETSIZE in processes with many open files
+  selector = selectors.DefaultSelector()
+  try:
+    for pid in pids:
+      try:
+        fd = os.pidfd_open(pid)
+      except ProcessLookupError:
+        gone.append(pid)
+        continue
+
+      pids_by_fd[fd] = pid
+      selector.register(fd, selectors.EVENT_READ)
+
+    while pids_by_fd:
+      remaining = max(deadline - time.monotonic(), 0) if deadline is not None else None
+      for key, _ in selector.select(remaining):
+        selector.unregister(key.fd)
+        gone.append(pids_by_fd.pop(key.fd))
+        os.close(key.fd)
+
+      if deadline is not None and time.monotonic() >= deadline:
+        break
+  finally:
+    selector.close()
+    for fd in pids_by_fd:
+      os.close(fd)
+
+  return gone, list(pids_by_fd.values())
+
+
+def await_termination(pid: Union[int, Sequence[int]], timeout: float = 30, sleep_time: float = 1, log_level: int = 20) -> bool:
   """
+  :param sleep_time: how often to log the status while waiting
   :param log_level: default is logging.INFO
-  :return: None
+  :return: True if every process exited before the timeout, False if any had to be killed
   """
-  import logging
   import psutil
-  from time import sleep
 
   if pid is None:
-    return
-
-  proc = psutil.Process(pid)
-  total_time = 0
-  while total_time <= timeout:
-    if proc.is_running():
-      logging.log(log_level, 'STATUS: loop %s seconds - process is still running, please wait...', total_time)
-    else:
+    return True
+
+  alive = [int(pid)] if isinstance(pid, (int, str)) else [int(val) for val in pid if val is not None]
+  start_time = time.monotonic()
+  deadline = start_time + timeout
+  while alive:
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
       break
 
-    total_time += sleep_time
-    sleep(sleep_time)
-
-  if proc.is_running():
-    logging.error('STATUS: Process still running after %s seconds, sending SIGKILL to terminate...', total_time)
-    proc.kill()
-    proc.wait(5)
-    logging.log(log_level, 'STATUS: Process killed.')
-  else:
-    logging.log(log_level, 'STATUS: Process successfully shutdown after %s seconds.', total_time)
+    _, alive = wait_for_pids(alive, timeout=min(sleep_time, remaining))
+    if alive:
+      logging.log(log_level, 'STATUS: loop %.0f seconds - %s still running, please wait...', time.monotonic() - start_time, alive)
+
+  total_time = time.monotonic() - start_time
+  if not alive:
+    logging.log(log_level, 'STATUS: Process successfully shutdown after %.2f seconds.', total_time)
+    return True
+
+  logging.error('STATUS: Process still running after %.0f seconds, sending SIGKILL to terminate: %s', total_time, alive)
+  for alive_pid in alive:
+    try:
+      psutil.Process(alive_pid).kill()
+    except psutil.NoSuchProcess:
+      pass
+
+  wait_for_pids(alive, timeout=5)
+  logging.log(log_level, 'STATUS: Process killed.')
+  return False
 
 
 orig_unraisablehook = None
@@ -2,16 +2,201 @@
 # PYTHON_ARGCOMPLETE_OK
 # pylint: disable=C0111
 import argparse
+import dataclasses
 import inspect
 import logging
 import psutil
 import shutil
 import subprocess
+import threading
+import time
 from pathlib import Path
-from typing import List, Tuple, Union
+from typing import Callable, Dict, IO, List, Optional, Sequence, Tuple, Union
 
 from ltpylib import files, logs, opts, procs
 
+BUILD_STEP_RESERVED_POPEN_KWARGS = ("stdin", "stdout", "stderr", "universal_newlines", "text", "encoding", "errors")
+BUILD_STEP_STATUS_FAILED = "failed"
+BUILD_STEP_STATUS_SKIPPED = "skipped"
+BUILD_STEP_STATUS_SUCCEEDED = "succeeded"
+
+PROC_GROUP_READY_POLL_INTERVAL = 0.1
+PROC_GROUP_SNAPSHOT_MAX_AGE = 1.0
+
+
+@dataclasses.dataclass
+class BuildStep:
+  name: str
+  cmd: Union[List[str], str]
+  depends_on: List[str] = dataclasses.field(default_factory=list)
+  popen_kwargs: dict = dataclasses.field(default_factory=dict)
+  status: Optional[str] = None
+  elapsed: Optional[float] = None
+  returncode: Optional[int] = None
+
+
+@dataclasses.dataclass
+class ReadinessCheck:
+  port: Optional[int] = None
+  host: str = "127.0.0.1"
+  log_regex: Optional[str] = None
+  timeout: float = 60.0
+
+  def is_port_open(self) -> bool:
+    import socket
+
+    try:
+      with socket.create_connection((self.host, self.port), timeout=PROC_GROUP_READY_POLL_INTERVAL):
+        return True
+    except OSError:
+      return False
+
+
+BuildCmd = Union[List[str], Tuple[Union[str, List[str]], dict], BuildStep]
+
+
+def create_build_steps(build_cmds: Sequence[BuildCmd]) -> List[BuildStep]:
+  steps: List[BuildStep] = []
+  previous_name = None
+  for idx, build_cmd_opt in enumerate(build_cmds):
+    if isinstance(build_cmd_opt, BuildStep):
+      step = dataclasses.replace(build_cmd_opt, depends_on=list(build_cmd_opt.depends_on), popen_kwargs=dict(build_cmd_opt.popen_kwargs))
+    elif isinstance(build_cmd_opt, tuple):
+      step = BuildStep(f"step{idx + 1}", build_cmd_opt[0], popen_kwargs=dict(build_cmd_opt[1]))
+    else:
+      step = BuildStep(f"step{idx + 1}", build_cmd_opt)
+
+    if not isinstance(build_cmd_opt, BuildStep) and previous_name is not None:
+      # plain commands keep running in the order they were listed
+      step.depends_on.append(previous_name)
+
+    # output is always streamed through pipes, so drop the kwargs that check_call accepted for redirecting it
+    step.popen_kwargs.pop("universal_newlines", None)
+    reserved = [key for key in BUILD_STEP_RESERVED_POPEN_KWARGS if step.popen_kwargs.pop(key, None) is not None]
+    if reserved:
+      logging.warning("Build step %s ignores Popen kwargs that conflict with output streaming: %s", step.name, reserved)
+
+    steps.append(step)
+    previous_name = step.name
+
+  names = set([step.name for step in steps])
+  if len(names) != len(steps):
+    raise ValueError("Build step names must be unique: %s" % [step.name for step in steps])
+
+  for step in steps:
+    missing = [dep for dep in step.depends_on if dep not in names]
+    if missing:
+      raise ValueError("Build step %s depends on unknown steps: %s" % (step.name, missing))
+
+  return steps
+
+
+def run_dependency_graph(
+  depends_on: Dict[str, Sequence[str]],
+  run_node: Callable[[str], bool],
+  max_workers: int = None,
+  thread_name_prefix: str = "dag",
+) -> Dict[str, Optional[bool]]:
+  """
+  :return: True if the node succeeded, False if it failed and None if it was skipped because a dependency failed
+  """
+  from concurrent import futures
+
+  for name, deps in depends_on.items():
+    missing = [dep for dep in deps if dep not in depends_on]
+    if missing:
+      raise ValueError("%s depends on unknown nodes: %s" % (name, missing))
+
+  # check for cycles up front so an invalid graph fails before anything runs
+  in_degree: Dict[str, int] = {name: len(set(deps)) for name, deps in depends_on.items()}
+  ready = [name for name, degree in in_degree.items() if degree == 0]
+  dependents: Dict[str, List[str]] = {name: [] for name in depends_on}
+  for name, deps in depends_on.items():
+    for dep in set(deps):
+      dependents[dep].append(name)
+
+  while ready:
+    for dependent_name in dependents[ready.pop()]:
+      in_degree[dependent_name] -= 1
+      if in_degree[dependent_name] == 0:
+        ready.append(dependent_name)
+
+  in_cycle = [name for name, degree in in_degree.items() if degree > 0]
+  if in_cycle:
+    raise ValueError("Dependency cycle between: %s" % in_cycle)
+
+  results: Dict[str, Optional[bool]] = {}
+  remaining_deps: Dict[str, set] = {name: set(deps) for name, deps in depends_on.items()}
+
+  def skip_dependents(name: str):
+    for dependent_name in dependents[name]:
+      if dependent_name not in results:
+        results[dependent_name] = None
+        skip_dependents(dependent_name)
+
+  with futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix) as pool:
+    running = {pool.submit(run_node, name): name for name, deps in remaining_deps.items() if not deps}
+    while running:
+      done, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+      for future in done:
+        name = running.pop(future)
+        results[name] = bool(future.result())
+        if not results[name]:
+          skip_dependents(name)
+          continue
+
+        for dependent_name in dependents[name]:
+          remaining_deps[dependent_name].discard(name)
+          if not remaining_deps[dependent_name] and dependent_name not in results:
+            running[pool.submit(run_node, dependent_name)] = dependent_name
+
+  return results
+
+
+def run_build_steps(steps: List[BuildStep], max_workers: int = None, log_output: IO[str] = None) -> List[BuildStep]:
+  steps_by_name: Dict[str, BuildStep] = {step.name: step for step in steps}
+  output_lock = threading.Lock()
+
+  def run_step(step_name: str) -> bool:
+    step = steps_by_name[step_name]
+    prefix = f"[{step.name}] "
+
+    def on_line(stream_name: str, line: str):
+      if log_output is not None:
+        with output_lock:
+          log_output.write(prefix + line if line.endswith("\n") else prefix + line + "\n")
+          log_output.flush()
+
+    start_time = time.monotonic()
+    try:
+      result = procs.run_streaming(step.cmd, capture_output=False, on_line=on_line, **step.popen_kwargs)
+      step.returncode = result.returncode
+      step.status = BUILD_STEP_STATUS_SUCCEEDED if result.returncode == 0 else BUILD_STEP_STATUS_FAILED
+    except Exception as e:
+      on_line("stderr", "%s: %s" % (e.__class__.__name__, e))
+      step.status = BUILD_STEP_STATUS_FAILED
+    finally:
+      step.elapsed = time.monotonic() - start_time
+
+    return step.status == BUILD_STEP_STATUS_SUCCEEDED
+
+  results = run_dependency_graph({step.name: step.depends_on for step in steps}, run_step, max_workers=max_workers, thread_name_prefix="build")
+  for step in steps:
+    if results[step.name] is None:
+      step.status = BUILD_STEP_STATUS_SKIPPED
+
+  return steps
+
+
+def log_build_steps_summary(steps: List[BuildStep], level: int = logging.INFO):
+  log_table(["step", "status", "elapsed"], [[step.name, step.status, "%.2fs" % step.elapsed if step.elapsed is not None else "-"] for step in steps], level=level)
+
+
+def log_table(headers: List[str], rows: List[List[str]], level: int = logging.INFO):
+  widths = [max([len(str(row[idx])) for row in rows] + [len(header)]) for idx, header in enumerate(headers)]
+  for row in [headers] + rows:
+    logging.log(level, "  ".join([str(val).ljust(width) for val, width in zip(row, widths)]).rstrip())
+
 
 class ProcessRunner(object):
 
@@ -19,7 +204,8 @@ class ProcessRunner(object):
     self,
     proc_id: str,
     start_cmd: List[str],
-    build_cmds: List[Union[List[str], Tuple[Union[str, List[str]], dict]]] = None,
+    build_cmds: List[BuildCmd] = None,
+    build_max_workers: int = None,
     force_build_before_start=None,
     log_file: str = None,
     log_multitail_args: List[str] = None,
@@ -34,6 +220,7 @@ class ProcessRunner(object):
     self.proc_id = proc_id
     self.start_cmd = start_cmd
     self.build_cmds = build_cmds
+    self.build_max_workers = build_max_workers
     self.force_build_before_start = force_build_before_start
     self.log_file = log_file or logs.ltlogs_dir().joinpath(f"{proc_id}.log").as_posix()
     self.log_multitail_args = log_multitail_args
@@ -42,9 +229,9 @@ class ProcessRunner(object):
     self.status_loop_wait_time = status_loop_wait_time
     self.status_loop_sleep_time = status_loop_sleep_time
 
-  def get_proc_pid(self) -> Union[int, None]:
+  def get_proc_pid(self, max_age: float = 0) -> Union[int, None]:
     if self.proc_name_matcher:
-      matched_procs = procs.get_procs_from_name(self.proc_name_matcher)
+      matched_procs = procs.get_procs_from_name(self.proc_name_matcher, max_age=max_age)
       if matched_procs:
         return matched_procs[0][0]
 
@@ -54,7 +241,7 @@ class ProcessRunner(object):
         return None
 
       pid = int(files.read_file(self.pid_file))
-      if psutil.pid_exists(pid):
+      if _is_pid_running(pid):
         return pid
 
       return None
@@ -74,15 +261,15 @@ class ProcessRunner(object):
     if not self.build_cmds:
       raise Exception('No build_cmds specified.')
 
-    for build_cmd_opt in self.build_cmds:
-      func_args = {'universal_newlines': True}
-      if isinstance(build_cmd_opt, tuple):
-        build_cmd = build_cmd_opt[0]
-        func_args.update(build_cmd_opt[1])
-      else:
-        build_cmd = build_cmd_opt
+    steps = create_build_steps(self.build_cmds)
+    Path(self.log_file).parent.mkdir(parents=True, exist_ok=True)
+    with open(self.log_file, 'a') as log_output:
+      run_build_steps(steps, max_workers=self.build_max_workers, log_output=log_output)
 
-      subprocess.check_call(build_cmd, **func_args)
+    log_build_steps_summary(steps)
+    for step in steps:
+      if step.status == BUILD_STEP_STATUS_FAILED:
+        raise procs.CalledProcessErrorWithOutput(step.returncode if step.returncode is not None else 1, step.cmd)
 
   def _await_termination(self, pid: int = None):
     if pid is None:
@@ -165,3 +352,170 @@ class ProcessRunner(object):
         exit(0)
     elif result is not None:
       logging.info('%s', result)
+
+
+class ProcessGroupRunner(object):
+
+  def __init__(
+    self,
+    runners: List[ProcessRunner],
+    depends_on: Dict[str, List[str]] = None,
+    readiness_checks: Dict[str, ReadinessCheck] = None,
+    max_workers: int = None,
+  ):
+    self.runners: Dict[str, ProcessRunner] = {runner.proc_id: runner for runner in runners}
+    for proc_id, deps in (depends_on or {}).items():
+      unknown = [unknown_id for unknown_id in [proc_id] + list(deps) if unknown_id not in self.runners]
+      if unknown:
+        raise ValueError("depends_on for %s references unknown proc_ids: %s" % (proc_id, unknown))
+
+    self.depends_on: Dict[str, List[str]] = {proc_id: list((depends_on or {}).get(proc_id, [])) for proc_id in self.runners}
+    self.readiness_checks: Dict[str, ReadinessCheck] = readiness_checks or {}
+    self.max_workers = max_workers
+
+  def start(self) -> bool:
+    self.stop()
+
+    def start_runner(proc_id: str) -> bool:
+      runner = self.runners[proc_id]
+      check = self.readiness_checks.get(proc_id)
+      log_tail = None
+      if check is not None and check.log_regex:
+        # positioned at the current end of the log so only lines from this start are matched
+        log_tail = logs.TailedFile(Path(runner.log_file))
+        log_tail.open()
+
+      try:
+        pid = runner.start()
+        return self._await_ready(runner, pid, log_tail)
+      except Exception:
+        logging.exception("Failed to start %s", proc_id)
+        return False
+      finally:
+        if log_tail is not None:
+          log_tail.close()
+
+    results = run_dependency_graph(self.depends_on, start_runner, max_workers=self.max_workers, thread_name_prefix="start")
+    self._log_results("start", results)
+    return all(results.values())
+
+  def stop(self) -> bool:
+    # dependents have to be stopped before the services they depend on
+    stop_depends_on: Dict[str, List[str]] = {proc_id: [] for proc_id in self.runners}
+    for proc_id, deps in self.depends_on.items():
+      for dep in deps:
+        stop_depends_on[dep].append(proc_id)
+
+    def stop_runner(proc_id: str) -> bool:
+      try:
+        self.runners[proc_id].stop()
+        return True
+      except Exception:
+        logging.exception("Failed to stop %s", proc_id)
+        return False
+
+    results = run_dependency_graph(stop_depends_on, stop_runner, max_workers=self.max_workers, thread_name_prefix="stop")
+    if not all(results.values()):
+      self._log_results("stop", results)
+
+    return all(results.values())
+
+  def restart(self) -> bool:
+    return self.start()
+
+  def status(self) -> bool:
+    from concurrent import futures
+
+    procs.get_proc_snapshot()
+
+    def runner_status(runner: ProcessRunner) -> List[str]:
+      pid = runner.get_proc_pid(max_age=PROC_GROUP_SNAPSHOT_MAX_AGE)
+      check = self.readiness_checks.get(runner.proc_id)
+      ready = "-"
+      if pid is not None and check is not None and check.port is not None:
+        ready = "yes" if check.is_port_open() else "no"
+
+      return [runner.proc_id, "running" if pid is not None else "stopped", str(pid) if pid is not None else "-", ready]
+
+    with futures.ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="status") as pool:
+      rows = list(pool.map(runner_status, self.runners.values()))
+
+    log_table(["proc_id", "status", "pid", "port_ready"], rows)
+    return all([row[1] == "running" for row in rows])
+
+  def _await_ready(self, runner: ProcessRunner, pid: Optional[int], log_tail: Optional[logs.TailedFile]) -> bool:
+    import re
+
+    proc_id = runner.proc_id
+    check = self.readiness_checks.get(proc_id)
+    if check is None:
+      # without a readiness check dependents are only ordered after this service was launched and found running
+      if self._resolve_running_pid(runner, pid) is None:
+        logging.error("%s exited right after starting.", proc_id)
+        return False
+
+      return True
+
+    start_time = time.monotonic()
+    deadline = start_time + check.timeout
+    log_regex = re.compile(check.log_regex) if check.log_regex else None
+    log_matched = log_regex is None
+    while True:
+      if not log_matched:
+        log_matched = any([log_regex.search(line) for line in log_tail.read_new_lines()])
+
+      if log_matched and (check.port is None or check.is_port_open()):
+        logging.info("%s is ready after %.2f seconds.", proc_id, time.monotonic() - start_time)
+        return True
+
+      pid = self._resolve_running_pid(runner, pid)
+      if pid is None:
+        logging.error("%s exited before becoming ready.", proc_id)
+        return False
+
+      if time.monotonic() >= deadline:
+        logging.error("%s was not ready after %s seconds.", proc_id, check.timeout)
+        return False
+
+      time.sleep(PROC_GROUP_READY_POLL_INTERVAL)
+
+  def _resolve_running_pid(self, runner: ProcessRunner, pid: Optional[int]) -> Optional[int]:
+    if _is_pid_running(pid):
+      return pid
+
+    # start_cmd may be a launcher that daemonizes and exits, so look the service up the way the runner does
+    if runner.proc_name_matcher or runner.pid_file:
+      resolved_pid = runner.get_proc_pid()
+      if resolved_pid is not None and resolved_pid != pid:
+        logging.debug("%s is running as pid %s after start_cmd pid %s exited.", runner.proc_id, resolved_pid, pid)
+
+      return resolved_pid
+
+    return None
+
+  def _log_results(self, action: str, results: Dict[str, Optional[bool]]):
+    statuses = {True: BUILD_STEP_STATUS_SUCCEEDED, False: BUILD_STEP_STATUS_FAILED, None: BUILD_STEP_STATUS_SKIPPED}
+    log_table(["proc_id", action], [[proc_id, statuses[results.get(proc_id)]] for proc_id in self.runners])
+
+  def _parse_args(self) -> argparse.Namespace:
+    arg_parser = opts.create_default_arg_parser()
+    arg_parser.add_argument('actions', choices=['restart', 'start', 'status', 'stop'], nargs='+')
+    return opts.parse_args_and_init_others(arg_parser)
+
+  def parse_and_run(self):
+    args = self._parse_args()
+    result = True
+    for cmd in args.actions:
+      result = getattr(self, cmd)()
+
+    exit(0 if result else 1)
+
+
+def _is_pid_running(pid: Optional[int]) -> bool:
+  if pid is None:
+    return False
+
+  try:
+    return psutil.Process(pid).status() != psutil.STATUS_ZOMBIE
+  except psutil.NoSuchProcess:
+    return False
@@ -1,15 +1,40 @@
 #!/usr/bin/env python
+import contextlib
 import dataclasses
+import itertools
+import json
 import re
+import sqlite3
 import textwrap
 from pathlib import Path
-from typing import Any, Dict, List, Union
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple, Union
 
-from ltpylib import files
+from ltpylib import files, patterns
 from ltpylib.numbers_util import convert_decimal_precision
 from ltpylib.output import dicts_to_csv, prettify_sql
 
 SQLITE_QUOTE_COL_REGEX = re.compile(r"[^a-zA-Z0-9_]")
+SQLITE_BULK_LOAD_PRAGMAS: Dict[str, Any] = {
+  "journal_mode": "MEMORY",
+  "synchronous": "OFF",
+  "cache_size": -256_000,
+}
+SQLITE_SCHEMA_SAMPLE_SIZE = 10_000
+SQLITE_NATIVE_TYPES = frozenset([str, int, float, bytes, type(None)])
+SQLITE_VALUE_TYPES_BY_CLASS: Dict[type, str] = {
+  bool: "INTEGER",
+  float: "REAL",
+  int: "INTEGER",
+  str: "TEXT",
+}
+SQLITE_VALUE_TYPE_WIDENING_RANKS: Dict[str, int] = {
+  "INTEGER": 0,
+  "REAL": 1,
+  "TEXT": 2,
+}
+SQLITE_VALUE_TYPE_WIDENING_MAX_RANK = max(SQLITE_VALUE_TYPE_WIDENING_RANKS.values())
+
+SQLiteDb = Union[sqlite3.Connection, Path, str]
 
 
 @dataclasses.dataclass
@@ -24,7 +49,7 @@ class SQLiteColumn:
 
   def create_col_name(self) -> str:
     name = self.name
-    if SQLITE_QUOTE_COL_REGEX.match(name):
+    if SQLITE_QUOTE_COL_REGEX.search(name):
       name = '"' + name + '"'
 
     return name
@@ -54,52 +79,90 @@ class SQLiteCreateTable:
   sql_cmd: str
   rows_as_csv: str = None
   csv_file: Path = None
+  rows_loaded: int = None
+  added_columns: List[SQLiteColumn] = None
+
+
+def sqlite_value_type(value: Any) -> str:
+  value_type = SQLITE_VALUE_TYPES_BY_CLASS.get(value.__class__)
+  if value_type is not None:
+    return value_type
+
+  if isinstance(value, int):
+    return "INTEGER"
+  elif isinstance(value, float):
+    return "REAL"
+
+  return "TEXT"
+
+
+def create_col_include_checker(ignore_cols: List[re.Pattern] = None, only_cols: List[str] = None) -> Callable[[str], bool]:
+  ignore_regex = patterns.combine_regexes(ignore_cols) if ignore_cols else None
+  only_cols_set = frozenset(only_cols) if only_cols else None
+  include_by_key: Dict[str, bool] = {}
+
+  def should_include(key: str) -> bool:
+    include = include_by_key.get(key)
+    if include is None:
+      if ignore_regex is not None:
+        include = ignore_regex.fullmatch(key) is None
+      else:
+        include = not ignore_cols or not any([regex.fullmatch(key) is not None for regex in ignore_cols])
+
+      if include and only_cols_set is not None:
+        include = key in only_cols_set
+
+      include_by_key[key] = include
+
+    return include
+
+  return should_include
 
 
 def add_sqlite_columns_from_dicts(
-  datas: List[Dict[str, Any]],
+  datas: Iterable[Dict[str, Any]],
   sqlite_cols: List[SQLiteColumn],
   ignore_cols: List[re.Pattern] = None,
   only_cols: List[str] = None,
 ) -> List[SQLiteColumn]:
   cols_by_name: Dict[str, SQLiteColumn] = {col.name: col for col in sqlite_cols}
-  existing = [col.name for col in sqlite_cols]
   has_nulls = set()
   add_cols: List[SQLiteColumn] = []
   attr_cols: List[SQLiteColumn] = []
+  should_include = create_col_include_checker(ignore_cols=ignore_cols, only_cols=only_cols)
+  type_ranks = SQLITE_VALUE_TYPE_WIDENING_RANKS
 
   for idx, data in enumerate(datas):
-    missing_existing_cols = list(cols_by_name.keys())
+    known_count = len(cols_by_name)
+    present_known_count = 0
 
     for key, value in data.items():
-      if key in missing_existing_cols:
-        missing_existing_cols.remove(key)
+      col = cols_by_name.get(key)
+      if col is not None:
+        present_known_count += 1
       elif idx > 0:
         has_nulls.add(key)
 
-      if ignore_cols and any([regex.fullmatch(key) is not None for regex in ignore_cols]):
-        continue
-      elif only_cols and key not in only_cols:
+      if not should_include(key):
         continue
 
       if value is None:
         has_nulls.add(key)
 
-        if key in cols_by_name:
-          cols_by_name.get(key).has_nulls = True
+        if col is not None:
+          col.has_nulls = True
 
         continue
-      elif key in existing:
-        continue
+      elif col is not None:
+        current_rank = type_ranks.get(col.value_type)
+        if current_rank is not None and current_rank < SQLITE_VALUE_TYPE_WIDENING_MAX_RANK:
+          value_type = sqlite_value_type(value)
+          if type_ranks[value_type] > current_rank:
+            col.value_type = value_type
 
-      existing.append(key)
-      value_type = "TEXT"
-      if isinstance(value, int):
-        value_type = "INTEGER"
-      elif isinstance(value, float):
-        value_type = "REAL"
+        continue
 
-      col = SQLiteColumn(name=key, value_type=value_type, has_nulls=(key in has_nulls))
+      col = SQLiteColumn(name=key, value_type=sqlite_value_type(value), has_nulls=(key in has_nulls))
       cols_by_name[col.name] = col
 
       if key.startswith("attr_"):
@@ -107,10 +170,11 @@ def add_sqlite_columns_from_dicts(
       else:
         add_cols.append(col)
 
-    if missing_existing_cols:
-      has_nulls.update(missing_existing_cols)
-      for col_name in missing_existing_cols:
-        cols_by_name.get(col_name).has_nulls = True
+    if present_known_count < known_count:
+      for col_name, col in cols_by_name.items():
+        if col_name not in data:
+          has_nulls.add(col_name)
+          col.has_nulls = True
 
   sqlite_cols.extend(sorted(add_cols, key=SQLiteColumn.col_sort))
   sqlite_cols.extend(sorted(attr_cols, key=SQLiteColumn.col_sort))
@@ -118,9 +182,29 @@ def add_sqlite_columns_from_dicts(
   return sqlite_cols
 
 
+def add_sqlite_columns_from_dicts_sample(
+  rows: Iterable[Dict[str, Any]],
+  sqlite_cols: List[SQLiteColumn],
+  ignore_cols: List[re.Pattern] = None,
+  only_cols: List[str] = None,
+  sample_size: int = SQLITE_SCHEMA_SAMPLE_SIZE,
+) -> Tuple[List[SQLiteColumn], Iterator[Dict[str, Any]]]:
+  rows = iter(rows)
+  sample = list(itertools.islice(rows, sample_size))
+  known_col_names = set([col.name for col in sqlite_cols])
+  add_sqlite_columns_from_dicts(sample, sqlite_cols, ignore_cols=ignore_cols, only_cols=only_cols)
+
+  # the schema is inferred from the sample only, so every inferred column has to allow nulls
+  for col in sqlite_cols:
+    if col.name not in known_col_names:
+      col.has_nulls = True
+
+  return sqlite_cols, itertools.chain(sample, rows)
+
+
 def sqlite_create_table_from_dicts(
   table_name: str,
-  rows: List[dict],
+  rows: Iterable[dict],
   existing_cols: List[SQLiteColumn] = None,
   primary_key: SQLiteColumn = None,
   ignore_cols: List[re.Pattern] = None,
@@ -129,39 +213,64 @@ def sqlite_create_table_from_dicts(
   load_file: Union[str, Path] = None,
   create_csv_from_rows: bool = True,
   create_csv_convert_booleans: bool = True,
+  db: SQLiteDb = None,
+  incremental: bool = False,
 ) -> SQLiteCreateTable:
   sqlite_cols: List[SQLiteColumn] = existing_cols.copy() if existing_cols else []
 
-  add_sqlite_columns_from_dicts(
-    rows,
-    sqlite_cols,
-    ignore_cols=ignore_cols,
-    only_cols=only_cols,
-  )
-
-  sql_cmd_parts = []
-
-  cols_sql_statements = [col.to_create_column() for col in sqlite_cols]
-
-  if primary_key:
-    cols_sql_statements.append(primary_key.to_primary_key())
+  if isinstance(rows, Sequence):
+    add_sqlite_columns_from_dicts(
+      rows,
+      sqlite_cols,
+      ignore_cols=ignore_cols,
+      only_cols=only_cols,
+    )
+  elif db is not None:
+    # stream the rows into the db, inferring the schema from a buffered sample
+    sqlite_cols, rows = add_sqlite_columns_from_dicts_sample(rows, sqlite_cols, ignore_cols=ignore_cols, only_cols=only_cols)
+  else:
+    rows = list(rows)
+    add_sqlite_columns_from_dicts(
+      rows,
+      sqlite_cols,
+      ignore_cols=ignore_cols,
+      only_cols=only_cols,
+    )
 
-  if additional_table_config:
-    cols_sql_statements.extend(additional_table_config)
+  if incremental:
+    if db is None:
+      raise ValueError("db is required when incremental is enabled")
 
-  cols_sql = ",\n  ".join(cols_sql_statements)
+    return sqlite_upsert_table_from_dicts(
+      db,
+      table_name,
+      rows,
+      primary_key,
+      sqlite_cols=sqlite_cols,
+      additional_table_config=additional_table_config,
+      convert_booleans=create_csv_convert_booleans,
+    )
 
-  drop_create_sql = prettify_sql(textwrap.dedent(f"""\
-    DROP TABLE IF EXISTS {table_name}
-    ;
+  drop_create_sql = create_drop_and_create_table_sql(
+    table_name,
+    sqlite_cols,
+    primary_key=primary_key,
+    additional_table_config=additional_table_config,
+  )
 
-    CREATE TABLE {table_name} (
-      {cols_sql}
+  if db is not None:
+    rows_loaded = sqlite_load_table_from_dicts(
+      db,
+      table_name,
+      rows,
+      sqlite_cols,
+      primary_key=primary_key,
+      additional_table_config=additional_table_config,
+      convert_booleans=create_csv_convert_booleans,
     )
-    ;
-  """.rstrip()))
+    return SQLiteCreateTable(columns=sqlite_cols, sql_cmd=drop_create_sql, rows_loaded=rows_loaded)
 
-  sql_cmd_parts.append(drop_create_sql)
+  sql_cmd_parts = [prettify_sql(drop_create_sql)]
 
   if load_file:
     if isinstance(load_file, Path):
@@ -212,6 +321,231 @@ def sqlite_create_table_from_dicts(
   return result
 
 
+def create_drop_and_create_table_statements(
+  table_name: str,
+  sqlite_cols: List[SQLiteColumn],
+  primary_key: SQLiteColumn = None,
+  additional_table_config: List[str] = None,
+) -> List[str]:
+  cols_sql_statements = [col.to_create_column() for col in sqlite_cols]
+
+  if primary_key:
+    cols_sql_statements.append(primary_key.to_primary_key())
+
+  if additional_table_config:
+    cols_sql_statements.extend(additional_table_config)
+
+  cols_sql = ",\n  ".join(cols_sql_statements)
+
+  return [
+    f"DROP TABLE IF EXISTS {table_name}",
+    f"CREATE TABLE {table_name} (\n  {cols_sql}\n)",
+  ]
+
+
+def create_drop_and_create_table_sql(
+  table_name: str,
+  sqlite_cols: List[SQLiteColumn],
+  primary_key: SQLiteColumn = None,
+  additional_table_config: List[str] = None,
+) -> str:
+  statements = create_drop_and_create_table_statements(table_name, sqlite_cols, primary_key=primary_key, additional_table_config=additional_table_config)
+  return "\n\n".join([statement + ";" for statement in statements])
+
+
+def create_insert_sql(table_name: str, sqlite_cols: List[SQLiteColumn]) -> str:
+  col_names = ", ".join([col.create_col_name() for col in sqlite_cols])
+  placeholders = ", ".join(["?"] * len(sqlite_cols))
+  return f"INSERT INTO {table_name} ({col_names}) VALUES ({placeholders})"
+
+
+def convert_value_for_sqlite(value: Any, convert_booleans: bool = True) -> Any:
+  if value.__class__ in SQLITE_NATIVE_TYPES:
+    return value
+  elif isinstance(value, bool):
+    if convert_booleans:
+      return "TRUE" if value else "FALSE"
+
+    return int(value)
+  elif isinstance(value, (dict, list, tuple)):
+    from ltpylib.output import json_dump_default
+
+    return json.dumps(value, default=json_dump_default)
+  elif isinstance(value, (int, float, str)):
+    return value
+
+  return str(value)
+
+
+def iter_sqlite_row_values(
+  rows: Iterable[dict],
+  col_names: List[str],
+  convert_booleans: bool = True,
+  blank_to_null_col_names: Sequence[str] = None,
+) -> Iterable[Tuple[Any, ...]]:
+  native_types = SQLITE_NATIVE_TYPES
+  blank_to_null_col_names = frozenset(blank_to_null_col_names or [])
+  blank_to_null_idxs = [idx for idx, col_name in enumerate(col_names) if col_name in blank_to_null_col_names]
+  for row in rows:
+    values = [row.get(col_name) for col_name in col_names]
+    for idx, value in enumerate(values):
+      if value.__class__ not in native_types:
+        values[idx] = convert_value_for_sqlite(value, convert_booleans=convert_booleans)
+
+    for idx in blank_to_null_idxs:
+      if values[idx] == "":
+        values[idx] = None
+
+    yield tuple(values)
+
+
+def set_sqlite_pragmas(db_conn: sqlite3.Connection, pragmas: Dict[str, Any]) -> Dict[str, Any]:
+  previous: Dict[str, Any] = {}
+  for pragma, value in pragmas.items():
+    previous[pragma] = db_conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+    db_conn.execute(f"PRAGMA {pragma} = {value}")
+
+  return previous
+
+
+@contextlib.contextmanager
+def sqlite_bulk_load_transaction(db: SQLiteDb, pragmas: Dict[str, Any] = None) -> Iterator[sqlite3.Connection]:
+  if pragmas is None:
+    pragmas = SQLITE_BULK_LOAD_PRAGMAS
+
+  if isinstance(db, sqlite3.Connection) and db.in_transaction:
+    raise ValueError("SQLite connection has an uncommitted transaction, commit or roll it back before bulk loading")
+
+  db_conn = db if isinstance(db, sqlite3.Connection) else sqlite3.connect(db)
+  try:
+    previous_pragmas = set_sqlite_pragmas(db_conn, pragmas)
+    try:
+      db_conn.execute("BEGIN")
+      try:
+        yield db_conn
+        db_conn.commit()
+      except BaseException:
+        db_conn.rollback()
+        raise
+    finally:
+      set_sqlite_pragmas(db_conn, previous_pragmas)
+  finally:
+    if db_conn is not db:
+      db_conn.close()
+
+
+def sqlite_load_table_from_dicts(
+  db: SQLiteDb,
+  table_name: str,
+  rows: Iterable[dict],
+  sqlite_cols: List[SQLiteColumn] = None,
+  primary_key: SQLiteColumn = None,
+  ignore_cols: List[re.Pattern] = None,
+  only_cols: List[str] = None,
+  additional_table_config: List[str] = None,
+  convert_booleans: bool = True,
+  pragmas: Dict[str, Any] = None,
+) -> int:
+  if sqlite_cols is None:
+    rows = list(rows)
+    sqlite_cols = add_sqlite_columns_from_dicts(rows, [], ignore_cols=ignore_cols, only_cols=only_cols)
+
+  with sqlite_bulk_load_transaction(db, pragmas=pragmas) as db_conn:
+    for statement in create_drop_and_create_table_statements(table_name, sqlite_cols, primary_key=primary_key, additional_table_config=additional_table_config):
+      db_conn.execute(statement)
+
+    # matches the CSV load, which sets blanks to NULL in nullable columns after importing
+    cursor = db_conn.executemany(
+      create_insert_sql(table_name, sqlite_cols),
+      iter_sqlite_row_values(
+        rows,
+        [col.name for col in sqlite_cols],
+        convert_booleans=convert_booleans,
+        blank_to_null_col_names=[col.name for col in sqlite_cols if col.has_nulls],
+      ),
+    )
+    return cursor.rowcount
+
+
+def sqlite_table_columns(db_conn: sqlite3.Connection, table_name: str) -> List[SQLiteColumn]:
+  cursor = db_conn.cursor()
+  cursor.row_factory = None
+  table_info = cursor.execute(f"PRAGMA table_info({table_name})").fetchall()
+  return [SQLiteColumn(name=info[1], value_type=info[2], has_nulls=not info[3]) for info in table_info]
+
+
+def create_add_column_statements(table_name: str, sqlite_cols: List[SQLiteColumn]) -> List[str]:
+  return [f"ALTER TABLE {table_name} ADD COLUMN {col.create_col_name()} {col.value_type}" for col in sqlite_cols]
+
+
+def create_upsert_sql(table_name: str, sqlite_cols: List[SQLiteColumn], primary_key: SQLiteColumn) -> str:
+  insert_sql = create_insert_sql(table_name, sqlite_cols)
+  pk_col_name = primary_key.create_col_name()
+  update_col_names = [col.create_col_name() for col in sqlite_cols if col.name != primary_key.name]
+  if not update_col_names:
+    return f"{insert_sql} ON CONFLICT ({pk_col_name}) DO NOTHING"
+
+  set_sql = ", ".join([f"{col_name} = excluded.{col_name}" for col_name in update_col_names])
+  changed_sql = " OR ".join([f"{table_name}.{col_name} IS NOT excluded.{col_name}" for col_name in update_col_names])
+  return f"{insert_sql} ON CONFLICT ({pk_col_name}) DO UPDATE SET {set_sql} WHERE {changed_sql}"
+
+
+def sqlite_upsert_table_from_dicts(
+  db: SQLiteDb,
+  table_name: str,
+  rows: Iterable[dict],
+  primary_key: SQLiteColumn,
+  sqlite_cols: List[SQLiteColumn] = None,
+  ignore_cols: List[re.Pattern] = None,
+  only_cols: List[str] = None,
+  additional_table_config: List[str] = None,
+  convert_booleans: bool = True,
+  pragmas: Dict[str, Any] = None,
+) -> SQLiteCreateTable:
+  if primary_key is None:
+    raise ValueError("primary_key is required to upsert rows into table: %s" % table_name)
+
+  if sqlite_cols is None:
+    rows = list(rows)
+    sqlite_cols = add_sqlite_columns_from_dicts(rows, [], ignore_cols=ignore_cols, only_cols=only_cols)
+
+  with sqlite_bulk_load_transaction(db, pragmas=pragmas) as db_conn:
+    existing_cols = sqlite_table_columns(db_conn, table_name)
+    if existing_cols:
+      existing_col_names = set([col.name for col in existing_cols])
+      new_cols = [col for col in sqlite_cols if col.name not in existing_col_names]
+      statements = create_add_column_statements(table_name, new_cols)
+      table_cols = existing_cols + new_cols
+    else:
+      # later snapshots may be missing fields, so only the primary key is created as NOT NULL
+      new_cols = [dataclasses.replace(col, has_nulls=(col.name != primary_key.name)) for col in sqlite_cols]
+      statements = create_drop_and_create_table_statements(table_name, new_cols, primary_key=primary_key, additional_table_config=additional_table_config)[1:]
+      table_cols = new_cols
+
+    for statement in statements:
+      db_conn.execute(statement)
+
+    load_col_names = set([col.name for col in sqlite_cols])
+    load_cols = [col for col in table_cols if col.name in load_col_names]
+    upsert_sql = create_upsert_sql(table_name, load_cols, primary_key)
+    cursor = db_conn.executemany(
+      upsert_sql,
+      iter_sqlite_row_values(
+        rows,
+        [col.name for col in load_cols],
+        convert_booleans=convert_booleans,
+        blank_to_null_col_names=[col.name for col in load_cols if col.has_nulls],
+      ),
+    )
+
+    return SQLiteCreateTable(
+      columns=table_cols,
+      sql_cmd="\n\n".join([statement + ";" for statement in statements + [upsert_sql]]),
+      rows_loaded=cursor.rowcount,
+      added_columns=new_cols,
+    )
+
+
 def sqlite_vacuum(db_file: Path):
   from ltpylib.procs import run_with_regular_stdout
 
@@ -1,9 +1,12 @@
 #!/usr/bin/env python
 # pylint: disable=C0111
 
+import functools
 import re
 import urllib.parse as urllib_parse
-from typing import Callable, List, Union
+from typing import Any, Callable, Dict, List, Union
+
+from ltpylib import strings
 
 StrConverter = Callable[[str], str]
 
@@ -68,6 +71,23 @@ def to_snake_case(val: str, sep: str = None) -> str:
   return "_".join(val.lower().split())
 
 
+@functools.lru_cache(maxsize=strings.CASE_CONVERSION_CACHE_SIZE)
+def to_camel_case_cached(val: str, sep: str = None) -> str:
+  return to_camel_case(val, sep=sep)
+
+
+def case_conversion_cache_info() -> Dict[str, Any]:
+  return {
+    "strconverters.to_camel_case": to_camel_case_cached.cache_info(),
+    "strings.to_snake_case": strings.to_snake_case_cached.cache_info(),
+  }
+
+
+def clear_case_conversion_caches():
+  to_camel_case_cached.cache_clear()
+  strings.to_snake_case_cached.cache_clear()
+
+
 def find_sep_char(val: str) -> str:
   if val.count(" ") > 0:
     return " "
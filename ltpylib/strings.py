@@ -1,7 +1,10 @@
 #!/usr/bin/env python
+import functools
 import re
 from decimal import Decimal
-from typing import List, Match, Optional, Union
+from typing import List, Mapping, Match, Optional, Union
+
+CASE_CONVERSION_CACHE_SIZE = 4096
 
 BOOLEAN_STRINGS_FALSE = frozenset([
   "no",
@@ -13,7 +16,20 @@ BOOLEAN_STRINGS_TRUE = frozenset([
   "y",
   "true",
 ])
+BOOLEAN_STRINGS_LOOKUP = {
+  **{
+    val: False
+    for val in BOOLEAN_STRINGS_FALSE
+  },
+  **{
+    val: True
+    for val in BOOLEAN_STRINGS_TRUE
+  },
+}
+BOOLEAN_STRINGS_MAX_LENGTH = max(len(val) for val in BOOLEAN_STRINGS_LOOKUP)
+NUMBER_FIRST_CHARS = frozenset("0123456789-.,")
 
+ENV_VAR_REFERENCE_REGEX = re.compile(r"\$(\w+|\{[^}]*\})", re.ASCII)
 CAMEL_CASE_CAP_CHARS_REGEX = re.compile(r"(?<=[a-z])([A-Z0-9])|(?<=[^0-9])([A-Z])(?=[a-z])")
 CASE_CONVERSION_IGNORE_REGEX = re.compile(r"[']")
 MULTI_SPACE_REGEX = re.compile(r"\s+")
@@ -104,6 +120,25 @@ def convert_human_size_to_number(val: str, in_unit: str = None) -> Optional[floa
   return None
 
 
+def expand_env_vars(val: str, env: Mapping[str, str] = None) -> str:
+  if "$" not in val:
+    return val
+
+  if env is None:
+    import os
+
+    env = os.environ
+
+  def replace_env_var(match: Match) -> str:
+    name = match.group(1)
+    if name.startswith("{") and name.endswith("}"):
+      name = name[1:-1]
+
+    return env.get(name, match.group(0))
+
+  return ENV_VAR_REFERENCE_REGEX.sub(replace_env_var, val)
+
+
 def is_boolean(val: str) -> bool:
   if not val:
     return False
@@ -131,6 +166,43 @@ def is_number(val: str, allow_comma: bool = False) -> bool:
   return False
 
 
+def parse_boolean(val: str) -> Optional[bool]:
+  if not val or len(val) > BOOLEAN_STRINGS_MAX_LENGTH:
+    return None
+
+  return BOOLEAN_STRINGS_LOOKUP.get(val.lower())
+
+
+def parse_number(val: str, use_decimal: bool = False, allow_comma: bool = True) -> Union[int, float, Decimal, None]:
+  if not val or val[0] not in NUMBER_FIRST_CHARS:
+    return None
+
+  if "," in val:
+    if not allow_comma or val[0] == "-":
+      return None
+
+    val = val.replace(",", "")
+
+  digits = val
+  is_float = "." in digits
+  if is_float:
+    digits = digits.replace(".", "", 1)
+
+  if digits[:1] == "-":
+    digits = digits[1:]
+
+  if not digits.isdigit():
+    return None
+
+  try:
+    if is_float:
+      return Decimal(val) if use_decimal else float(val)
+
+    return int(val)
+  except ValueError:
+    return None
+
+
 def maybe_json_string(val: str) -> bool:
   if not val:
     return False
@@ -183,6 +255,11 @@ def to_snake_case(val: str) -> str:
   return MULTI_SPACE_REGEX.sub("_", val.lower().strip())
 
 
+@functools.lru_cache(maxsize=CASE_CONVERSION_CACHE_SIZE)
+def to_snake_case_cached(val: str) -> str:
+  return to_snake_case(val)
+
+
 def truncate_if_needed(val: str, max_length: int, include_ellipsis: bool = True) -> str:
   if val and len(val) > max_length:
     return (val[:max_length] + "..") if include_ellipsis else val[:max_length]
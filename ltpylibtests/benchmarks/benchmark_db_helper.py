@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+import argparse
+import logging
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+from ltpylib import db_helper
+
+
+def enumerate_description_row_factory(cursor: sqlite3.Cursor, row) -> Dict[str, Any]:
+  row_as_dict = {}
+  for idx, col in enumerate(cursor.description):
+    row_as_dict[col[0]] = row[idx]
+  return row_as_dict
+
+
+def create_db(db_file: Path, row_count: int):
+  db_conn = sqlite3.connect(db_file)
+  db_conn.execute("CREATE TABLE issues (id INTEGER, key TEXT, points INTEGER, ratio REAL, summary TEXT, status TEXT)")
+  db_conn.executemany(
+    "INSERT INTO issues VALUES (?, ?, ?, ?, ?, ?)",
+    ((num, f"PROJ-{num}", num % 13, num / 7.0, f"Issue summary {num}", "Done") for num in range(row_count)),
+  )
+  db_conn.commit()
+  db_conn.close()
+
+
+def scan(db_conn: sqlite3.Connection) -> int:
+  count = 0
+  for _ in db_conn.execute("SELECT * FROM issues"):
+    count += 1
+
+  return count
+
+
+def main():
+  logging.basicConfig(level=logging.INFO, format="%(message)s")
+  arg_parser = argparse.ArgumentParser()
+  arg_parser.add_argument("--rows", type=int, default=2_000_000)
+  args = arg_parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    db_file = Path(tmp_dir).joinpath("benchmark.db")
+    create_db(db_file, args.rows)
+
+    factories = [
+      ("enumerate description (previous)", dict(use_row_factory_as_dict=False)),
+      ("sqlite_row_factory_as_dict", dict()),
+      ("sqlite3.Row", dict(use_sqlite_row=True)),
+      (
+        "sqlite_row_factory_as_dict + pool pragmas",
+        dict(journal_mode="WAL", mmap_size=db_helper.SQLITE_POOL_DEFAULT_MMAP_SIZE, cache_size=db_helper.SQLITE_POOL_DEFAULT_CACHE_SIZE)
+      ),
+    ]
+    for name, kwargs in factories:
+      db_conn = db_helper.create_sqlite_connection(db_file, **kwargs)
+      if name.endswith("(previous)"):
+        db_conn.row_factory = enumerate_description_row_factory
+
+      start_time = time.perf_counter()
+      count = scan(db_conn)
+      logging.info("%-45s rows=%s elapsed=%.3fs", name, count, time.perf_counter() - start_time)
+      db_conn.close()
+
+
+if __name__ == "__main__":
+  main()
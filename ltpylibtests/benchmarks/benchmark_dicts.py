@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+import copy
+import logging
+
+from ltpylib import dicts
+from ltpylibtests.benchmarks.benchmark_utils import create_csv_rows, create_payloads, run_benchmark
+
+
+def main():
+  logging.basicConfig(level=logging.INFO, format="%(message)s")
+  payloads = create_payloads()
+
+  def create_input():
+    return copy.deepcopy(payloads)
+
+  run_benchmark("convert_keys_to_snake_case(recursive=True)", lambda data: dicts.convert_keys_to_snake_case(data, recursive=True), create_input)
+  run_benchmark("convert_boolean_values_to_string", dicts.convert_boolean_values_to_string, create_input)
+  run_benchmark("convert_string_values_to_correct_type(recursive=True)", lambda data: dicts.convert_string_values_to_correct_type(data, recursive=True), create_input)
+
+  csv_rows = create_csv_rows()
+
+  def create_csv_input():
+    return [row.copy() for row in csv_rows]
+
+  run_benchmark("convert_string_values_to_correct_type(csv rows)", dicts.convert_string_values_to_correct_type, create_csv_input)
+  run_benchmark("convert_string_values_to_correct_type_by_column", dicts.convert_string_values_to_correct_type_by_column, create_csv_input)
+
+
+if __name__ == "__main__":
+  main()
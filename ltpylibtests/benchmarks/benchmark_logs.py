@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+import argparse
+import io
+import logging
+import time
+
+from ltpylib import logs
+
+
+def create_records(count: int):
+  records = []
+  for num in range(count):
+    record = logging.LogRecord("ltpylib.benchmark", logging.INFO, __file__, num, "processed issue %s in %.3fs", (f"PROJ-{num}", num / 1000.0), None)
+    record.log_source = "benchmark"
+    records.append(record)
+
+  return records
+
+
+def main():
+  logging.basicConfig(level=logging.INFO, format="%(message)s")
+  arg_parser = argparse.ArgumentParser()
+  arg_parser.add_argument("--records", type=int, default=500_000)
+  args = arg_parser.parse_args()
+
+  formatters = [
+    ("text " + logs.DEFAULT_LOG_FORMAT, logs.create_log_formatter(logs.DEFAULT_LOG_FORMAT)),
+    ("text " + logs.LOG_FORMAT_WITH_TIMESTAMP, logs.create_log_formatter(logs.LOG_FORMAT_WITH_TIMESTAMP)),
+    ("json lines", logs.create_log_formatter(json_lines=True)),
+  ]
+  for name, formatter in formatters:
+    records = create_records(args.records)
+    handler = logging.StreamHandler(io.StringIO())
+    handler.setFormatter(formatter)
+
+    start_time = time.perf_counter()
+    for record in records:
+      handler.handle(record)
+    elapsed = time.perf_counter() - start_time
+
+    logging.info("%-45s records=%s elapsed=%.3fs records/s=%.0f", name, len(records), elapsed, len(records) / elapsed)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+import argparse
+import logging
+import re
+import time
+from typing import Dict, Iterator, List
+
+from ltpylib import sqlite_helper
+
+
+def iter_wide_rows(row_count: int, col_count: int) -> Iterator[Dict[str, object]]:
+  col_names: List[str] = [f"col_{idx}" for idx in range(col_count)]
+  for row_num in range(row_count):
+    row = {}
+    for idx, col_name in enumerate(col_names):
+      if (row_num + idx) % 50 == 0:
+        continue
+
+      kind = idx % 4
+      if kind == 0:
+        row[col_name] = row_num
+      elif kind == 1:
+        row[col_name] = row_num / 3.0
+      elif kind == 2:
+        row[col_name] = "value"
+      else:
+        row[col_name] = row_num if row_num % 1000 else "widened"
+
+    yield row
+
+
+def main():
+  logging.basicConfig(level=logging.INFO, format="%(message)s")
+  arg_parser = argparse.ArgumentParser()
+  arg_parser.add_argument("--rows", type=int, default=1_000_000)
+  arg_parser.add_argument("--cols", type=int, default=200)
+  args = arg_parser.parse_args()
+
+  start_time = time.perf_counter()
+  cols = sqlite_helper.add_sqlite_columns_from_dicts(
+    iter_wide_rows(args.rows, args.cols),
+    [],
+    ignore_cols=[re.compile(r"ignored_.*"), re.compile(r"skip_.*")],
+  )
+  logging.info("add_sqlite_columns_from_dicts rows=%s cols=%s elapsed=%.3fs", args.rows, len(cols), time.perf_counter() - start_time)
+
+
+if __name__ == "__main__":
+  main()
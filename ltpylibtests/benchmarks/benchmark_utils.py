@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+import copy
+import logging
+import time
+from typing import Any, Callable, Dict, List
+
+
+def create_jira_issue_payload(issue_num: int, depth: int = 4) -> dict:
+  changelog_item = {
+    "field": "status",
+    "fieldtype": "jira",
+    "fromString": "In Progress",
+    "toString": "Done",
+    "isSubtaskCheck": False,
+  }
+  nested: dict = {"self": f"https://jira.example.com/rest/api/2/issue/{issue_num}", "isLeaf": True}
+  for level in range(depth):
+    nested = {
+      "nestedLevel": str(level),
+      "displayName": "Level %s" % level,
+      "childValue": nested,
+      "childValues": [nested, "plain", str(level)],
+    }
+
+  return {
+    "expand": "renderedFields,names,schema",
+    "id": str(10000 + issue_num),
+    "key": f"PROJ-{issue_num}",
+    "fields": {
+      "summary": f"Issue summary {issue_num}",
+      "customField_10001": "3.5",
+      "isFlagged": issue_num % 2 == 0,
+      "storyPoints": str(issue_num % 13),
+      "assignee": {
+        "displayName": "Some User",
+        "emailAddress": "some.user@example.com",
+        "active": True,
+        "timeZone": "America/New_York",
+      },
+      "labels": ["backend", "perf"],
+      "components": [{
+        "id": "1",
+        "name": "api",
+      }, {
+        "id": "2",
+        "name": "db",
+      }],
+      "nestedObject": nested,
+    },
+    "changelog": {
+      "histories": [{
+        "id": str(idx),
+        "created": "2020-01-01T00:00:00.000+0000",
+        "items": [copy.deepcopy(changelog_item) for _ in range(3)],
+      } for idx in range(5)],
+    },
+  }
+
+
+def create_stash_pull_request_payload(pr_num: int) -> dict:
+  reviewers = []
+  for idx in range(4):
+    reviewers.append({
+      "approved": idx % 2 == 0,
+      "lastReviewedCommit": "abcdef",
+      "user": {
+        "displayName": f"Reviewer {idx}",
+        "emailAddress": "reviewer@example.com",
+        "active": True,
+      },
+    })
+
+  return {
+    "id": pr_num,
+    "version": str(pr_num % 7),
+    "title": f"Pull request {pr_num}",
+    "open": True,
+    "closed": False,
+    "fromRef": {
+      "displayId": "feature/branch",
+      "latestCommit": "abcdef0123456789",
+      "repository": {
+        "slug": "repo",
+        "project": {
+          "key": "PROJ",
+          "isPublic": False,
+        },
+      },
+    },
+    "reviewers": reviewers,
+  }
+
+
+def create_payloads(count: int = 500) -> List[dict]:
+  return [create_jira_issue_payload(num) for num in range(count)] + [create_stash_pull_request_payload(num) for num in range(count)]
+
+
+def create_csv_rows(count: int = 100_000) -> List[Dict[str, str]]:
+  rows = []
+  for num in range(count):
+    rows.append({
+      "id": str(num),
+      "key": f"PROJ-{num}",
+      "points": str(num % 13),
+      "ratio": "%.3f" % (num / 7.0),
+      "amount": "{:,}".format(num * 1000),
+      "is_open": "true" if num % 2 else "false",
+      "summary": f"Issue summary {num}",
+      "empty": "",
+    })
+
+  return rows
+
+
+def run_benchmark(name: str, func: Callable[[Any], Any], create_input: Callable[[], Any], repeat: int = 5) -> float:
+  timings: List[float] = []
+  for _ in range(repeat):
+    input_data = create_input()
+    start_time = time.perf_counter()
+    func(input_data)
+    timings.append(time.perf_counter() - start_time)
+
+  best = min(timings)
+  logging.info("%-50s best=%.4fs avg=%.4fs", name, best, sum(timings) / len(timings))
+  return best
@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+
+from ltpylib import db_helper
+
+
+class FakeStreamingResult(object):
+
+  def __init__(self, keys, rows):
+    self._keys = keys
+    self._rows = list(rows)
+    self.fetch_sizes = []
+    self.closed = False
+
+  def keys(self):
+    return self._keys
+
+  def fetchmany(self, size):
+    self.fetch_sizes.append(size)
+    rows, self._rows = self._rows[:size], self._rows[size:]
+    return rows
+
+  def close(self):
+    self.closed = True
+
+
+def create_streaming_engine(result: FakeStreamingResult) -> mock.Mock:
+  engine = mock.MagicMock()
+  conn = engine.connect.return_value.__enter__.return_value
+  conn.execution_options.return_value.execute.return_value = result
+  return engine
+
+
+class TestDbHelper(unittest.TestCase):
+
+  def test_sqlite_row_factory_as_dict(self):
+    db_conn = db_helper.create_sqlite_connection(":memory:")
+    db_conn.execute("CREATE TABLE test_table (id INTEGER, name TEXT)")
+    db_conn.executemany("INSERT INTO test_table VALUES (?, ?)", [(1, "a"), (2, "b")])
+
+    self.assertEqual(db_conn.execute("SELECT id, name FROM test_table ORDER BY id").fetchall(), [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}])
+    self.assertEqual(db_conn.execute("SELECT name AS other FROM test_table ORDER BY id").fetchall(), [{"other": "a"}, {"other": "b"}])
+
+    first_cursor = db_conn.execute("SELECT id FROM test_table ORDER BY id")
+    second_cursor = db_conn.execute("SELECT name FROM test_table ORDER BY id")
+    self.assertEqual([first_cursor.fetchone(), second_cursor.fetchone(), first_cursor.fetchone(), second_cursor.fetchone()], [{"id": 1}, {"name": "a"}, {"id": 2}, {"name": "b"}])
+    self.assertEqual(db_helper._SQLITE_ROW_FACTORY_COLUMNS[first_cursor][1], ("id",))
+    self.assertEqual(db_helper._SQLITE_ROW_FACTORY_COLUMNS[second_cursor][1], ("name",))
+
+  def test_sqlite_connection_pool(self):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      db_file = Path(tmp_dir).joinpath("test.db")
+      pool = db_helper.get_or_create_sqlite_pool(db_file)
+      self.assertIs(pool, db_helper.get_or_create_sqlite_pool(db_file.as_posix()))
+
+      db_conn = pool.get_connection()
+      self.assertIs(db_conn, pool.get_connection())
+      self.assertEqual(db_conn.execute("PRAGMA journal_mode").fetchone(), {"journal_mode": "wal"})
+
+      other_thread_conns = []
+      thread = threading.Thread(target=lambda: other_thread_conns.append(pool.get_connection()))
+      thread.start()
+      thread.join()
+      self.assertIsNot(other_thread_conns[0], db_conn)
+
+      # the dead thread's connection is closed once another connection is created
+      thread = threading.Thread(target=lambda: other_thread_conns.append(pool.get_connection()))
+      thread.start()
+      thread.join()
+      with self.assertRaises(sqlite3.ProgrammingError):
+        other_thread_conns[0].execute("SELECT 1")
+      self.assertEqual(len(pool._connections), 2)
+
+      self.assertIs(pool, db_helper.get_or_create_sqlite_pool(db_file, journal_mode=db_helper.SQLITE_POOL_DEFAULT_JOURNAL_MODE))
+      row_pool = db_helper.get_or_create_sqlite_pool(db_file, use_sqlite_row=True)
+      self.assertIsNot(pool, row_pool)
+      self.assertIsInstance(row_pool.get_connection().execute("SELECT 1 AS a").fetchone(), sqlite3.Row)
+
+      row_pool.close_all()
+      pool.close_all()
+      db_helper.SQLITE_POOLS.clear()
+
+  def test_pg_service_config_connection_key(self):
+    config = db_helper.PgServiceConfig(values={"host": "localhost", "port": "5432", "user": "user", "dbname": "db", "password": "secret", "sslmode": "require"})
+    connection_key = config.connection_key()
+
+    self.assertNotIn("secret", connection_key)
+    self.assertIn("user@localhost:5432/db", connection_key)
+    self.assertIn("sslmode=require", connection_key)
+    self.assertEqual(
+      connection_key,
+      db_helper.PgServiceConfig(values={
+        "host": "localhost", "port": "5432", "user": "user", "dbname": "db", "password": "secret", "sslmode": "require"
+      }).connection_key()
+    )
+    self.assertNotEqual(
+      connection_key,
+      db_helper.PgServiceConfig(values={
+        "host": "localhost", "port": "5432", "user": "user", "dbname": "db", "password": "other", "sslmode": "require"
+      }).connection_key()
+    )
+
+  def test_get_or_create_pg_engine(self):
+    config = db_helper.PgServiceConfig(values={"host": "localhost", "user": "user", "dbname": "db"})
+    with mock.patch.object(db_helper, "create_pg_engine", side_effect=lambda *args, **kwargs: object()) as create_pg_engine:
+      threads = [threading.Thread(target=db_helper.get_or_create_pg_engine, args=(config,)) for _ in range(10)]
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+
+      engine = db_helper.get_or_create_pg_engine(config)
+      self.assertIs(engine, db_helper.get_or_create_pg_engine(db_helper.PgServiceConfig(values={"host": "localhost", "user": "user", "dbname": "db"})))
+      self.assertEqual(create_pg_engine.call_count, 1)
+
+      self.assertIsNot(engine, db_helper.get_or_create_pg_engine(config, engine_options=db_helper.PgEngineOptions(pool_size=20)))
+
+    db_helper.PG_ENGINES.clear()
+
+  def test_pg_run_queries_from_file(self):
+    sql = "-- first\nSELECT 1\n;\n\n-- second\nSELECT 2\n;\n\n-- broken\nSELECT x\n;\n"
+    barrier = threading.Barrier(3, timeout=5)
+
+    def execute(statement, *args, **kwargs):
+      barrier.wait()
+      if "x" in str(statement):
+        raise ValueError("broken query")
+
+      result = mock.Mock()
+      result.fetchall.return_value = [{"value": str(statement)}]
+      return result
+
+    engine = mock.Mock()
+    engine.execute.side_effect = execute
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      sql_file = Path(tmp_dir).joinpath("test.sql")
+      sql_file.write_text(sql)
+
+      with mock.patch.object(db_helper, "get_or_create_pg_engine", return_value=engine), mock.patch.object(db_helper, "query_result_to_dicts", lambda result: result.fetchall()):
+        results = db_helper.pg_run_queries_from_file(sql_file, inject_env=False, config=db_helper.PgServiceConfig())
+
+        self.assertEqual(list(results.keys()), ["first", "second", "broken"])
+        self.assertEqual(results["first"].rows, [{"value": "SELECT 1\n;"}])
+        self.assertEqual(results["second"].sql, "SELECT 2\n;")
+        self.assertTrue(results["second"].succeeded)
+        self.assertIsInstance(results["broken"].error, ValueError)
+        self.assertGreater(results["broken"].elapsed, 0)
+
+        barrier.reset()
+        with self.assertRaises(ValueError):
+          db_helper.pg_run_queries_from_file(sql_file, inject_env=False, config=db_helper.PgServiceConfig(), raise_on_error=True)
+
+  def test_sql_file_index(self):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      sql_file = Path(tmp_dir).joinpath("test.sql")
+      sql_file.write_text("-- first\nSELECT '$TEST_SQL_VAR'\n;\n\n-- second\nSELECT '${TEST_SQL_VAR}', '$TEST_SQL_MISSING'\n;\n")
+
+      index = db_helper.SqlFileIndex.get(sql_file)
+      self.assertIs(index, db_helper.SqlFileIndex.get(sql_file))
+      self.assertEqual(index.query_ids, ["first", "second"])
+      self.assertEqual(db_helper.pull_query_ids_from_file(sql_file), ["first", "second"])
+
+      with mock.patch.dict(os.environ, {"TEST_SQL_VAR": "val"}):
+        self.assertEqual(db_helper.pull_sql_from_file("first", sql_file), "SELECT 'val'\n;")
+        self.assertEqual(db_helper.pull_sql_from_file(["first", "second"], sql_file), "SELECT 'val'\n;\nSELECT 'val', '$TEST_SQL_MISSING'\n;")
+        self.assertEqual(db_helper.pull_sql_from_file([], sql_file, inject_env=False), "SELECT '$TEST_SQL_VAR'\n;")
+
+      with self.assertRaises(Exception):
+        index.get_query("missing")
+
+      sql_file.write_text("-- third\nSELECT 3\n;\n")
+      os.utime(sql_file, ns=(0, 0))
+      self.assertEqual(db_helper.SqlFileIndex.get(sql_file).query_ids, ["third"])
+      self.assertEqual(db_helper.pull_sql_from_file("third", sql_file), "SELECT 3\n;")
+
+  def test_iter_pg_copy_lines(self):
+    rows = [
+      {
+        "id": 1,
+        "name": "tab\there\nnew \\ slash",
+        "flag": True,
+        "data": {
+          "a": 1
+        },
+        "blob": b"\x01",
+      },
+      {
+        "id": 2,
+        "name": "",
+      },
+    ]
+    self.assertEqual(
+      list(db_helper.iter_pg_copy_lines(rows, ["id", "name", "flag", "data", "blob"])),
+      [
+        '1\ttab\\there\\nnew \\\\ slash\t1\t{"a": 1}\t\\\\x01\n',
+        "2\t\t\\N\t\\N\t\\N\n",
+      ],
+    )
+
+  def test_pg_copy_from_dicts(self):
+    copied = []
+    cursor = mock.Mock()
+    cursor.copy_expert.side_effect = lambda sql, buffer: copied.append((sql, buffer.read()))
+    engine = mock.Mock()
+    engine.raw_connection.return_value.cursor.return_value = cursor
+
+    rows = [{"id": idx, "name": f"name{idx}", "ratio": idx / 2, "empty": None} for idx in range(5)]
+    with mock.patch.object(db_helper, "get_or_create_pg_engine", return_value=engine):
+      self.assertEqual(db_helper.pg_copy_from_dicts("test_table", iter(rows), config=db_helper.PgServiceConfig(), batch_size=2, create_table=True), 5)
+
+    cursor.execute.assert_called_once_with('CREATE TABLE IF NOT EXISTS test_table (\n  "id" BIGINT,\n  "name" TEXT,\n  "ratio" DOUBLE PRECISION,\n  "empty" TEXT\n)')
+    self.assertEqual([sql for sql, _ in copied], ['COPY test_table ("id", "name", "ratio", "empty") FROM STDIN'] * 3)
+    self.assertEqual("".join([data for _, data in copied]), "".join([f"{idx}\tname{idx}\t{idx / 2}\t\\N\n" for idx in range(5)]))
+    engine.raw_connection.return_value.commit.assert_called_once()
+
+  def test_pg_query_iter(self):
+    config = db_helper.PgServiceConfig()
+    result = FakeStreamingResult(["id", "name"], [(idx, f"name{idx}") for idx in range(5)])
+    engine = create_streaming_engine(result)
+    with mock.patch.object(db_helper, "get_or_create_pg_engine", return_value=engine):
+      self.assertEqual(list(db_helper.pg_query_iter("SELECT id, name FROM t", config=config, fetch_size=2)), [{"id": idx, "name": f"name{idx}"} for idx in range(5)])
+      self.assertEqual(result.fetch_sizes, [2, 2, 2, 2])
+      self.assertTrue(result.closed)
+      engine.connect.return_value.__enter__.return_value.execution_options.assert_called_once_with(stream_results=True, max_row_buffer=2)
+
+    result = FakeStreamingResult(["id"], [(idx,) for idx in range(3)])
+    with mock.patch.object(db_helper, "get_or_create_pg_engine", return_value=create_streaming_engine(result)):
+      self.assertEqual(list(db_helper.pg_query_iter("SELECT id FROM t", config=config, fetch_size=2, batches=True)), [[{"id": 0}, {"id": 1}], [{"id": 2}]])
+
+  def test_pg_query_to_csv(self):
+    import io
+
+    result = FakeStreamingResult(["id", "name"], [(1, "a"), (2, "b,c"), (3, None)])
+    with mock.patch.object(db_helper, "get_or_create_pg_engine", return_value=create_streaming_engine(result)):
+      output = io.StringIO()
+      self.assertEqual(db_helper.pg_query_to_csv("SELECT id, name FROM t", output, config=db_helper.PgServiceConfig(), fetch_size=2), 3)
+
+    self.assertEqual(output.getvalue().splitlines(), ["id,name", "1,a", '2,"b,c"', "3,"])
+    self.assertEqual(result.fetch_sizes, [2, 2, 2])
+
+    result = FakeStreamingResult(["id"], [(1,)])
+    with tempfile.TemporaryDirectory() as tmp_dir, mock.patch.object(db_helper, "get_or_create_pg_engine", return_value=create_streaming_engine(result)):
+      csv_file = Path(tmp_dir).joinpath("out.csv")
+      self.assertEqual(db_helper.pg_query_to_csv("SELECT id FROM t", csv_file, config=db_helper.PgServiceConfig(), sep="|", header=False), 1)
+      self.assertEqual(csv_file.read_bytes(), b"1\r\n")
+
+  def test_pg_query_to_sqlite(self):
+    import sqlite3
+
+    rows = [(idx, f"name{idx}", idx / 2 if idx else None, None) for idx in range(5)]
+    result = FakeStreamingResult(["id", "name", "ratio", "empty"], rows)
+    db_conn = sqlite3.connect(":memory:")
+    with mock.patch.object(db_helper, "get_or_create_pg_engine", return_value=create_streaming_engine(result)):
+      self.assertEqual(db_helper.pg_query_to_sqlite("SELECT * FROM t", db_conn, "copied", config=db_helper.PgServiceConfig(), fetch_size=2), 5)
+
+    table_info = db_conn.execute("PRAGMA table_info(copied)").fetchall()
+    self.assertEqual(sorted([(info[1], info[2], info[3]) for info in table_info]), [("empty", "TEXT", 0), ("id", "INTEGER", 0), ("name", "TEXT", 0), ("ratio", "REAL", 0)])
+    self.assertEqual(db_conn.execute("SELECT id, name, ratio, empty FROM copied ORDER BY id").fetchall(), rows)
+
+  def test_pg_query_cache(self):
+    self.assertEqual(db_helper.PgQueryCache.normalize_sql("SELECT  *\n  FROM t\n WHERE a = 'x  y' ;\n"), "SELECT * FROM t WHERE a = 'x  y'")
+
+    config = db_helper.PgServiceConfig(values={"host": "localhost", "dbname": "db"})
+    result = mock.Mock()
+    result.fetchall.return_value = [{"id": 1, "amount": Decimal("1.5")}]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      cache = db_helper.PgQueryCache(Path(tmp_dir).joinpath("cache.db"), max_bytes=1024)
+      with mock.patch.object(db_helper, "pg_query", return_value=result) as pg_query, mock.patch.object(db_helper, "query_result_to_dicts", lambda res: res.fetchall()):
+        self.assertEqual(db_helper.pg_query_to_dicts("SELECT * FROM t WHERE id = :id", config=config, query_cache=cache, id=1), [{"id": 1, "amount": Decimal("1.5")}])
+        self.assertEqual(db_helper.pg_query_to_dicts("SELECT *\nFROM t WHERE id = :id;", config=config, query_cache=cache, id=1), [{"id": 1, "amount": Decimal("1.5")}])
+        self.assertEqual(pg_query.call_count, 1)
+
+        db_helper.pg_query_to_dicts("SELECT * FROM t WHERE id = :id", config=config, query_cache=cache, id=2)
+        db_helper.pg_query_to_dicts("SELECT * FROM t WHERE id = :id", config=db_helper.PgServiceConfig(values={"host": "other"}), query_cache=cache, id=1)
+        self.assertEqual(pg_query.call_count, 3)
+
+        cache.ttl_seconds = -1
+        db_helper.pg_query_to_dicts("SELECT * FROM t WHERE id = :id", config=config, query_cache=cache, id=1)
+        self.assertEqual(pg_query.call_count, 4)
+
+      cache.ttl_seconds = 3600
+      for idx in range(50):
+        cache.put(str(idx), [{"id": idx, "value": "x" * 50}])
+
+      total_size = cache.get_connection().execute("SELECT SUM(size) AS total_size FROM pg_query_cache").fetchone()["total_size"]
+      self.assertLessEqual(total_size, 1024)
+      self.assertIsNone(cache.get("0"))
+      self.assertEqual(cache.get("49"), [{"id": 49, "value": "x" * 50}])
+
+      with cache.get_connection() as db_conn:
+        db_conn.execute("UPDATE pg_query_cache SET rows = ? WHERE cache_key = ?", (b"\x80\x04pickled", "49"))
+      self.assertIsNone(cache.get("49"))
+
+    with mock.patch.object(db_helper, "pg_query", return_value=result) as pg_query, mock.patch.object(db_helper, "query_result_to_dicts", lambda res: res.fetchall()):
+      db_helper.pg_query_to_dicts("SELECT * FROM t WHERE c = :cache", config=config, cache="bind value")
+      pg_query.assert_called_once_with("SELECT * FROM t WHERE c = :cache", config=config, cache="bind value")
+
+  def test_pg_query_cache_serialization(self):
+    import datetime
+    import uuid
+
+    rows = [
+      {
+        "amount": Decimal("1.50"),
+        "created": datetime.datetime(2024, 1, 2, 3, 4, 5, 6, tzinfo=datetime.timezone.utc),
+        "day": datetime.date(2024, 1, 2),
+        "at": datetime.time(3, 4, 5),
+        "duration": datetime.timedelta(days=1, seconds=1.5),
+        "id": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+        "data": memoryview(b"\x00\x01"),
+        "nested": {
+          "list": [1, "a", None, True]
+        },
+      },
+    ]
+    data = db_helper.PgQueryCache.dumps_rows(rows)
+    loaded = db_helper.PgQueryCache.loads_rows(data)
+    self.assertEqual(loaded, [dict(rows[0], data=b"\x00\x01")])
+    self.assertEqual(str(loaded[0]["amount"]), "1.50")
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+import unittest
+from decimal import Decimal
+
+from ltpylib import dicts
+
+
+class TestDicts(unittest.TestCase):
+
+  def test_convert_keys_to_snake_case(self):
+    data = {
+      "fieldOne": {
+        "innerField": [{
+          "deepField": 1
+        }, "value", [{
+          "listInList": 2
+        }]],
+      },
+      "mixedList": ["a", {
+        "afterString": 3
+      }],
+    }
+    expected = {
+      "field_one": {
+        "inner_field": [{
+          "deep_field": 1
+        }, "value", [{
+          "list_in_list": 2
+        }]],
+      },
+      "mixed_list": ["a", {
+        "after_string": 3
+      }],
+    }
+    self.assertEqual(dicts.convert_keys_to_snake_case(data, recursive=True), expected)
+
+    self.assertEqual(dicts.convert_keys_to_snake_case([{"fieldOne": {"innerField": 1}}]), [{"field_one": {"innerField": 1}}])
+
+  def test_convert_boolean_values_to_string(self):
+    data = [{"a": True, "b": [False, {"c": False}], "d": {"e": True}}]
+    self.assertEqual(dicts.convert_boolean_values_to_string(data), [{"a": "true", "b": [False, {"c": "false"}], "d": {"e": "true"}}])
+
+    data = {"a": True, "b": True, "d": {"a": False, "b": False}}
+    self.assertEqual(dicts.convert_boolean_values_to_string(data, only_fields=["a", "d"]), {"a": "true", "b": True, "d": {"a": "false", "b": False}})
+
+    data = {"a": True, "b": True}
+    self.assertEqual(dicts.convert_boolean_values_to_string(data, ignore_fields=["a"]), {"a": True, "b": "true"})
+
+  def test_convert_string_values_to_correct_type(self):
+    data = {"a": "1", "b": "1.5", "c": "true", "d": [1, {"e": "no"}], "f": "text"}
+    self.assertEqual(dicts.convert_string_values_to_correct_type(data, recursive=True), {"a": 1, "b": 1.5, "c": True, "d": [1, {"e": False}], "f": "text"})
+
+    self.assertEqual(dicts.convert_string_values_to_correct_type(["1", "yes", {"a": "2"}]), [1, True, {"a": 2}])
+    self.assertEqual(dicts.convert_string_values_to_correct_type([]), [])
+
+    self.assertEqual(dicts.convert_string_values_to_correct_type([{"a": "1"}, "2"]), [{"a": 1}, 2])
+    self.assertEqual(dicts.convert_string_values_to_correct_type(["2", {"a": "1", "b": {"c": "3"}}]), [2, {"a": 1, "b": {"c": "3"}}])
+    self.assertEqual(dicts.convert_string_values_to_correct_type(["2", {"b": {"c": "3"}}], recursive=True), [2, {"b": {"c": 3}}])
+
+  def test_transform_nested_dicts_mixed_lists(self):
+    self.assertEqual(dicts.convert_keys_to_snake_case([[{"aB": 1}], {"cD": [{"eF": 1}]}, "gH"]), [[{"aB": 1}], {"c_d": [{"eF": 1}]}, "gH"])
+    self.assertEqual(dicts.convert_keys_to_snake_case([[{"aB": 1}], {"cD": [{"eF": 1}]}, "gH"], recursive=True), [[{"a_b": 1}], {"c_d": [{"e_f": 1}]}, "gH"])
+    self.assertEqual(dicts.convert_boolean_values_to_string([True, {"a": True, "b": [{"c": True}]}], recursive=False), [True, {"a": "true", "b": [{"c": True}]}])
+
+  def test_convert_string_to_correct_type(self):
+    self.assertEqual(dicts.convert_string_to_correct_type("1,000"), 1000)
+    self.assertEqual(dicts.convert_string_to_correct_type("-1.5"), -1.5)
+    self.assertEqual(dicts.convert_string_to_correct_type("1.5", use_decimal=True), Decimal("1.5"))
+    self.assertEqual(dicts.convert_string_to_correct_type("Yes"), True)
+    self.assertEqual(dicts.convert_string_to_correct_type("n"), False)
+    self.assertEqual(dicts.convert_string_to_correct_type("1.2.3"), "1.2.3")
+    self.assertEqual(dicts.convert_string_to_correct_type("-"), "-")
+    self.assertEqual(dicts.convert_string_to_correct_type("true", convert_booleans=False), "true")
+    self.assertEqual(dicts.convert_string_to_correct_type("1", convert_numbers=False), "1")
+
+  def test_convert_string_values_to_correct_type_by_column(self):
+    rows = [
+      {
+        "int": "1",
+        "float": "1",
+        "bool": "true",
+        "text": "a",
+        "mixed": "1",
+        "commas": "1",
+      },
+      {
+        "int": "2",
+        "float": "2.5",
+        "bool": "no",
+        "text": "b",
+        "mixed": "yes",
+        "commas": "1,000",
+      },
+      {
+        "int": "",
+        "float": None,
+        "bool": "",
+        "text": "1",
+        "mixed": "x",
+      },
+    ]
+    self.assertEqual(
+      dicts.convert_string_values_to_correct_type_by_column(rows, sample_size=2),
+      [
+        {
+          "int": 1,
+          "float": 1.0,
+          "bool": True,
+          "text": "a",
+          "mixed": 1,
+          "commas": 1,
+        },
+        {
+          "int": 2,
+          "float": 2.5,
+          "bool": False,
+          "text": "b",
+          "mixed": True,
+          "commas": 1000,
+        },
+        {
+          "int": "",
+          "float": None,
+          "bool": "",
+          "text": "1",
+          "mixed": "x",
+        },
+      ],
+    )
+
+  def test_convert_string_column_to_correct_type_rejects_unsampled_values(self):
+    self.assertEqual(
+      dicts.convert_string_column_to_correct_type(["1", "2", "1_000", " 5", "-3"], sample_size=2),
+      [1, 2, "1_000", " 5", -3],
+    )
+    self.assertEqual(
+      dicts.convert_string_column_to_correct_type(["1.5", "2", "nan", "Infinity", "1e3", "-.5"], sample_size=2),
+      [1.5, 2, "nan", "Infinity", "1e3", -0.5],
+    )
+    self.assertEqual(
+      dicts.convert_string_column_to_correct_type(["1.5", "2", "nan", "3.25"], use_decimal=True, sample_size=2),
+      [Decimal("1.5"), 2, "nan", Decimal("3.25")],
+    )
+    self.assertEqual(dicts.convert_string_column_to_correct_type(["1.5", "2", "-3", ".5"], sample_size=2), [1.5, 2.0, -3.0, 0.5])
+
+
+if __name__ == '__main__':
+  unittest.main()
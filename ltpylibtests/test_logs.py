@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from ltpylib import logs, procs
+
+
+class TestLogs(unittest.TestCase):
+
+  def test_log_pipe(self):
+    with self.assertLogs(level=logging.INFO) as captured:
+      with logs.LogPipe(prefix="[pipe] ", name="pipe") as log_pipe:
+        procs.run([sys.executable, "-c", "print('a'); print('b'); print('c', end='')"], stdout=log_pipe, stderr=log_pipe)
+
+    self.assertEqual("\n".join([record.getMessage() for record in captured.records]), "[pipe] a\n[pipe] b\n[pipe] c")
+    self.assertEqual(set([record.log_source for record in captured.records]), {"pipe"})
+
+  def test_run_with_logging_output_shares_thread(self):
+    script = "import sys\nfor idx in range(200):\n  print('%s-%s' % (sys.argv[1], idx))"
+    with self.assertLogs(level=logging.INFO) as captured:
+      threads = [threading.Thread(target=procs.run_with_logging_output, args=([sys.executable, "-c", script, str(num)],), kwargs={"log_prefix": f"[{num}] "}) for num in range(8)]
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+
+    lines = "\n".join([record.getMessage() for record in captured.records]).splitlines()
+    for num in range(8):
+      self.assertEqual([line for line in lines if line.startswith(f"[{num}] ")], [f"[{num}] {num}-{idx}" for idx in range(200)])
+
+    self.assertEqual(len([thread for thread in threading.enumerate() if thread.name == "LogMultiplexer"]), 1)
+
+  @unittest.skipUnless(hasattr(os, "fork"), "requires os.fork")
+  def test_run_with_logging_output_after_fork(self):
+    procs.run_with_logging_output(["echo", "parent"])
+
+    pid = os.fork()
+    if pid == 0:
+      exit_code = 1
+      try:
+        logging.getLogger().setLevel(logging.WARNING)
+        result = procs.run_with_logging_output([sys.executable, "-c", "print('x' * 200 * 1024)"], timeout=10)
+        exit_code = 0 if result.returncode == 0 and logs.get_log_multiplexer().pid == os.getpid() else 2
+      finally:
+        os._exit(exit_code)
+
+    _, status = os.waitpid(pid, 0)
+    self.assertEqual(os.WEXITSTATUS(status), 0)
+
+  def test_init_logging_async_handlers(self):
+    root_handlers = logging.root.handlers
+    root_level = logging.root.level
+    logging.root.handlers = []
+    stdout = io.StringIO()
+    try:
+      with tempfile.TemporaryDirectory() as tmp_dir, mock.patch.object(sys, "stdout", stdout):
+        logs.init_logging(log_level=logging.DEBUG, log_format="{levelname} {message}", async_handlers=True)
+        self.assertIsInstance(logging.root.handlers[0], logs.LazyQueueHandler)
+
+        log_file = Path(tmp_dir).joinpath("test.log")
+        logs.add_file_logging(log_file)
+
+        mutable_arg = ["before"]
+        logging.debug("first %s %d", "arg", 1)
+        logging.info("mutable %s", mutable_arg)
+        mutable_arg[0] = "after"
+        for idx in range(1000):
+          logging.info("line %s", idx)
+
+        try:
+          raise ValueError("error")
+        except ValueError:
+          logging.exception("failed")
+
+        logs.stop_async_logging()
+
+        expected_start = "DEBUG first arg 1\nINFO mutable ['before']\nINFO line 0\n"
+        self.assertTrue(stdout.getvalue().startswith(expected_start))
+        self.assertIn("INFO line 999\nERROR failed\nTraceback", stdout.getvalue())
+        self.assertIn("ValueError: error", stdout.getvalue())
+        self.assertEqual(log_file.read_text(), stdout.getvalue())
+    finally:
+      logs.stop_async_logging()
+      for handler in logging.root.handlers:
+        handler.close()
+
+      logging.root.handlers = root_handlers
+      logging.root.setLevel(root_level)
+
+  def test_json_lines_formatter(self):
+    formatter = logs.JsonLinesFormatter(static_fields={"app": "test"})
+    record = logging.LogRecord("test.logger", logging.WARNING, __file__, 1, "value %s", ("a",), None)
+    record.created = 1600000000
+    record.msecs = 123.0
+    record.log_source = "cmd"
+
+    self.assertEqual(
+      json.loads(formatter.format(record)),
+      {
+        "timestamp": "2020-09-13T12:26:40.123Z",
+        "level": "WARNING",
+        "logger": "test.logger",
+        "message": "value a",
+        "app": "test",
+        "log_source": "cmd",
+      },
+    )
+
+    try:
+      raise ValueError("error")
+    except ValueError:
+      record = logging.LogRecord("test", logging.ERROR, __file__, 1, "failed", None, sys.exc_info())
+
+    formatted = formatter.format(record)
+    self.assertNotIn("\n", formatted)
+    self.assertIn("ValueError: error", json.loads(formatted)["exception"])
+    self.assertIsInstance(logs.create_log_formatter(logs.LOG_FORMAT_JSON), logs.JsonLinesFormatter)
+
+  def test_read_last_lines(self):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      log_file = Path(tmp_dir).joinpath("test.log")
+      log_file.write_text("".join([f"line {idx}\n" for idx in range(1000)]))
+      with open(log_file, "rb") as fh:
+        self.assertEqual(logs.read_last_lines(fh, 3, block_size=7), ["line 997", "line 998", "line 999"])
+        self.assertEqual(fh.tell(), log_file.stat().st_size)
+        self.assertEqual(len(logs.read_last_lines(fh, 5000, block_size=16)), 1000)
+
+      log_file.write_text("a\nb\npartial")
+      with open(log_file, "rb") as fh:
+        self.assertEqual(logs.read_last_lines(fh, 5), ["a", "b"])
+        self.assertEqual(fh.read(), b"partial")
+        self.assertEqual(logs.read_last_lines(fh, 2, include_partial_line=True), ["b", "partial"])
+        self.assertEqual(fh.read(), b"")
+
+  def test_tail_files(self):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      log_file = Path(tmp_dir).joinpath("test.log")
+      other_file = Path(tmp_dir).joinpath("other.log")
+      log_file.write_text("old 1\nold 2\nkeep 3\n")
+
+      stop_event = threading.Event()
+      lines = logs.tail_files([log_file, other_file], n_lines=2, regexes=["^keep", "^old 2$"], poll_interval=0.05, stop_event=stop_event)
+      self.assertEqual(next(lines), (log_file, "old 2"))
+      self.assertEqual(next(lines), (log_file, "keep 3"))
+
+      with open(log_file, "a") as fh:
+        fh.write("skip 4\nkeep 5\nkeep ")
+      self.assertEqual(next(lines), (log_file, "keep 5"))
+
+      with open(log_file, "a") as fh:
+        fh.write("6\n")
+      self.assertEqual(next(lines), (log_file, "keep 6"))
+
+      other_file.write_text("keep other\n")
+      self.assertEqual(next(lines), (other_file, "keep other"))
+
+      log_file.rename(Path(tmp_dir).joinpath("test.log.1"))
+      log_file.write_text("keep rotated\n")
+      self.assertEqual(next(lines), (log_file, "keep rotated"))
+
+      with open(log_file, "w") as fh:
+        fh.write("keep t\n")
+      self.assertEqual(next(lines), (log_file, "keep t"))
+
+      stop_event.set()
+      self.assertEqual(list(lines), [])
+
+      self.assertEqual(list(logs.tail_file(log_file, follow=False)), ["keep t"])
+
+      log_file.write_text("a\nb\nc")
+      self.assertEqual(list(logs.tail_file(log_file, follow=False)), ["a", "b", "c"])
+
+      stop_event = threading.Event()
+      lines = logs.tail_file(log_file, poll_interval=0.05, stop_event=stop_event)
+      self.assertEqual(next(lines), "a")
+      self.assertEqual(next(lines), "b")
+      stop_event.set()
+      self.assertEqual(list(lines), ["c"])
+
+  @unittest.skipUnless(sys.platform.startswith("linux"), "requires inotify")
+  def test_inotify_change_waiter_with_high_fds(self):
+    fds = [os.open(os.devnull, os.O_RDONLY) for _ in range(1100)]
+    try:
+      with tempfile.TemporaryDirectory() as tmp_dir:
+        waiter = logs.create_change_waiter([Path(tmp_dir).joinpath("test.log")])
+        try:
+          self.assertGreaterEqual(waiter.fd, 1024)
+          Path(tmp_dir).joinpath("test.log").write_text("x\n")
+          waiter.wait(5)
+          waiter.wait(0)
+        finally:
+          waiter.close()
+    finally:
+      for fd in fds:
+        os.close(fd)
+
+  def test_tail_log_file(self):
+    log_file = Path("test.log")
+    with mock.patch.object(logs, "tail_files", return_value=iter([(log_file, "line")])) as tail_files, mock.patch("builtins.print") as mock_print:
+      logs.tail_log_file(log_file)
+      tail_files.assert_called_once_with([log_file])
+      mock_print.assert_called_once_with("line", flush=True)
+
+    with mock.patch.object(logs, "tail_files", return_value=iter([])), mock.patch.object(logs.shutil, "which", return_value=None):
+      with self.assertLogs(level=logging.WARNING) as captured:
+        logs.tail_log_file(log_file, "-n", "5")
+
+    self.assertIn("ignoring multitail args: -n 5", captured.output[0])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+import io
+import json
+import re
+import unittest
+
+from ltpylib import output, strings
+
+TEST_DATA = {
+  "b": [1, 2.5, {
+    "x": None,
+    "y": True,
+    "z": False,
+  }],
+  "a": "quote \" and unicode é",
+  "e": {},
+  "f": [],
+}
+
+
+class TestOutput(unittest.TestCase):
+
+  def test_colorize_json_native(self):
+    colorized = output.colorize_json_native(TEST_DATA)
+    self.assertIn("\x1b[", colorized)
+    self.assertEqual(strings.strip_color_codes(colorized), json.dumps(TEST_DATA, sort_keys=True, indent=2))
+
+    colorized_compact = output.colorize_json_native(TEST_DATA, indent=None)
+    self.assertEqual(strings.strip_color_codes(colorized_compact), json.dumps(TEST_DATA, sort_keys=True, separators=(",", ":")))
+
+    self.assertEqual(strings.strip_color_codes(output.colorize_json_native(json.dumps(TEST_DATA))), json.dumps(TEST_DATA, sort_keys=True, indent=2))
+    self.assertEqual(strings.strip_color_codes(output.colorize_json_native(None)), "null")
+
+    json_lines = json.dumps(TEST_DATA) + "\n" + json.dumps([1, "a"]) + "\n\n"
+    self.assertEqual(
+      strings.strip_color_codes(output.colorize_json(json_lines)),
+      json.dumps(TEST_DATA, sort_keys=True, indent=2) + "\n" + json.dumps([1, "a"], indent=2),
+    )
+    self.assertEqual(list(output.iter_json_documents(' {"a": 1} [2]  3')), [{"a": 1}, [2], 3])
+    with self.assertRaises(json.JSONDecodeError):
+      output.colorize_json_native('{"a": 1} {')
+
+  def test_prettify_json_colorize(self):
+    self.assertEqual(strings.strip_color_codes(output.prettify_json(TEST_DATA, colorize=True)), output.prettify_json(TEST_DATA))
+    self.assertEqual(strings.strip_color_codes(output.prettify_json(TEST_DATA, colorize=True, compact=True)), output.prettify_json(TEST_DATA, compact=True))
+
+  def test_write_pretty_json(self):
+    for compact in [False, True]:
+      stream = io.StringIO()
+      output.write_pretty_json(TEST_DATA, stream=stream, compact=compact, chunk_size=8)
+      self.assertEqual(stream.getvalue(), output.prettify_json(TEST_DATA, compact=compact) + "\n")
+
+      stream = io.StringIO()
+      output.write_pretty_json(TEST_DATA, stream=stream, compact=compact, colorize=True, chunk_size=8)
+      self.assertEqual(strings.strip_color_codes(stream.getvalue()), output.prettify_json(TEST_DATA, compact=compact) + "\n")
+
+      stream = io.StringIO()
+      output.write_pretty_json(TEST_DATA, stream=stream, compact=compact, colorize=True, pygments_style="default", chunk_size=8)
+      self.assertEqual(re.sub(r"\x1b\[[0-9;]*m", "", stream.getvalue()), output.prettify_json(TEST_DATA, compact=compact) + "\n")
+
+  def test_write_pretty_yaml(self):
+    stream = io.StringIO()
+    output.write_pretty_yaml(TEST_DATA, stream=stream, chunk_size=8)
+    self.assertEqual(stream.getvalue(), output.prettify_yaml(TEST_DATA))
+
+  def test_chunked_stream_writer_transform_whole_lines(self):
+    chunks = []
+    stream = io.StringIO()
+    with output.ChunkedStreamWriter(stream, chunk_size=4, transform=lambda chunk: chunks.append(chunk) or chunk) as writer:
+      for part in ["ab", "c\nde", "f", "g\nh"]:
+        writer.write(part)
+
+    self.assertEqual(stream.getvalue(), "abc\ndefg\nh")
+    self.assertEqual(chunks, ["abc\n", "defg\n", "h"])
+
+  def test_chunked_stream_writer_transform_without_newlines(self):
+    chunks = []
+    stream = io.StringIO()
+    with output.ChunkedStreamWriter(stream, chunk_size=4, transform=lambda chunk: chunks.append(chunk) or chunk, max_line_size=8) as writer:
+      for part in ["ab", "cd", "ef", "gh", "ij", "k\nl"]:
+        writer.write(part)
+        if part == "gh":
+          self.assertEqual(stream.getvalue(), "abcdefgh")
+
+    self.assertEqual(stream.getvalue(), "abcdefghijk\nl")
+    self.assertEqual(chunks, ["abcdefgh", "ijk\n", "l"])
+
+
+if __name__ == '__main__':
+  unittest.main()
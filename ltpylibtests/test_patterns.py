@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+import re
+import unittest
+
+from ltpylib import patterns
+
+
+class TestPatterns(unittest.TestCase):
+
+  def test_combine_regexes(self):
+    combined = patterns.combine_regexes(["^a", re.compile("b$")])
+    self.assertEqual(combined.pattern, "(?:^a)|(?:b$)")
+    self.assertTrue(combined.search("xb"))
+    self.assertIsNone(patterns.combine_regexes([]))
+    self.assertIsNone(patterns.combine_regexes([re.compile("a", re.IGNORECASE), "b"]))
+    self.assertIsNone(patterns.combine_regexes([r"(a)\1", "b"]))
+
+  def test_combine_regexes_uncombinable(self):
+    self.assertIsNone(patterns.combine_regexes(["(?i)a", "(?i)b"]))
+    self.assertIsNone(patterns.combine_regexes(["(?P<name>a)", "(?P<name>b)"]))
+
+
+if __name__ == '__main__':
+  unittest.main()
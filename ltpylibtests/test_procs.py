@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from ltpylib import procs
+
+
+class TestProcs(unittest.TestCase):
+
+  def test_run_many(self):
+    lines = []
+    start_time = time.monotonic()
+    results = procs.run_many(
+      [
+        [sys.executable, "-c", "import time; time.sleep(0.5); print('one')"],
+        [sys.executable, "-c", "import sys, time; time.sleep(0.5); print('two'); print('err', file=sys.stderr); sys.exit(3)"],
+        [sys.executable, "-c", "print('a\\nb', end='')"],
+      ],
+      on_line=lambda cmd_idx, stream_name, line: lines.append((cmd_idx, stream_name, line)),
+    )
+    self.assertLess(time.monotonic() - start_time, 1.0)
+
+    self.assertEqual([result.returncode for result in results], [0, 3, 0])
+    self.assertEqual([result.stdout for result in results], ["one\n", "two\n", "a\nb"])
+    self.assertEqual(results[1].stderr, "err\n")
+    self.assertEqual(sorted(lines), [(0, "stdout", "one\n"), (1, "stderr", "err\n"), (1, "stdout", "two\n"), (2, "stdout", "a\n"), (2, "stdout", "b")])
+    for result in results:
+      self.assertFalse(result.timed_out)
+      self.assertGreater(result.wall_time, 0)
+      self.assertGreater(result.max_rss, 0)
+      self.assertIsNotNone(result.cpu_time)
+
+    with self.assertRaises(procs.CalledProcessErrorWithOutput):
+      procs.run_many([[sys.executable, "-c", "import sys; sys.exit(1)"]], check=True)
+
+  def test_run_many_timeout(self):
+    start_time = time.monotonic()
+    results = procs.run_many(
+      [
+        [sys.executable, "-c", "import time; time.sleep(10)"],
+        [sys.executable, "-c", "print('done')"],
+      ],
+      timeout=0.5,
+    )
+    self.assertLess(time.monotonic() - start_time, 5)
+    self.assertTrue(results[0].timed_out)
+    self.assertLess(results[0].returncode, 0)
+    self.assertFalse(results[1].timed_out)
+    self.assertEqual(results[1].stdout, "done\n")
+
+    results = procs.run_many([[sys.executable, "-c", "import time; time.sleep(10)"]] * 2, max_workers=1, total_timeout=0.5)
+    self.assertTrue(all([result.timed_out for result in results]))
+    self.assertIsNone(results[1].returncode)
+
+  def test_iter_output_lines(self):
+    script = "import sys\nfor idx in range(100000):\n  print(idx)\n  if idx % 1000 == 0: print('err', idx, file=sys.stderr)\nsys.exit(2)"
+    lines = procs.iter_output_lines([sys.executable, "-c", script], stderr_max_lines=3)
+    self.assertEqual(next(lines), "0")
+
+    count = 1
+    with self.assertRaises(procs.CalledProcessErrorWithOutput) as context:
+      for _ in lines:
+        count += 1
+
+    self.assertEqual(count, 100000)
+    self.assertEqual(context.exception.returncode, 2)
+    self.assertEqual(context.exception.stderr, "err 97000\nerr 98000\nerr 99000\n")
+
+    self.assertEqual(list(procs.iter_output_lines([sys.executable, "-c", "print('a'); print('b', end='')"], keep_newlines=True)), ["a\n", "b"])
+
+    lines = procs.iter_output_lines([sys.executable, "-c", "import time\nwhile True:\n  print('x', flush=True)\n  time.sleep(0.01)"])
+    self.assertEqual(next(lines), "x")
+    lines.close()
+
+    with self.assertRaises(subprocess.TimeoutExpired):
+      list(procs.iter_output_lines([sys.executable, "-c", "import time; time.sleep(10)"], timeout=0.5))
+
+  def test_run_with_logging_output_path_args(self):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      script = Path(tmp_dir).joinpath("script.py")
+      script.write_text("print('from path')")
+      with self.assertLogs(level=logging.INFO) as captured:
+        result = procs.run_with_logging_output([sys.executable, script])
+
+    self.assertEqual(result.returncode, 0)
+    self.assertEqual([record.getMessage() for record in captured.records], ["from path"])
+    self.assertEqual(captured.records[0].log_source, procs.create_cmd_debug_string([sys.executable, script.as_posix()]))
+
+  def test_get_procs_from_names(self):
+    marker = "ltpylib_test_marker_%s" % time.monotonic_ns()
+    with subprocess.Popen([sys.executable, "-c", "import time, sys; time.sleep(30)", marker]) as proc:
+      try:
+        matched = procs.get_procs_from_names([marker, marker + "_missing", marker[:-3] + r"\d{3}$"])
+        self.assertEqual([pid for pid, _ in matched[marker]], [proc.pid])
+        self.assertIn(marker, matched[marker][0][1])
+        self.assertEqual(matched[marker + "_missing"], [])
+        self.assertEqual(len(matched[marker[:-3] + r"\d{3}$"]), 1)
+
+        self.assertEqual(procs.get_procs_from_name(marker), matched[marker])
+      finally:
+        proc.kill()
+
+    proc.wait()
+    self.assertEqual(procs.get_procs_from_name(marker, max_age=60), matched[marker])
+    self.assertEqual(procs.get_procs_from_name(marker), [])
+
+  def test_await_termination(self):
+    quick = [subprocess.Popen([sys.executable, "-c", "import time; time.sleep(%s)" % (0.2 + idx * 0.1)]) for idx in range(3)]
+    start_time = time.monotonic()
+    self.assertTrue(procs.await_termination([proc.pid for proc in quick], timeout=10, sleep_time=5))
+    self.assertLess(time.monotonic() - start_time, 2)
+
+    gone, alive = procs.wait_for_pids([proc.pid for proc in quick], timeout=0)
+    self.assertEqual(alive, [])
+    for proc in quick:
+      proc.wait()
+
+    with subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"]) as slow:
+      start_time = time.monotonic()
+      self.assertFalse(procs.await_termination(slow.pid, timeout=0.3, sleep_time=0.1))
+      self.assertLess(time.monotonic() - start_time, 5)
+      self.assertLess(slow.wait(5), 0)
+
+    self.assertTrue(procs.await_termination(None))
+
+  @unittest.skipUnless(hasattr(os, "pidfd_open"), "requires pidfd_open")
+  def test_wait_for_pids_with_high_fds(self):
+    import resource
+
+    if resource.getrlimit(resource.RLIMIT_NOFILE)[0] < 1200:
+      self.skipTest("RLIMIT_NOFILE too low")
+
+    fds = [os.open(os.devnull, os.O_RDONLY) for _ in range(1100)]
+    try:
+      with subprocess.Popen([sys.executable, "-c", "import time; time.sleep(0.2)"]) as proc:
+        gone, alive = procs.wait_for_pids([proc.pid], timeout=10)
+        self.assertEqual((gone, alive), ([proc.pid], []))
+    finally:
+      for fd in fds:
+        os.close(fd)
+
+
+if __name__ == '__main__':
+  unittest.main()
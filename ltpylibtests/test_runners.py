@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+import logging
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import uuid
+from pathlib import Path
+
+from ltpylib import procs, runners
+
+
+def python_cmd(code: str):
+  return [sys.executable, "-c", code]
+
+
+class TestRunners(unittest.TestCase):
+
+  def test_create_build_steps(self):
+    steps = runners.create_build_steps([["a"], (["b"], {"universal_newlines": True, "cwd": "/tmp"}), runners.BuildStep("c", ["c"])])
+    self.assertEqual([(step.name, step.depends_on, step.popen_kwargs) for step in steps], [("step1", [], {}), ("step2", ["step1"], {"cwd": "/tmp"}), ("c", [], {})])
+
+    with self.assertRaises(ValueError):
+      runners.create_build_steps([runners.BuildStep("a", ["a"], depends_on=["missing"])])
+
+    with self.assertRaises(ValueError):
+      runners.run_build_steps(runners.create_build_steps([runners.BuildStep("a", ["a"], depends_on=["b"]), runners.BuildStep("b", ["b"], depends_on=["a"])]))
+
+    with self.assertLogs(level=logging.WARNING):
+      steps = runners.create_build_steps([(python_cmd("print('quiet')"), {"stdout": subprocess.DEVNULL, "stderr": subprocess.STDOUT, "cwd": "/tmp"})])
+    self.assertEqual(steps[0].popen_kwargs, {"cwd": "/tmp"})
+    self.assertEqual(runners.run_build_steps(steps)[0].status, runners.BUILD_STEP_STATUS_SUCCEEDED)
+
+    steps = runners.run_build_steps([runners.BuildStep("bad", ["true"], popen_kwargs={"unknown_kwarg": True}), runners.BuildStep("after", ["true"], depends_on=["bad"])])
+    self.assertEqual([step.status for step in steps], [runners.BUILD_STEP_STATUS_FAILED, runners.BUILD_STEP_STATUS_SKIPPED])
+
+  def test_run_dependency_graph_rejects_cycles_before_running(self):
+    ran = []
+    with self.assertRaises(ValueError) as context:
+      runners.run_dependency_graph({"deploy": [], "a": ["b"], "b": ["a"], "c": ["deploy"]}, lambda name: ran.append(name) or True)
+
+    self.assertEqual(ran, [])
+    self.assertIn("['a', 'b']", str(context.exception))
+
+  def test_build(self):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      log_file = Path(tmp_dir).joinpath("runner.log")
+      runner = runners.ProcessRunner(
+        "test",
+        ["true"],
+        build_cmds=[
+          runners.BuildStep("compile", python_cmd("import time; time.sleep(0.5); print('compiled')")),
+          runners.BuildStep("assets", python_cmd("import time; time.sleep(0.5); print('assets')")),
+          runners.BuildStep("package", python_cmd("print('packaged')"), depends_on=["compile", "assets"]),
+          runners.BuildStep("lint", python_cmd("import sys; print('lint error', file=sys.stderr); sys.exit(2)")),
+          runners.BuildStep("publish", python_cmd("print('published')"), depends_on=["lint", "package"]),
+        ],
+        log_file=log_file.as_posix(),
+      )
+
+      start_time = time.monotonic()
+      with self.assertRaises(procs.CalledProcessErrorWithOutput) as context:
+        runner.build()
+
+      self.assertLess(time.monotonic() - start_time, 0.95)
+      self.assertEqual(context.exception.returncode, 2)
+
+      log_lines = log_file.read_text().splitlines()
+      self.assertEqual(sorted(log_lines), ["[assets] assets", "[compile] compiled", "[lint] lint error", "[package] packaged"])
+      self.assertEqual(log_lines.index("[package] packaged"), 3)
+
+  def test_process_group_runner(self):
+    with socket.socket() as sock:
+      sock.bind(("127.0.0.1", 0))
+      port = sock.getsockname()[1]
+
+    server_code = "import socket, time; time.sleep(0.5); sock = socket.socket(); sock.bind(('127.0.0.1', %s)); sock.listen(); time.sleep(30)" % port
+    log_code = "import time; time.sleep(0.5); print('%s started', flush=True); time.sleep(30)"
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+      def create_runner(proc_id: str, code: str) -> runners.ProcessRunner:
+        return runners.ProcessRunner(
+          proc_id,
+          python_cmd(code),
+          log_file=Path(tmp_dir).joinpath(f"{proc_id}.log").as_posix(),
+          pid_file=Path(tmp_dir).joinpath(f"{proc_id}.pid").as_posix(),
+          status_loop_wait_time=5,
+        )
+
+      group = runners.ProcessGroupRunner(
+        [
+          create_runner("db", server_code),
+          create_runner("cache", log_code % "cache"),
+          create_runner("app", log_code % "app"),
+        ],
+        depends_on={"app": ["db", "cache"]},
+        readiness_checks={
+          "db": runners.ReadinessCheck(port=port, timeout=10),
+          "cache": runners.ReadinessCheck(log_regex="^cache started$", timeout=10),
+          "app": runners.ReadinessCheck(log_regex="app started", timeout=10),
+        },
+      )
+
+      try:
+        start_time = time.monotonic()
+        self.assertTrue(group.start())
+        self.assertLess(time.monotonic() - start_time, 1.9)
+        self.assertTrue(group.status())
+
+        self.assertTrue(group.stop())
+        self.assertFalse(group.status())
+      finally:
+        group.stop()
+
+  def test_process_group_runner_daemonizing_launcher(self):
+    marker_id = uuid.uuid4().hex
+    daemon_code = "import time; time.sleep(0.3); print('daemon started', flush=True); time.sleep(30)"
+    launcher_code = "import subprocess, sys; subprocess.Popen([sys.executable, '-c', %r, 'daemon' + '-%s'], start_new_session=True)" % (daemon_code, marker_id)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      daemon = runners.ProcessRunner(
+        "daemon",
+        python_cmd(launcher_code),
+        log_file=Path(tmp_dir).joinpath("daemon.log").as_posix(),
+        proc_name_matcher=f"daemon-{marker_id}$",
+        status_loop_wait_time=5,
+      )
+      app = runners.ProcessRunner(
+        "app",
+        python_cmd("import time; time.sleep(30)"),
+        log_file=Path(tmp_dir).joinpath("app.log").as_posix(),
+        pid_file=Path(tmp_dir).joinpath("app.pid").as_posix(),
+        status_loop_wait_time=5,
+      )
+      group = runners.ProcessGroupRunner(
+        [daemon, app],
+        depends_on={"app": ["daemon"]},
+        readiness_checks={"daemon": runners.ReadinessCheck(log_regex="daemon started", timeout=10)},
+      )
+
+      try:
+        self.assertTrue(group.start())
+        self.assertIsNotNone(daemon.get_proc_pid())
+        self.assertIsNotNone(app.get_proc_pid())
+      finally:
+        group.stop()
+
+      self.assertIsNone(daemon.get_proc_pid())
+
+    with self.assertRaises(ValueError):
+      runners.ProcessGroupRunner([app], depends_on={"app": ["missing"]})
+
+    with self.assertRaises(ValueError):
+      runners.ProcessGroupRunner([app], depends_on={"missing": ["app"]})
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+import re
+import sqlite3
+import unittest
+
+from ltpylib import sqlite_helper
+from ltpylib.sqlite_helper import SQLiteColumn
+
+TEST_ROWS = [
+  {
+    "id": 1,
+    "name": "first",
+    "score": 1.5,
+    "active": True,
+    "tags": ["a", "b"],
+  },
+  {
+    "id": 2,
+    "name": None,
+    "score": 2.5,
+    "active": False,
+    "extra field": "x",
+  },
+]
+
+
+class TestSqliteHelper(unittest.TestCase):
+
+  def test_sqlite_create_table_from_dicts_in_process(self):
+    db_conn = sqlite3.connect(":memory:")
+    result = sqlite_helper.sqlite_create_table_from_dicts(
+      "test_table",
+      TEST_ROWS,
+      primary_key=SQLiteColumn("id", "INTEGER"),
+      db=db_conn,
+    )
+
+    self.assertEqual(result.rows_loaded, 2)
+    self.assertEqual([col.name for col in result.columns], ["active", "extra field", "id", "name", "score", "tags"])
+    self.assertEqual(
+      db_conn.execute('SELECT active, "extra field", id, name, score, tags FROM test_table ORDER BY id').fetchall(),
+      [
+        ("TRUE", None, 1, "first", 1.5, '["a", "b"]'),
+        ("FALSE", "x", 2, None, 2.5, None),
+      ],
+    )
+    self.assertFalse(db_conn.in_transaction)
+
+  def test_sqlite_create_table_from_dicts_generator(self):
+    db_conn = sqlite3.connect(":memory:")
+    result = sqlite_helper.sqlite_create_table_from_dicts("generated", ({"a": idx} for idx in range(5)), db=db_conn)
+    self.assertEqual(result.rows_loaded, 5)
+    self.assertEqual(db_conn.execute("SELECT COUNT(*) FROM generated").fetchone()[0], 5)
+
+    primary_key = SQLiteColumn("a", "INTEGER")
+    result = sqlite_helper.sqlite_create_table_from_dicts("incremental", ({"a": idx, "b": str(idx)} for idx in range(5)), primary_key=primary_key, db=db_conn, incremental=True)
+    self.assertEqual(result.rows_loaded, 5)
+    self.assertEqual(db_conn.execute("SELECT COUNT(*) FROM incremental").fetchone()[0], 5)
+
+    cols, rows = sqlite_helper.add_sqlite_columns_from_dicts_sample(({"a": idx, "b": None if idx else "x"} for idx in range(5)), [], sample_size=2)
+    self.assertEqual([(col.name, col.value_type, col.has_nulls) for col in cols], [("a", "INTEGER", True), ("b", "TEXT", True)])
+    self.assertEqual([row["a"] for row in rows], list(range(5)))
+
+  def test_sqlite_load_table_from_dicts_streaming(self):
+    db_conn = sqlite3.connect(":memory:")
+    cols = [SQLiteColumn("id", "INTEGER"), SQLiteColumn("value", "TEXT", has_nulls=True)]
+    rows = ({"id": idx, "value": None if idx % 2 else str(idx)} for idx in range(1000))
+
+    self.assertEqual(sqlite_helper.sqlite_load_table_from_dicts(db_conn, "streamed", rows, cols), 1000)
+    self.assertEqual(db_conn.execute("SELECT COUNT(*) FROM streamed WHERE value IS NULL").fetchone()[0], 500)
+
+  def test_sqlite_load_table_from_dicts_blanks_to_null(self):
+    db_conn = sqlite3.connect(":memory:")
+    cols = [SQLiteColumn("id", "INTEGER"), SQLiteColumn("nullable", "TEXT", has_nulls=True), SQLiteColumn("required", "TEXT")]
+    sqlite_helper.sqlite_load_table_from_dicts(db_conn, "blanks", [{"id": 1, "nullable": "", "required": ""}, {"id": 2, "nullable": "x", "required": "y"}], cols)
+    self.assertEqual(db_conn.execute("SELECT id, nullable, required FROM blanks ORDER BY id").fetchall(), [(1, None, ""), (2, "x", "y")])
+
+  def test_sqlite_bulk_load_transaction_rejects_open_transaction(self):
+    db_conn = sqlite3.connect(":memory:")
+    db_conn.execute("CREATE TABLE pending (id INTEGER)")
+    db_conn.execute("INSERT INTO pending VALUES (1)")
+    self.assertTrue(db_conn.in_transaction)
+
+    with self.assertRaises(ValueError):
+      sqlite_helper.sqlite_load_table_from_dicts(db_conn, "other", [{"id": 1}], [SQLiteColumn("id", "INTEGER")])
+
+    self.assertTrue(db_conn.in_transaction)
+    db_conn.rollback()
+    self.assertEqual(db_conn.execute("SELECT COUNT(*) FROM pending").fetchone()[0], 0)
+
+  def test_sqlite_load_table_from_dicts_rolls_back_on_error(self):
+    db_conn = sqlite3.connect(":memory:")
+    cols = [SQLiteColumn("id", "INTEGER")]
+    sqlite_helper.sqlite_load_table_from_dicts(db_conn, "existing", [{"id": 1}], cols)
+
+    with self.assertRaises(sqlite3.IntegrityError):
+      sqlite_helper.sqlite_load_table_from_dicts(db_conn, "existing", [{"id": 2}, {"id": None}], cols)
+
+    self.assertEqual(db_conn.execute("SELECT id FROM existing").fetchall(), [(1,)])
+
+  def test_add_sqlite_columns_from_dicts(self):
+    rows = [
+      {
+        "int_to_real": 1,
+        "int_to_text": 1,
+        "int": 1,
+        "ignored_col": "x",
+        "attr_b": 1,
+        "attr_a": "x",
+      },
+      {
+        "int_to_real": 1.5,
+        "int_to_text": "x",
+        "int": None,
+        "late": 2,
+      },
+    ]
+    cols = sqlite_helper.add_sqlite_columns_from_dicts(rows, [], ignore_cols=[re.compile(r"ignored_.*")])
+    self.assertEqual(
+      [(col.name, col.value_type, col.has_nulls) for col in cols],
+      [
+        ("int", "INTEGER", True),
+        ("int_to_real", "REAL", False),
+        ("int_to_text", "TEXT", False),
+        ("late", "INTEGER", True),
+        ("attr_a", "TEXT", True),
+        ("attr_b", "INTEGER", True),
+      ],
+    )
+
+    cols = sqlite_helper.add_sqlite_columns_from_dicts(rows, [], only_cols=["int", "late"])
+    self.assertEqual([col.name for col in cols], ["int", "late"])
+
+  def test_sqlite_upsert_table_from_dicts(self):
+    db_conn = sqlite3.connect(":memory:")
+    primary_key = SQLiteColumn("id", "INTEGER")
+
+    result = sqlite_helper.sqlite_create_table_from_dicts("snapshots", [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}], primary_key=primary_key, db=db_conn, incremental=True)
+    self.assertEqual(result.rows_loaded, 2)
+
+    rows = [{"id": 1, "name": "a"}, {"id": 2, "name": "changed", "new_field": 1.5}, {"id": 3, "name": "c"}]
+    result = sqlite_helper.sqlite_create_table_from_dicts("snapshots", rows, primary_key=primary_key, db=db_conn, incremental=True)
+    self.assertEqual([col.name for col in result.added_columns], ["new_field"])
+    self.assertEqual(result.rows_loaded, 2)
+    self.assertEqual(
+      db_conn.execute("SELECT id, name, new_field FROM snapshots ORDER BY id").fetchall(),
+      [(1, "a", None), (2, "changed", 1.5), (3, "c", None)],
+    )
+
+    with self.assertRaises(ValueError):
+      sqlite_helper.sqlite_create_table_from_dicts("snapshots", rows, primary_key=primary_key, incremental=True)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -2,6 +2,7 @@
 import os
 import unittest
 from pathlib import Path
+from unittest import mock
 
 from ltpylib import strings
 from ltpylibtests import testing_utils
@@ -20,6 +21,24 @@ class TestStrings(unittest.TestCase):
         continue
 
       self.assertEqual(strings.to_snake_case(test_case.input), test_case.expected)
+      self.assertEqual(strings.to_snake_case_cached(test_case.input), test_case.expected)
+
+  def test_to_snake_case_cached(self):
+    strings.to_snake_case_cached.cache_clear()
+    for _ in range(3):
+      self.assertEqual(strings.to_snake_case_cached("someFieldName"), "some_field_name")
+
+    cache_info = strings.to_snake_case_cached.cache_info()
+    self.assertEqual(cache_info.misses, 1)
+    self.assertEqual(cache_info.hits, 2)
+
+  def test_expand_env_vars(self):
+    env = {"A": "1", "B_2": "two"}
+    for val in ["$A ${B_2} $MISSING ${MISSING} $ ${} $A$B_2 ${A}x $Ax \\$A", "no vars"]:
+      with mock.patch.dict(os.environ, env):
+        self.assertEqual(strings.expand_env_vars(val), os.path.expandvars(val))
+
+    self.assertEqual(strings.expand_env_vars("$A-${B_2}", env=env), "1-two")
 
 
 if __name__ == '__main__':